@@ -0,0 +1,278 @@
+# encoding: utf-8
+
+"""bench_dnszone
+
+Benchmarks of the common zone operations on generated zones of a given
+number of records, reporting the time and peak memory of each step as
+JSON so that results can be compared from one release to the next.
+
+Each size is run twice: once for the times, and once under tracemalloc for
+the peak memory, which would otherwise distort the times.
+
+Example::
+
+    $ python benchmarks/bench_dnszone.py --sizes 1000 100000 -o bench.json
+    $ python benchmarks/bench_dnszone.py --sizes 1000000 --no-memory
+    $ python benchmarks/bench_dnszone.py --generate big.zone --sizes 1000000
+"""
+
+__author__ = "Greg Hellings"
+__copyright__ = "(c) Greg Hellings 2019"
+__id__ = "$Id$"
+__url__ = "$URL$"
+__version__ = "1.0"
+
+
+# ---- Imports ----
+
+# - Python Modules -
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import tracemalloc
+from importlib.metadata import PackageNotFoundError, version
+from time import perf_counter, strftime
+
+import dns.version
+
+# Benchmark the dnszone of the checkout holding this script, whether or not
+# it, or another version, is installed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dnszone.dnszone import zone_from_file  # noqa: E402
+
+# ---- Constants ----
+
+DOMAIN = "example.com."
+SIZES = (1000, 100000, 1000000)
+
+# Share of the generated records of each type, roughly as in a zone of
+# hosts with a few mail servers, delegations and aliases
+TYPE_MIX = (
+    ("A", 0.55),
+    ("AAAA", 0.15),
+    ("CNAME", 0.12),
+    ("TXT", 0.10),
+    ("MX", 0.04),
+    ("NS", 0.04),
+)
+
+# Records added and deleted by the add/delete step
+CHANGES = 1000
+
+# Records added, and then deleted, by Zone.apply in the apply step
+APPLY_CHANGES = 10000
+
+STEPS = (
+    "load",
+    "names",
+    "records",
+    "add_delete",
+    "apply",
+    "save_in_place",
+    "save_full",
+)
+
+# ---- Module Functions ----
+
+
+def generate_zone(filename, records, domain=DOMAIN, seed=0):
+    """Write a zone of about `records` records to `filename`, with the
+    types mixed as TYPE_MIX.  The same `seed` gives the same zone.  Returns
+    the number of records written."""
+    rng = random.Random(seed)
+    types = [t for t, _ in TYPE_MIX]
+    weights = [w for _, w in TYPE_MIX]
+    written = 0
+    with open(filename, "w") as f:
+        f.write("$TTL 3600\n")
+        f.write(
+            "@ IN SOA ns1.%s hostmaster.%s 2019010101 7200 3600 1209600 3600\n"
+            % (domain, domain)
+        )
+        f.write("@ IN NS ns1.%s\n@ IN NS ns2.%s\n" % (domain, domain))
+        f.write("@ IN MX 10 mail.%s\n" % domain)
+        f.write("ns1 IN A 192.0.2.1\nns2 IN A 192.0.2.2\nmail IN A 192.0.2.3\n")
+        written += 7
+
+        host = 0
+        while written < records:
+            rectype = rng.choices(types, weights)[0]
+            name = "host%07d" % host
+            host += 1
+            if rectype == "A":
+                data = "10.%d.%d.%d" % (host >> 16 & 255, host >> 8 & 255, host & 255)
+            elif rectype == "AAAA":
+                data = "2001:db8::%x:%x" % (host >> 16, host & 0xFFFF)
+            elif rectype == "CNAME":
+                data = "host%07d.%s" % (rng.randrange(host), domain)
+            elif rectype == "TXT":
+                data = '"v=spf1 ip4:10.0.0.0/8 -all id=%d"' % host
+            elif rectype == "MX":
+                data = "%d mail.%s" % (rng.choice((10, 20)), domain)
+            else:
+                # A delegation, with its glue
+                name = "sub%07d" % host
+                f.write("%s IN NS ns.%s\n" % (name, name))
+                f.write("ns.%s IN A 192.0.2.%d\n" % (name, host % 250 + 4))
+                written += 2
+                continue
+            f.write("%s IN %s %s\n" % (name, rectype, data))
+            written += 1
+    return written
+
+
+def run_steps(filename):
+    """Run each of STEPS against a copy of the zone in `filename` and
+    yield `(step, func)`, `func` being the step ready to run."""
+    workdir = tempfile.mkdtemp()
+    try:
+        zonefile = os.path.join(workdir, "zone")
+        shutil.copy(filename, zonefile)
+        state = {}
+
+        def load():
+            state["zone"] = zone_from_file(DOMAIN, zonefile)
+
+        def names():
+            state["names"] = state["zone"].names
+
+        def records():
+            for name in state["names"].values():
+                for rectype in ("A", "AAAA", "MX"):
+                    name.records(rectype)
+
+        def add_delete():
+            names = list(state["names"].values())[:CHANGES]
+            for index, name in enumerate(names):
+                name.records("A", create=True).add("198.51.100.%d" % (index % 250))
+            for index, name in enumerate(names):
+                name.records("A").delete("198.51.100.%d" % (index % 250))
+            names[0].records("A", create=True).add("198.51.100.254")
+
+        def apply():
+            adds = [
+                ("add", "bulk%07d.%s" % (i, DOMAIN), "A", "198.51.100.%d" % (i % 250))
+                for i in range(APPLY_CHANGES)
+            ]
+            state["zone"].apply(adds)
+            state["zone"].apply([("delete",) + change[1:] for change in adds])
+
+        def save_in_place():
+            state["zone"].save(autoserial=True)
+
+        def save_full():
+            state["zone"].save(os.path.join(workdir, "full"))
+
+        steps = (load, names, records, add_delete, apply, save_in_place, save_full)
+        for step in steps:
+            yield step.__name__, step
+    finally:
+        shutil.rmtree(workdir)
+
+
+def measure(filename, memory=False):
+    """Run the steps against `filename` and return a dict of step to its
+    seconds, or with `memory` to its peak traced memory in bytes."""
+    results = {}
+    gc.collect()
+    for step, func in run_steps(filename):
+        if memory:
+            tracemalloc.start()
+            func()
+            results[step] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        else:
+            start = perf_counter()
+            func()
+            results[step] = perf_counter() - start
+    return results
+
+
+def environment():
+    """Describe what the benchmarks ran on."""
+    try:
+        dnszone_version = version("dnszone")
+    except PackageNotFoundError:
+        dnszone_version = "unknown"
+    return {
+        "dnszone": dnszone_version,
+        "dnspython": dns.version.version,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "timestamp": strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument(
+        "--sizes",
+        nargs="+",
+        type=int,
+        default=SIZES[:2],
+        help="zone sizes in records (default: %(default)s)",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--no-memory", action="store_true", help="skip the peak memory runs"
+    )
+    parser.add_argument("-o", "--output", help="write the JSON here, not stdout")
+    parser.add_argument(
+        "--generate",
+        metavar="FILENAME",
+        help="only write a zone of the first size to FILENAME",
+    )
+    args = parser.parse_args(argv)
+
+    if args.generate:
+        generate_zone(args.generate, args.sizes[0], seed=args.seed)
+        return 0
+
+    report = {"environment": environment(), "results": []}
+    workdir = tempfile.mkdtemp()
+    try:
+        for size in args.sizes:
+            filename = os.path.join(workdir, "zone%d" % size)
+            count = generate_zone(filename, size, seed=args.seed)
+            times = measure(filename)
+            peaks = {} if args.no_memory else measure(filename, memory=True)
+            for step in STEPS:
+                report["results"].append(
+                    {
+                        "records": count,
+                        "step": step,
+                        "seconds": round(times[step], 6),
+                        "peak_bytes": peaks.get(step),
+                    }
+                )
+            os.unlink(filename)
+            sys.stderr.write(
+                "%d records: %s; apply %d changes/s\n"
+                % (
+                    count,
+                    ", ".join("%s %.3fs" % (s, times[s]) for s in STEPS),
+                    2 * APPLY_CHANGES / times["apply"],
+                )
+            )
+    finally:
+        shutil.rmtree(workdir)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
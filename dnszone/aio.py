@@ -0,0 +1,203 @@
+# encoding: utf-8
+
+"""aio
+
+asyncio counterparts to loading, checking and reloading zones, so they
+can be driven from an event loop without blocking it.  Zone files are
+parsed in an executor and named-checkzone and rndc are run as asyncio
+subprocesses.  Zone.asave saves a zone the same way.
+
+Example::
+
+    >>> import asyncio
+    >>> from dnszone.aio import AsyncZoneCheck, AsyncZoneReload, aload_zone
+    >>> async def update(domain, filename):
+    ...     zone = await aload_zone(domain, filename)
+    ...     zone.names['foo.' + domain + '.'].records('A').add('10.0.0.9')
+    ...     await zone.asave(autoserial=True)
+    ...     if await AsyncZoneCheck().is_valid(domain, filename):
+    ...         await AsyncZoneReload().reload(domain)
+    ...
+    >>> asyncio.run(update('example.com', '/var/named/zones/example.com'))
+"""
+
+__author__ = "Greg Hellings"
+__copyright__ = "(c) Greg Hellings 2019"
+__id__ = "$Id$"
+__url__ = "$URL$"
+__version__ = "1.0"
+
+
+# ---- Imports ----
+
+# - Python Modules -
+import asyncio
+from time import monotonic
+
+from . import instrument
+from .dnszone import zone_from_file
+from .zone_check import CheckResult, ZoneCheck
+from .zone_reload import ZoneReload, ZoneReloadError
+
+# ---- Classes ----
+
+
+class AsyncZoneCheck(object):
+    """ZoneCheck for use with asyncio; takes the same arguments, which
+    make the ZoneCheck held as `checker`.  It is not itself a ZoneCheck,
+    as its methods are coroutines.
+
+    The coroutines share no state between calls, so any number may run at
+    once.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.checker = ZoneCheck(*args, **kwargs)
+
+    def get_checkzone(self):
+        return self.checker.checkzone
+
+    checkzone = property(get_checkzone)
+
+    def get_cache(self):
+        return self.checker.cache
+
+    cache = property(get_cache)
+
+    def get_engine(self):
+        return self.checker.engine
+
+    engine = property(get_engine)
+
+    async def is_valid(self, zonename, filename, bypass_cache=False):
+        """Return True if the zone file passes named-checkzone.  Use `check`
+        for the error text."""
+        result = await self.check(zonename, filename, bypass_cache=bypass_cache)
+        return result.valid
+
+    async def check(self, zonename, filename, bypass_cache=False):
+        """Check the syntax of a zone file and return a CheckResult, as
+        ZoneCheck.check."""
+        with instrument.operation(
+            "check", zone=zonename, filename=filename, engine=self.engine
+        ) as op:
+            result = await self._acheck(zonename, filename, bypass_cache, op)
+            op.set(valid=result.valid)
+        return result
+
+    async def _acheck(self, zonename, filename, bypass_cache, op):
+        loop = asyncio.get_running_loop()
+        start = monotonic()
+        # Hashing the file for the cache is blocking I/O
+        key, hit = await loop.run_in_executor(
+            None, self._lookup, zonename, filename, bypass_cache
+        )
+        if hit:
+            op.set(cached=True)
+            return CheckResult(zonename, filename, True, None, monotonic() - start)
+
+        if self.engine == "native":
+            error = await loop.run_in_executor(
+                None, self.checker._native_check, zonename, filename
+            )
+        else:
+            try:
+                proc = await asyncio.create_subprocess_exec(
+                    self.checkzone,
+                    zonename,
+                    filename,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.STDOUT,
+                )
+            except OSError as e:
+                return CheckResult(
+                    zonename, filename, False, str(e), monotonic() - start
+                )
+            output, _ = await proc.communicate()
+            op.set(returncode=proc.returncode)
+            error = None
+            if proc.returncode != 0:
+                error = output.decode("utf-8", "replace").strip() or "Bad syntax"
+
+        if error is None and key is not None:
+            await loop.run_in_executor(None, self.cache.store, key)
+        return CheckResult(
+            zonename, filename, error is None, error, monotonic() - start
+        )
+
+    async def check_many(self, pairs, workers=None, bypass_cache=False):
+        """Check many zone files at once, with up to `workers` checks
+        running at a time (by default no limit).  Returns a list of
+        CheckResult in the same order as `pairs`."""
+        limit = asyncio.Semaphore(workers) if workers else None
+
+        async def check(pair):
+            if limit is None:
+                return await self.check(*pair, bypass_cache=bypass_cache)
+            async with limit:
+                return await self.check(*pair, bypass_cache=bypass_cache)
+
+        return list(await asyncio.gather(*[check(pair) for pair in pairs]))
+
+    def _lookup(self, zonename, filename, bypass_cache):
+        """Return the cache key for a check and whether it has passed
+        before."""
+        key = self.checker._cache_key(zonename, filename, bypass_cache)
+        return key, key is not None and self.cache.lookup(key)
+
+
+class AsyncZoneReload(object):
+    """ZoneReload for use with asyncio; takes the same arguments, which
+    make the ZoneReload held as `reloader`.  It is not itself a
+    ZoneReload, as its methods are coroutines.
+
+    rndc is run as an asyncio subprocess.  With an rndc.RndcClient the
+    commands are sent from an executor thread; the client sends one
+    command at a time.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.reloader = ZoneReload(*args, **kwargs)
+
+    async def reload(self, zone):
+        """Ask named to perform a zone reload."""
+        with instrument.operation("reload", zone=zone) as op:
+            await self._rndc(op, "reload", zone)
+
+    async def reload_all(self):
+        """Ask named to reload every zone."""
+        with instrument.operation("reload_all") as op:
+            await self._rndc(op, "reload_all")
+
+    async def _rndc(self, op, command, *args):
+        reloader = self.reloader
+        if reloader.client is not None:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, reloader._call_client, command, *args)
+            return
+
+        proc = await asyncio.create_subprocess_exec(reloader.rndc, "reload", *args)
+        r = await proc.wait()
+        op.set(returncode=r)
+
+        if r != 0:
+            raise ZoneReloadError("rndc failed with return code %d" % r)
+
+
+# ---- Module Functions ----
+
+
+async def aload_zone(
+    domain, filename, types=None, under=None, cache=None, executor=None
+):
+    """Read a zone file and return the contents as a Zone object, as
+    zone_from_file, parsing it in `executor`.
+
+    By default the loop's default executor is used.  A
+    concurrent.futures.ProcessPoolExecutor may be given instead, to parse
+    several zones in parallel.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        executor, zone_from_file, domain, filename, types, under, cache
+    )
@@ -0,0 +1,507 @@
+# encoding: utf-8
+
+"""compact
+
+A zone which keeps its A and AAAA records in packed arrays instead of as
+dnspython objects, for host and reverse zones with millions of addresses.
+Each owner name is stored once and each address record takes 12 bytes
+(A) or 24 bytes (AAAA) plus its share of the owner's name; every other
+record is held as usual.
+
+Names and records are reached through light views, as with Zone, and the
+file is written straight from the arrays.  As addresses are kept packed,
+they are given, and written, in their canonical form, e.g. '::1' for an
+AAAA record read as '0000:0000:0000:0000:0000:0000:0000:0001', where Zone
+keeps the text of the file.  Anything else, e.g. diffing
+or validating, is done on a regular Zone made with `to_zone`.
+
+Example::
+
+    >>> from dnszone.compact import compact_zone_from_file
+    >>> z = compact_zone_from_file('example.com', '/var/named/zones/example.com')
+    >>> z.names['foo.example.com.'].records('A').items
+    ['10.0.0.1']
+    >>> z.names['foo.example.com.'].records('A').add('10.0.0.2')
+    >>> z.names['foo.example.com.'].records('MX').items
+    [(10, 'mail.example.com.')]
+    >>> z.save(autoserial=True)
+    >>> z.to_zone().validate()
+    []
+"""
+
+__author__ = "Greg Hellings"
+__copyright__ = "(c) Greg Hellings 2019"
+__id__ = "$Id$"
+__url__ = "$URL$"
+__version__ = "1.0"
+
+
+# ---- Imports ----
+
+# - Python Modules -
+import socket
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import Mapping
+from heapq import merge
+from itertools import repeat
+
+import dns.exception
+import dns.name
+import dns.node
+import dns.rdata
+import dns.rdataclass
+import dns.rdatatype
+import dns.zone
+from six import string_types
+
+from .dnszone import (
+    SOA,
+    Name,
+    RecordsError,
+    Zone,
+    ZoneError,
+    _atomic_write,
+    _next_serial,
+    soa_from_node,
+)
+from .zone_reader import ZoneReader
+
+# ---- Constants ----
+
+_FAMILIES = {"A": socket.AF_INET, "AAAA": socket.AF_INET6}
+
+# Unsorted records tolerated at the end of an address table before it is
+# sorted again; they are searched one by one
+_MAX_TAIL = 1024
+
+# ---- Classes ----
+
+
+class _AddressTable(object):
+    """The address records of one type, in parallel arrays of owner id,
+    address and TTL.
+
+    The records are kept sorted by owner id, except for those added since
+    the last sort, so an owner's records are found by bisection.  As ids
+    are given out in the order names are first read, a zone file's records
+    are usually already in order.
+    """
+
+    __slots__ = ("rectype", "owners", "high", "low", "ttls", "_sorted")
+
+    def __init__(self, rectype):
+        self.rectype = rectype
+        self.owners = array("I")
+        self.ttls = array("I")
+        if rectype == "A":
+            self.high = None
+            self.low = array("I")
+        else:
+            self.high = array("Q")
+            self.low = array("Q")
+        self._sorted = 0
+
+    def __len__(self):
+        return len(self.owners)
+
+    def append(self, owner, value, ttl):
+        owners = self.owners
+        in_order = self._sorted == len(owners) and (not owners or owners[-1] <= owner)
+        owners.append(owner)
+        self.ttls.append(ttl)
+        if self.high is None:
+            self.low.append(value)
+        else:
+            self.high.append(value >> 64)
+            self.low.append(value & 0xFFFFFFFFFFFFFFFF)
+        if in_order:
+            self._sorted += 1
+
+    def value(self, index):
+        if self.high is None:
+            return self.low[index]
+        return self.high[index] << 64 | self.low[index]
+
+    def text(self, index):
+        return _unpack(self.rectype, self.value(index))
+
+    def positions(self, owner):
+        """Return the indexes of the records of `owner`, in order."""
+        owners = self.owners
+        if len(owners) - self._sorted > _MAX_TAIL:
+            self.sort()
+        lo = bisect_left(owners, owner, 0, self._sorted)
+        hi = bisect_right(owners, owner, lo, self._sorted)
+        found = list(range(lo, hi))
+        for index in range(self._sorted, len(owners)):
+            if owners[index] == owner:
+                found.append(index)
+        return found
+
+    def remove(self, index):
+        del self.owners[index]
+        del self.ttls[index]
+        del self.low[index]
+        if self.high is not None:
+            del self.high[index]
+        if index < self._sorted:
+            self._sorted -= 1
+
+    def sort(self):
+        """Sort the records by owner, keeping each owner's in order, unless
+        none have been added since they were last sorted."""
+        owners = self.owners
+        if self._sorted < len(owners):
+            self._take(sorted(range(len(owners)), key=owners.__getitem__))
+
+    def dedupe(self):
+        """Sort the records and drop those repeating an address of the same
+        owner, as a zone file may list a record twice."""
+        self.sort()
+        owners = self.owners
+        keep = []
+        last = None
+        for index, owner in enumerate(owners):
+            if owner != last:
+                seen = set()
+                last = owner
+            value = self.value(index)
+            if value not in seen:
+                seen.add(value)
+                keep.append(index)
+        if len(keep) < len(owners):
+            self._take(keep)
+
+    def _take(self, order):
+        """Keep the records at the indexes `order`, in that order."""
+        for name in ("owners", "ttls", "low", "high"):
+            column = getattr(self, name)
+            if column is not None:
+                setattr(
+                    self, name, array(column.typecode, map(column.__getitem__, order))
+                )
+        self._sorted = len(order)
+
+
+class AddressRecords(object):
+    """The A or AAAA records of a name in a CompactZone, behaving as
+    Records, except that the items are in canonical form."""
+
+    __slots__ = ("type", "_zone", "_table", "_name")
+
+    def __init__(self, zone, rectype, name):
+        self.type = rectype
+        self._zone = zone
+        self._table = zone._tables[rectype]
+        self._name = name
+
+    def _positions(self):
+        owner = self._zone._owner_ids.get(self._name)
+        if owner is None:
+            return []
+        return self._table.positions(owner)
+
+    def __len__(self):
+        return len(self._positions())
+
+    def __iter__(self):
+        table = self._table
+        return iter([table.text(index) for index in self._positions()])
+
+    def get_items(self):
+        return list(self)
+
+    items = property(get_items)
+
+    def add(self, item):
+        value = _pack(self.type, item)
+        table = self._table
+        positions = self._positions()
+        for index in positions:
+            if table.value(index) == value:
+                return
+        if positions:
+            ttl = table.ttls[positions[0]]
+        else:
+            ttl = self._zone._default_ttl() or 0
+        table.append(self._zone._owner_id(self._name), value, ttl)
+        self._zone._dirty = True
+
+    def delete(self, item):
+        try:
+            value = _pack(self.type, item)
+        except RecordsError:
+            value = None
+        table = self._table
+        for index in self._positions():
+            if table.value(index) == value:
+                table.remove(index)
+                self._zone._dirty = True
+                return
+        raise RecordsError("No such item in record: %s" % item)
+
+
+class CompactName(object):
+    """A name in a CompactZone, behaving as Name."""
+
+    __slots__ = ("name", "_zone")
+
+    def __init__(self, zone, name):
+        self.name = name
+        self._zone = zone
+
+    def get_soa(self):
+        node = self._zone._rest.nodes.get(dns.name.from_text(self.name))
+        soa = soa_from_node(node) if node is not None else None
+        return SOA(soa) if soa is not None else None
+
+    soa = property(get_soa)
+
+    def records(self, rectype, create=False, ttl=None):
+        zone = self._zone
+        if rectype in _FAMILIES:
+            records = AddressRecords(zone, rectype, self.name)
+            if not create and not records._positions():
+                return None
+            return records
+
+        name = dns.name.from_text(self.name)
+        node = zone._rest.nodes.get(name)
+        if node is None:
+            if not create:
+                return None
+            node = zone._rest.nodes[name] = dns.node.Node()
+        return Name(self.name, node, zone._default_ttl()).records(rectype, create)
+
+
+class _NameMap(Mapping):
+    """The names of a CompactZone, as Zone.names."""
+
+    def __init__(self, zone):
+        self._zone = zone
+
+    def __getitem__(self, key):
+        zone = self._zone
+        if key not in zone._owner_ids:
+            try:
+                name = dns.name.from_text(key)
+            except dns.exception.DNSException:
+                raise KeyError(key)
+            if name not in zone._rest.nodes:
+                raise KeyError(key)
+        return CompactName(zone, key)
+
+    def __iter__(self):
+        zone = self._zone
+        seen = set()
+        for name in zone._rest.nodes:
+            key = str(name)
+            seen.add(key)
+            yield key
+        for key in zone._names_with_addresses():
+            if key not in seen:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class CompactZone(object):
+    """A DNS zone with its A and AAAA records held in packed arrays.
+
+    Only whole files may be loaded, and they are always written in full.
+    Record changes made through the views are kept; use `to_zone` for the
+    features of Zone which are not offered here.
+    """
+
+    def __init__(self, domain):
+        if not domain or not isinstance(domain, string_types):
+            raise ZoneError("Invalid domain")
+        if domain[-1] != ".":
+            domain = domain + "."
+        self.domain = domain
+        self.filename = None
+        self._rest = None
+        self._clear()
+
+    def _clear(self):
+        self._owners = []
+        self._owner_ids = {}
+        self._tables = {"A": _AddressTable("A"), "AAAA": _AddressTable("AAAA")}
+        self._dirty = False
+
+    def load_from_file(self, filename):
+        """Load the zone from the zone file `filename`."""
+        reader = ZoneReader(self.domain, filename)
+        rest = dns.zone.Zone(reader.origin, relativize=False)
+        nodes = rest.nodes
+        self._clear()
+        tables = {
+            dns.rdatatype.A: self._tables["A"],
+            dns.rdatatype.AAAA: self._tables["AAAA"],
+        }
+
+        last_name = None
+        owner = None
+        for name, ttl, rdtype, rd in reader:
+            table = tables.get(rdtype)
+            if table is not None:
+                if name is not last_name:
+                    owner = self._owner_id(str(name))
+                    last_name = name
+                table.append(owner, _pack(table.rectype, rd.address), ttl)
+                continue
+            node = nodes.get(name)
+            if node is None:
+                node = nodes[name] = rest.node_factory()
+            rds = node.find_rdataset(dns.rdataclass.IN, rdtype, rd.covers(), True)
+            rds.add(rd, ttl)
+        for table in self._tables.values():
+            table.dedupe()
+        self._rest = rest
+        self.filename = filename
+
+    def _owner_id(self, name):
+        owner = self._owner_ids.get(name)
+        if owner is None:
+            owner = self._owner_ids[name] = len(self._owners)
+            self._owners.append(name)
+        return owner
+
+    def _names_with_addresses(self):
+        owners = self._owners
+        ids = set()
+        for table in self._tables.values():
+            ids.update(table.owners)
+        return [owners[owner] for owner in sorted(ids)]
+
+    def _default_ttl(self):
+        node = self._rest.get_node(self.domain)
+        soa = soa_from_node(node) if node is not None else None
+        return soa.minimum if soa is not None else None
+
+    def get_root(self):
+        """Return the root name of the zone."""
+        if self._rest is None or self._rest.get_node(self.domain) is None:
+            return None
+        return CompactName(self, self.domain)
+
+    root = property(get_root)
+
+    def get_names(self):
+        """Return a read-only mapping of name to CompactName."""
+        if self._rest is None:
+            return None
+        return _NameMap(self)
+
+    names = property(get_names)
+
+    def get_dirty(self):
+        """Return True if address records or names have been changed since
+        the zone was loaded or last saved.  Changes to other records are
+        not tracked; `save` always writes the whole zone."""
+        return self._dirty
+
+    dirty = property(get_dirty)
+
+    def delete_name(self, name):
+        """Remove a name and all its records from the zone."""
+        name = dns.name.from_text(name)
+        if self._rest.nodes.pop(name, None) is not None:
+            self._dirty = True
+        owner = self._owner_ids.get(str(name))
+        if owner is not None:
+            for table in self._tables.values():
+                for index in reversed(table.positions(owner)):
+                    table.remove(index)
+                    self._dirty = True
+
+    def iter_addresses(self):
+        """Yield `(name, rectype, address)` for every A and AAAA record,
+        grouped by name, with a name's A records before its AAAA."""
+        owners = self._owners
+        columns = []
+        for rectype, table in sorted(self._tables.items()):
+            table.sort()
+            columns.append(zip(table.owners, repeat(rectype), range(len(table))))
+        for owner, rectype, index in merge(*columns):
+            yield owners[owner], rectype, self._tables[rectype].text(index)
+
+    def save(self, filename=None, autoserial=False):
+        """Write the zone to `filename`, by default the file it was read
+        from, replacing it atomically.  The serial is updated if
+        `autoserial` is True, as Zone.save."""
+        if autoserial:
+            soa = soa_from_node(self._rest[self.domain])
+            soa.serial = _next_serial(soa.serial)
+        _atomic_write(filename or self.filename, self._write)
+        if filename in (None, self.filename):
+            self._dirty = False
+        return True
+
+    def _write(self, out):
+        origin = self._rest.origin
+        nodes = self._rest.nodes
+        for name in sorted(nodes):
+            text = nodes[name].to_text(name, origin=origin, relativize=False)
+            out.write(text.encode("utf-8"))
+            out.write(b"\n")
+
+        owners = self._owners
+        lines = []
+        for rectype, table in sorted(self._tables.items()):
+            table.sort()
+            ttls = table.ttls
+            for index, owner in enumerate(table.owners):
+                lines.append(
+                    "%s %d IN %s %s\n"
+                    % (owners[owner], ttls[index], rectype, table.text(index))
+                )
+                if len(lines) >= 4096:
+                    out.write("".join(lines).encode("utf-8"))
+                    lines = []
+        out.write("".join(lines).encode("utf-8"))
+
+    def to_zone(self):
+        """Return the records as a regular Zone, with dnspython objects for
+        every record."""
+        zone = Zone(self.domain)
+        rest = dns.zone.Zone(self._rest.origin, relativize=False)
+        for name, node in self._rest.nodes.items():
+            copy = rest.nodes[name] = rest.node_factory()
+            copy.rdatasets = [rds.copy() for rds in node.rdatasets]
+        owners = self._owners
+        for rectype, table in sorted(self._tables.items()):
+            rdtype = dns.rdatatype.from_text(rectype)
+            for index, owner in enumerate(table.owners):
+                rd = dns.rdata.from_text(dns.rdataclass.IN, rdtype, table.text(index))
+                node = rest.get_node(owners[owner], create=True)
+                rds = node.find_rdataset(dns.rdataclass.IN, rdtype, create=True)
+                rds.add(rd, table.ttls[index])
+        zone._zone = rest
+        zone.filename = self.filename
+        return zone
+
+
+# ---- Module Functions ----
+
+
+def compact_zone_from_file(domain, filename):
+    """Read a zone file and return it as a CompactZone."""
+    zone = CompactZone(domain)
+    zone.load_from_file(filename)
+    return zone
+
+
+def _pack(rectype, text):
+    """Return the address `text` as an integer."""
+    try:
+        return int.from_bytes(socket.inet_pton(_FAMILIES[rectype], text), "big")
+    except (OSError, TypeError, ValueError):
+        raise RecordsError("Invalid %s address: %s" % (rectype, text))
+
+
+def _unpack(rectype, value):
+    size = 4 if rectype == "A" else 16
+    return socket.inet_ntop(_FAMILIES[rectype], value.to_bytes(size, "big"))
@@ -16,7 +16,18 @@ __version__ = "2.0.2"
 # ---- Imports ----
 
 # - Python Modules -
+import asyncio
+import copy
+import ipaddress
+import mmap
+import os
+import re
+import shutil
+import stat
+import tempfile
+from bisect import bisect_left, bisect_right
 from time import localtime, strftime, time
+from types import MappingProxyType
 
 from six import integer_types, next, string_types
 
@@ -29,12 +40,49 @@ except ImportError:
     sys.stderr.write("Requires dns module from http://www.dnspython.org/\n")
     sys.exit(1)
 
+import dns.exception
+import dns.ipv6
+import dns.node
 import dns.rdtypes.ANY.CNAME
 import dns.rdtypes.ANY.MX
 import dns.rdtypes.ANY.NS
 import dns.rdtypes.ANY.TXT
 import dns.rdtypes.IN.A
 import dns.rdtypes.IN.AAAA
+import dns.reversename
+
+from . import instrument
+from .zone_cache import dumps_zone, loads_zone
+from .zone_reader import ZoneReader
+from .zone_validate import validate_zone
+
+# ---- Constants ----
+
+# Record type names to their codes, e.g. 'MX' -> 15
+_RDTYPES = dict(dns.rdatatype._by_text)
+
+_ADDRESS_TYPES = (dns.rdatatype.A, dns.rdatatype.AAAA)
+
+# Temporary files the records of each zone are spread over when diff_files
+# is given files whose names are not in sorted order
+_DIFF_BUCKETS = 64
+
+# Sorts after every label of a name (at most 63 bytes), to end the range of
+# a subtree in the subtree index
+_LAST_LABEL = (b"\xff" * 64,)
+
+# Record types in the reverse index, and the rdata attribute holding the
+# target name; None for addresses
+_REVERSE_TYPES = {
+    dns.rdatatype.A: None,
+    dns.rdatatype.AAAA: None,
+    dns.rdatatype.NS: "target",
+    dns.rdatatype.CNAME: "target",
+    dns.rdatatype.DNAME: "target",
+    dns.rdatatype.PTR: "target",
+    dns.rdatatype.SRV: "target",
+    dns.rdatatype.MX: "exchange",
+}
 
 # ---- Exceptions ----
 
@@ -51,21 +99,38 @@ class RecordsError(Exception):
     """An error from dnszone.Records"""
 
 
+class _UnsortedError(ZoneError):
+    """A zone file's names are not in sorted order."""
+
+
 # ---- Classes ----
 
 
 class SOA(object):
     """Represents the SOA fields of the root node of a Zone."""
 
-    def __init__(self, soa):
+    __slots__ = ("_soa", "_owner")
+
+    def __init__(self, soa, owner=None):
         self._soa = soa
+        self._owner = owner
+
+    def _changed(self):
+        if self._owner is not None:
+            self._owner._changed()
+
+    def _writable(self):
+        if self._owner is not None:
+            self._owner._writable()
 
     def get_mname(self):
         return str(self._soa.mname)
 
     def set_mname(self, value):
+        self._writable()
         name = dns.name.Name(value.split("."))
         self._soa.mname = name
+        self._changed()
 
     mname = property(get_mname, set_mname)
 
@@ -73,8 +138,10 @@ class SOA(object):
         return str(self._soa.rname)
 
     def set_rname(self, value):
+        self._writable()
         name = dns.name.Name(value.split("."))
         self._soa.rname = name
+        self._changed()
 
     rname = property(get_rname, set_rname)
 
@@ -82,7 +149,9 @@ class SOA(object):
         return self._soa.serial
 
     def set_serial(self, value):
+        self._writable()
         self._soa.serial = value
+        self._changed()
 
     serial = property(get_serial, set_serial)
 
@@ -90,7 +159,9 @@ class SOA(object):
         return self._soa.refresh
 
     def set_refresh(self, value):
+        self._writable()
         self._soa.refresh = value
+        self._changed()
 
     refresh = property(get_refresh, set_refresh)
 
@@ -98,7 +169,9 @@ class SOA(object):
         return self._soa.retry
 
     def set_retry(self, value):
+        self._writable()
         self._soa.retry = value
+        self._changed()
 
     retry = property(get_retry, set_retry)
 
@@ -106,7 +179,9 @@ class SOA(object):
         return self._soa.expire
 
     def set_expire(self, value):
+        self._writable()
         self._soa.expire = value
+        self._changed()
 
     expire = property(get_expire, set_expire)
 
@@ -114,60 +189,196 @@ class SOA(object):
         return self._soa.minimum
 
     def set_minttl(self, value):
+        self._writable()
         self._soa.minimum = value
+        self._changed()
 
     minttl = property(get_minttl, set_minttl)
 
 
+class _ItemSet(object):
+    """The items of an rdataset, in order, with constant time membership
+    tests, appends and removals.
+
+    Stands in for the list dnspython keeps them in, offering the list
+    operations its sets use.
+    """
+
+    __slots__ = ("_items",)
+
+    def __init__(self, items=()):
+        self._items = dict.fromkeys(items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __contains__(self, item):
+        return item in self._items
+
+    def __getitem__(self, index):
+        if index == 0 and self._items:
+            return next(iter(self._items))
+        return list(self._items)[index]
+
+    def __delitem__(self, index):
+        items = list(self._items)
+        doomed = items[index] if isinstance(index, slice) else [items[index]]
+        for item in doomed:
+            del self._items[item]
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "_ItemSet(%r)" % (list(self._items),)
+
+    def __getstate__(self):
+        return list(self._items)
+
+    def __setstate__(self, state):
+        self._items = dict.fromkeys(state)
+
+    def append(self, item):
+        self._items[item] = None
+
+    def extend(self, items):
+        self._items.update(dict.fromkeys(items))
+
+    def remove(self, item):
+        try:
+            del self._items[item]
+        except KeyError:
+            raise ValueError("item not in set")
+
+
 class Records(object):
     """Represents the records associated with a name node.
     Record items are common DNS types such as 'A', 'MX',
     'NS', etc.
+
+    Several iterations over a Records may run at once, but changing the
+    records during an iteration is not supported; iterate over `items`, a
+    list of the items as they are at that moment, to do that.
+
+    Once changed through a Records, the rdataset's items are held in an
+    _ItemSet, so each item is added, found or deleted in constant time.
     """
 
-    def __init__(self, rectype, rdataset):
+    __slots__ = ("type", "_rdataset", "_owner")
+
+    def __init__(self, rectype, rdataset, owner=None):
         self.type = rectype
         self._rdataset = rdataset
+        self._owner = owner
+
+    def _changed(self):
+        if self._owner is not None:
+            self._owner._changed()
+
+    def _writable(self):
+        if self._owner is not None:
+            self._owner._writable()
+
+    def _indexed(self, rdatas, count):
+        zone = self._owner._zone if self._owner is not None else None
+        if rdatas and zone is not None and zone._reverse is not None:
+            zone._reindex(self._owner.name, self._rdataset.rdtype, rdatas, count)
+
+    def _item_set(self):
+        """Return the rdataset's items as an _ItemSet, in place of the list
+        dnspython keeps them in."""
+        items = self._rdataset.items
+        if type(items) is not _ItemSet:
+            items = self._rdataset.items = _ItemSet(items)
+        return items
+
+    def _convert(self, items):
+        """Check and convert `items` to rdatas, before any are used."""
+        rectype = self.type
+        return [_new_rdata(rectype, _check_item(rectype, item)) for item in items]
 
     def add(self, item):
-        if self.type == "MX":
-            assert isinstance(item, tuple)
-            assert len(item) == 2
-            assert isinstance(item[0], integer_types)
-            assert isinstance(item[1], string_types)
-        elif self.type == "TXT":
-            assert isinstance(item, string_types)
-            if item.startswith('"') and item.endswith('"'):
-                # dns module auto-adds quotation marks
-                item = item[1:-1]
-        else:
-            assert isinstance(item, string_types)
-
-        rd = _new_rdata(self.type, item)
-        self._rdataset.add(rd)
+        self.add_many([item])
+
+    def add_many(self, items):
+        """Add each of `items`, skipping those already present.  Every item
+        is checked before any is added."""
+        rdatas = self._convert(items)
+        self._writable()
+        if rdatas and dns.rdatatype.is_singleton(self._rdataset.rdtype):
+            # As with dnspython, e.g. a CNAME replaces the one there
+            self._replace(rdatas[-1:])
+            return
+        members = self._item_set()
+        added = [rd for rd in dict.fromkeys(rdatas) if rd not in members]
+        if added:
+            members.extend(added)
+            self._indexed(added, 1)
+            self._changed()
 
     def delete(self, item):
-        rd = _new_rdata(self.type, item)
-        try:
-            self._rdataset.remove(rd)
-        except ValueError:
-            raise RecordsError("No such item in record: %s" % item)
+        self.delete_many([item])
+
+    def delete_many(self, items):
+        """Delete each of `items`.  If any is not present a RecordsError is
+        raised and nothing is deleted."""
+        items = list(items)
+        rdatas = self._convert(items)
+        self._writable()
+        members = self._item_set()
+        for item, rd in zip(items, rdatas):
+            if rd not in members:
+                raise RecordsError("No such item in record: %s" % (item,))
+        doomed = dict.fromkeys(rdatas)
+        if doomed:
+            for rd in doomed:
+                members.remove(rd)
+            self._indexed(list(doomed), -1)
+            self._changed()
+
+    def replace(self, items):
+        """Make `items` the only items of the record.  Items already present
+        are left as they are; only the difference is added and deleted.  A
+        type which may only have one record, such as CNAME, keeps the last
+        of `items`."""
+        rdatas = self._convert(items)
+        if dns.rdatatype.is_singleton(self._rdataset.rdtype):
+            rdatas = rdatas[-1:]
+        self._replace(rdatas)
+
+    def _replace(self, rdatas):
+        self._writable()
+        members = self._item_set()
+        wanted = dict.fromkeys(rdatas)
+        removed = [rd for rd in members if rd not in wanted]
+        added = [rd for rd in wanted if rd not in members]
+        if not removed and not added:
+            return
+        for rd in removed:
+            members.remove(rd)
+        members.extend(added)
+        self._indexed(removed, -1)
+        self._indexed(added, 1)
+        self._changed()
 
     def __iter__(self):
-        self._item_iter = iter(self._rdataset.items)
-        return self
-
-    def next(self):
-        if self.type == "MX":
-            r = next(self._item_iter)
-            return (r.preference, str(r.exchange))
-        else:
-            return str(next(self._item_iter))
+        rectype = self.type
+        return (_item_from_rdata(rectype, rd) for rd in self._rdataset.items)
 
-    __next__ = next
+    def __len__(self):
+        return len(self._rdataset)
 
     def get_items(self):
-        return [r for r in self]
+        rectype = self.type
+        return [_item_from_rdata(rectype, rd) for rd in self._rdataset.items]
 
     items = property(get_items)
 
@@ -185,48 +396,101 @@ class Name(object):
 
     If the node contains SOA fields (i.e. the  root ('@') node)
     then the `soa` attribute points to an SOA object.
+
+    The SOA and Records objects are made on first use and then reused.
     """
 
-    def __init__(self, name, node=None, ttl=None):
+    __slots__ = ("name", "ttl", "_node", "_zone", "_soa", "_records")
+
+    def __init__(self, name, node=None, ttl=None, zone=None):
         self.name = name
-        self.soa = None
         self.ttl = ttl
         self._node = node
+        self._zone = zone
+        self._soa = None
+        self._records = {}
+
+    def get_soa(self):
+        if self._node is None:
+            return None
+        soa = soa_from_node(self._node)
+        if soa is None:
+            return None
+        if self._soa is None or self._soa._soa is not soa:
+            self._soa = SOA(soa, self)
+        return self._soa
+
+    soa = property(get_soa)
 
-        if node:
-            soa = soa_from_node(node)
-            if soa:
-                self.soa = SOA(soa)
+    def _changed(self):
+        if self._zone is not None:
+            self._zone._changed(self.name)
+
+    def _writable(self):
+        """Make sure the node is not shared with a snapshot of the zone
+        before it is changed."""
+        zone = self._zone
+        if zone is not None and zone._owned is not None:
+            if id(self._node) not in zone._owned:
+                zone._own(self.name, self)
 
     def records(self, rectype, create=False, ttl=None):
-        typeval = dns.rdatatype._by_text.get(rectype, None)
+        """Return the Records of type `rectype`, or None if there are none.
+        With `create` they are made if missing, with the TTL `ttl`, by
+        default that of the name or else the zone's SOA minimum.
+
+        A snapshot's records are returned as they are; the default TTL is
+        only filled in for an rdataset without one in a zone which may be
+        changed.
+        """
+        typeval = _RDTYPES.get(rectype)
         if typeval is None:
             raise NameError("Invalid type: %s" % rectype)
 
-        r = self._node.get_rdataset(dns.rdataclass.IN, typeval, create=create)
+        r = self._node.get_rdataset(dns.rdataclass.IN, typeval)
+        if r is None and create:
+            self._writable()
+            r = self._node.get_rdataset(dns.rdataclass.IN, typeval, create=True)
+            if ttl is None:
+                ttl = self.ttl
+            if ttl is None and self._zone is not None:
+                ttl = self._zone._default_ttl()
+            if ttl:
+                r.update_ttl(ttl)
 
         if r is None:
             return None
 
-        if self.ttl and r.ttl == 0:
+        frozen = self._zone is not None and self._zone._frozen
+        if self.ttl and r.ttl == 0 and not frozen:
+            self._writable()
+            r = self._node.get_rdataset(dns.rdataclass.IN, typeval)
             r.update_ttl(self.ttl)
 
-        rec = Records(rectype, r)
+        rec = self._records.get(typeval)
+        if rec is None or rec._rdataset is not r:
+            rec = self._records[typeval] = Records(rectype, r, self)
 
         return rec
 
     def clear_all_records(self, exclude=None):
-        """Clear all the records for this name node."""
-        if exclude is None:
-            self._node.rdatasets = []
-        else:
-            exclude_type = dns.rdatatype._by_text.get(exclude, None)
+        """Clear all the records for this name node, or all but those of
+        the type `exclude`.  The node is given a new list of records, so
+        anything iterating over the old one is not disturbed."""
+        exclude_type = None
+        if exclude is not None:
+            exclude_type = _RDTYPES.get(exclude)
             if exclude_type is None:
                 raise NameError("Invalid exclude: %s" % exclude)
 
-            for r in self._node.rdatasets:
-                if r.rdtype != exclude_type:
-                    self._node.rdatasets.remove(r)
+        if any(r.rdtype != exclude_type for r in self._node.rdatasets):
+            self._writable()
+            before = self._node.rdatasets
+            self._node.rdatasets = [r for r in before if r.rdtype == exclude_type]
+            if self._zone is not None:
+                removed = [r for r in before if r.rdtype != exclude_type]
+                self._zone._forget(self.name, removed)
+            self._changed()
 
 
 class Zone(object):
@@ -240,54 +504,596 @@ class Zone(object):
         self.domain = domain
 
         self._zone = None
-
-    def load_from_file(self, filename):
-        """Load the details of a zone from zone file `filename`."""
+        self._names = None
+        self._names_view = None
+        self._names_ttl = None
+        self._root = None
+        self._dirty = set()
+        self._spans = None
+        self._source = None
+        self._soa_ttl_used = False
+        self._staged = None
+        self._reverse = None
+        self._tree = None
+        # The ids of the nodes copied since the last snapshot, which are no
+        # longer shared with it; None if no snapshot has been taken
+        self._owned = None
+        self._frozen = False
+        self.partial = False
+
+    def __getstate__(self):
+        # Pickle the records as a compact wire format snapshot; the index
+        # of names is rebuilt on demand
+        state = self.__dict__.copy()
+        if self._zone is not None:
+            state["_zone"] = dumps_zone(self._zone)
+            if self._spans is not None:
+                # Listed in node order, to save pickling every name again
+                spans = self._spans
+                state["_spans"] = [spans.get(name) for name in self._zone.nodes]
+        state["_names"] = None
+        state["_names_view"] = None
+        state["_names_ttl"] = None
+        state["_root"] = None
+        state["_reverse"] = None
+        state["_tree"] = None
+        state["_owned"] = None
+        return state
+
+    def __setstate__(self, state):
+        if state["_zone"] is not None:
+            state["_zone"] = loads_zone(state["_zone"])
+            if state["_spans"] is not None:
+                state["_spans"] = dict(
+                    (name, spans)
+                    for name, spans in zip(state["_zone"].nodes, state["_spans"])
+                    if spans is not None
+                )
+        self.__dict__.update(state)
+
+    def load_from_file(self, filename, types=None, under=None, cache=None):
+        """Load the details of a zone from zone file `filename`.
+
+        If `types` (a list of record types such as 'SOA' or 'A') or `under`
+        (a domain name) is given then only the matching records are kept;
+        everything else is discarded while the file is parsed.  A zone loaded
+        this way is marked as `partial`.
+
+        `cache` is an optional zone_cache.ZoneCache; a full load is taken
+        from its snapshot of the file when the file has not changed, and
+        stored in it otherwise.
+        """
+        self._writable()
         self.filename = filename
-        self._zone = dns.zone.from_file(filename, self.domain, relativize=False)
+        self._spans = None
+        self._source = None
+        with instrument.operation("load", zone=self.domain, filename=filename) as op:
+            if types is None and under is None:
+                self._zone = None
+                if cache is not None:
+                    self._zone = cache.load(self.domain, filename)
+                    op.set(cached=self._zone is not None)
+                if self._zone is None:
+                    if cache is not None:
+                        state = cache.source_state(filename)
+                    self._read_file(filename)
+                    if cache is not None:
+                        cache.store(self.domain, filename, self._zone, state=state)
+                self.partial = False
+            else:
+                reader = ZoneReader(self.domain, filename, types=types, under=under)
+                self._zone = reader.read_zone()
+                self.partial = True
+            if op:
+                op.set(
+                    bytes=os.path.getsize(filename),
+                    records=_count_records(self._zone),
+                    partial=self.partial,
+                )
+        self._names = None
+        self._root = None
+        self._reverse = None
+        self._tree = None
+        self._owned = None
+        self._dirty = set()
+
+    def _read_file(self, filename):
+        """Parse the whole of `filename`, remembering where each name's
+        records are so that later saves can rewrite just the changed names.
+        """
+        stat = os.stat(filename)
+        spans = {}
+        reader = ZoneReader(self.domain, filename)
+        self._zone = reader.read_zone(spans)
+        self._zone.check_origin()
+
+        # In-place updates need every record's lines to be self-contained
+        if (
+            reader.included
+            or reader.generated
+            or reader.last_ttl_used
+            or not _ends_with_eol(filename)
+        ):
+            return
+        self._spans = spans
+        self._source = (stat.st_size, stat.st_mtime_ns)
+        self._soa_ttl_used = reader.soa_ttl_used
 
     def get_root(self):
         """Return the root ("@") name of the zone as a Name object."""
         if not self._zone:
             return None
 
-        return Name("@", self._zone[self.domain])
+        if self._root is None:
+            node = self._zone.nodes.get(self._zone.origin)
+            if node is None:
+                return None
+            self._root = Name("@", node, zone=self)
+        return self._root
 
     root = property(get_root)
 
     def get_names(self):
-        """Return a dictionary of names, keyed by name as string,
-        with values as corresponding Name objects."""
+        """Return a read-only mapping of names, keyed by name as string,
+        with values as corresponding Name objects.
+
+        The mapping is built on first access and then kept up to date by
+        `add_name` and `delete_name`, so repeated lookups are cheap.
+        """
         if not self._zone:
             return None
 
-        default_ttl = soa_from_node(self._zone[self.domain]).minimum
+        default_ttl = self._default_ttl()
 
-        names = {}
-        for name in self._zone.keys():
-            name = str(name)
-            nameobj = Name(name, self._zone[name], default_ttl)
-            names[name] = nameobj
+        if self._names is None:
+            names = {}
+            for name, node in self._zone.items():
+                name = str(name)
+                names[name] = Name(name, node, default_ttl, self)
+            self._names = names
+            self._names_view = MappingProxyType(names)
+            self._names_ttl = default_ttl
+        elif default_ttl != self._names_ttl:
+            # The SOA minimum has changed since the index was built
+            for nameobj in self._names.values():
+                nameobj.ttl = default_ttl
+            self._names_ttl = default_ttl
 
-        return names
+        return self._names_view
 
     names = property(get_names)
 
+    def apply(self, changes):
+        """Apply a batch of record changes to the zone in one pass.
+
+        `changes` is an iterable of `(op, name, rectype, item)` or
+        `(op, name, rectype, item, ttl)` tuples, where `op` is one of:
+
+          'add'     : add `item` to the `rectype` records of `name`, creating
+                      the name if needed.
+          'delete'  : delete `item` from the `rectype` records of `name`.
+          'replace' : replace all the `rectype` records of `name` with the
+                      items in the list `item`.
+
+        For 'add' and 'replace' a `ttl` sets the TTL of the `rectype` records
+        of `name`, which all share one TTL; otherwise new records take the
+        zone's default TTL.
+
+        Items take the same form as for Records.add.  As with Records.add,
+        adding a record of a type which may only have one, such as CNAME,
+        replaces the one there.  Every change is validated before any is
+        applied, and if any change fails, e.g. deleting a record that does
+        not exist, the zone is left exactly as it was and a ZoneError is
+        raised.
+        """
+        self._writable()
+        # Validate and convert everything up front, grouped by name and type.
+        # Names are grouped by their text, as hashing a dns.name.Name means
+        # lower-casing each of its labels every time.
+        groups = {}
+        names = {}
+        dnsnames = {}
+        rdatas = {}
+        for index, change in enumerate(changes):
+            try:
+                if len(change) == 5:
+                    op, name, rectype, item, ttl = change
+                    ttl = int(ttl)
+                else:
+                    op, name, rectype, item = change
+                    ttl = None
+                if op not in ("add", "delete", "replace"):
+                    raise ValueError("unknown operation %r" % (op,))
+                key = names.get(name)
+                if key is None:
+                    dnsname = self._zone._validate_name(name)
+                    key = names[name] = str(dnsname)
+                    dnsnames[key] = dnsname
+                name = key
+                rdtype = _RDTYPES.get(rectype)
+                if rdtype is None:
+                    rdtype = dns.rdatatype.from_text(rectype)
+                items = item if op == "replace" else [item]
+                converted = []
+                for item in items:
+                    item = _check_item(rectype, item)
+                    key = (rectype, item)
+                    rd = rdatas.get(key)
+                    if rd is None:
+                        rd = rdatas[key] = _new_rdata(rectype, item)
+                    converted.append(rd)
+            except Exception as e:
+                raise ZoneError("Invalid change %d %r: %s" % (index, change, e))
+            groups.setdefault((name, rdtype), []).append((index, op, converted, ttl))
+
+        nodes = self._zone.nodes
+        default_ttl = self._default_ttl()
+        # (name, node created, rdataset, rdataset created, original items)
+        undo = []
+        try:
+            for (key, rdtype), ops in groups.items():
+                name = dnsnames[key]
+                node = self._own(name)
+                created_node = node is None
+                if created_node:
+                    node = nodes[name] = self._zone.node_factory()
+                rds = node.get_rdataset(dns.rdataclass.IN, rdtype)
+                created_rds = rds is None
+                if created_rds:
+                    rds = node.get_rdataset(dns.rdataclass.IN, rdtype, create=True)
+                    if default_ttl:
+                        rds.update_ttl(default_ttl)
+                undo.append(
+                    (key, name, created_node, rds, created_rds, rds.items, rds.ttl)
+                )
+
+                # An insertion ordered dict serves as the set of rdatas
+                members = dict.fromkeys(rds.items)
+                singleton = dns.rdatatype.is_singleton(rdtype)
+                for index, op, converted, ttl in ops:
+                    if ttl is not None and op != "delete":
+                        rds.ttl = ttl
+                    if op == "replace" or (singleton and op == "add"):
+                        members = dict.fromkeys(
+                            converted[-1:] if singleton else converted
+                        )
+                    elif op == "add":
+                        members.setdefault(converted[0])
+                    elif converted[0] in members:
+                        del members[converted[0]]
+                    else:
+                        raise ZoneError(
+                            "Invalid change %d: no such item in record: %s"
+                            % (index, converted[0])
+                        )
+                rds.items = list(members)
+        except Exception:
+            for _, name, created_node, rds, created_rds, items, ttl in reversed(undo):
+                rds.items = items
+                rds.ttl = ttl
+                if created_node:
+                    del nodes[name]
+                elif created_rds:
+                    nodes[name].rdatasets.remove(rds)
+            raise
+
+        for key, name, created_node, rds, created_rds, items, ttl in undo:
+            if created_node and self._names is not None:
+                self._names[key] = Name(key, nodes[name], self._names_ttl, self)
+            if created_node and self._tree is not None:
+                self._tree_insert(name)
+            if rds.items != items or rds.ttl != ttl or created_node:
+                if self._reverse is not None:
+                    old = set(items)
+                    new = set(rds.items)
+                    self._reindex(
+                        key, rds.rdtype, [rd for rd in items if rd not in new], -1
+                    )
+                    self._reindex(
+                        key, rds.rdtype, [rd for rd in rds.items if rd not in old], 1
+                    )
+                self._changed(key)
+
+    def diff(self, other):
+        """Compare the zone with the Zone `other` and return a ZoneDiff of
+        the records that would have to be removed and added to turn this
+        zone into `other`.
+
+        Each name is visited once, so the comparison is linear in the size
+        of the zones; only the changes themselves are sorted.
+        """
+        changes = {}
+        _diff_nodes(self._zone.nodes, other._zone.nodes, changes)
+        removed, added = _sorted_changes(changes)
+        return ZoneDiff(removed, added, _soa_record(self), _soa_record(other))
+
+    def names_under(self, suffix=None):
+        """Return a list of the names at or below `suffix`, e.g.
+        'lab.example.com.', in DNS canonical order: each name is followed
+        by the names below it, and names of the same depth are sorted by
+        label.  With no `suffix` every name in the zone is listed.
+
+        The names are found in a sorted index which is built on the first
+        call and then kept up to date, so the cost is in proportion to the
+        number of names listed rather than the size of the zone.
+        """
+        lo, hi = self._subtree(suffix)
+        return [str(name) for name in self._tree[1][lo:hi]]
+
+    def delete_subtree(self, suffix):
+        """Remove `suffix` and every name below it from the zone, as
+        `delete_name` would remove each of them.  Returns the number of
+        names removed.
+        """
+        self._writable()
+        lo, hi = self._subtree(suffix)
+        keys, names = self._tree
+        doomed = names[lo:hi]
+        del keys[lo:hi]
+        del names[lo:hi]
+
+        nodes = self._zone.nodes
+        for name in doomed:
+            node = nodes.pop(name)
+            if name == self._zone.origin:
+                self._root = None
+            key = str(name)
+            self._forget(key, node.rdatasets)
+            if self._names is not None:
+                self._names.pop(key, None)
+            self._changed(key)
+        return len(doomed)
+
+    def _subtree(self, suffix):
+        """Return the slice of the subtree index holding `suffix` and the
+        names below it."""
+        keys, _ = self._subtree_index()
+        if suffix is None:
+            return 0, len(keys)
+        name = self._zone._validate_name(suffix).derelativize(self._zone.origin)
+        key = _canonical_key(name)
+        return bisect_left(keys, key), bisect_left(keys, key + _LAST_LABEL)
+
+    def _subtree_index(self):
+        """Return the subtree index, two lists of the canonical keys of
+        the names and the names themselves in canonical order, building it
+        if needed."""
+        if self._tree is None:
+            pairs = sorted((_canonical_key(name), name) for name in self._zone.nodes)
+            self._tree = ([k for k, _ in pairs], [n for _, n in pairs])
+        return self._tree
+
+    def _tree_insert(self, name):
+        keys, names = self._tree
+        key = _canonical_key(name)
+        index = bisect_left(keys, key)
+        keys.insert(index, key)
+        names.insert(index, name)
+
+    def _tree_remove(self, name):
+        keys, names = self._tree
+        key = _canonical_key(name)
+        index = bisect_left(keys, key)
+        if index < len(keys) and keys[index] == key:
+            del keys[index]
+            del names[index]
+
+    def owners_of(self, value):
+        """Return a sorted list of `(name, rectype)` for the records whose
+        data is `value`: an IPv4 or IPv6 address for 'A' and 'AAAA'
+        records, or a target name for 'NS', 'CNAME', 'MX', 'PTR', 'SRV' and
+        'DNAME' records, written as it is in the records, e.g.
+        'mail.example.com.'.
+
+        The lookup uses an index of the record data which is built on the
+        first call and then kept up to date as records are changed through
+        this module; records changed directly with dnspython are not seen.
+        """
+        owners = self._reverse_index().get(_reverse_value(value))
+        if not owners:
+            return []
+        return sorted((name, dns.rdatatype.to_text(rdtype)) for name, rdtype in owners)
+
+    def ptr_records(self, network=None):
+        """Return a list of `(ptr name, owner name)` for every 'A' and
+        'AAAA' record in the zone, e.g.
+        `('1.0.0.10.in-addr.arpa.', 'foo.example.com.')`, ready to be added
+        to the reverse zones.  `network`, e.g. '10.0.0.0/8', limits the
+        list to the addresses within it.
+
+        Uses the same index as `owners_of`, so the whole list is made in
+        one pass over the addresses.
+        """
+        if network is not None:
+            network = ipaddress.ip_network(network)
+        ptrs = []
+        for value, owners in self._reverse_index().items():
+            names = [n for n, t in owners if t in _ADDRESS_TYPES]
+            if not names:
+                continue
+            if network is not None:
+                address = ipaddress.ip_address(value)
+                if address.version != network.version or address not in network:
+                    continue
+            ptr = str(dns.reversename.from_address(value))
+            ptrs.extend((ptr, name) for name in sorted(names))
+        return ptrs
+
+    def _reverse_index(self):
+        """Return the index of record data to `{(name, rdtype): count}`,
+        building it if needed."""
+        if self._reverse is None:
+            self._reverse = {}
+            for name, node in self._zone.nodes.items():
+                for rds in node.rdatasets:
+                    self._reindex(str(name), rds.rdtype, rds.items, 1)
+        return self._reverse
+
+    def _forget(self, name, rdatasets):
+        """Drop what the indexes hold of `rdatasets`, the records of `name`
+        which are being removed."""
+        if self._reverse is not None:
+            for rds in rdatasets:
+                self._reindex(name, rds.rdtype, rds.items, -1)
+
+    def _reindex(self, name, rdtype, rdatas, count):
+        """Add `count` (1 or -1) to the index entries of `rdatas`, the data
+        of `name`'s records of type `rdtype`."""
+        if rdtype not in _REVERSE_TYPES:
+            return
+        if name == "@":
+            name = self.domain
+        index = self._reverse
+        key = (name, rdtype)
+        for rd in rdatas:
+            value = _reverse_key(rdtype, rd)
+            owners = index.get(value)
+            if owners is None:
+                owners = index[value] = {}
+            total = owners.get(key, 0) + count
+            if total > 0:
+                owners[key] = total
+            else:
+                owners.pop(key, None)
+                if not owners:
+                    del index[value]
+
+    def validate(self, max_ttl=None):
+        """Check the zone for common errors, as named-checkzone would, and
+        return a list of zone_validate.Problem, errors first.  The zone is
+        valid if none of them has a severity of 'error'.
+
+        See zone_validate.validate_zone for the checks made.
+        """
+        return validate_zone(self._zone, max_ttl=max_ttl)
+
+    def _default_ttl(self):
+        node = self._zone.nodes.get(self._zone.origin)
+        soa = soa_from_node(node) if node is not None else None
+        if soa is None:
+            return None
+        return soa.minimum
+
+    def snapshot(self):
+        """Return a read-only copy of the zone as it is now, which is not
+        affected by later changes to the zone, e.g. for other threads to
+        read or save while this one carries on changing it.
+
+        The copy shares the nodes of the zone rather than copying them, so
+        taking it costs about as much as copying a dict of the names; a
+        node is only copied when it is next changed in either zone.
+        Changing the snapshot raises a ZoneError.
+        """
+        snap = Zone(self.domain)
+        snap.filename = getattr(self, "filename", None)
+        snap.partial = self.partial
+        if self._zone is not None:
+            zone = self._zone
+            snap._zone = dns.zone.Zone(zone.origin, zone.rdclass, relativize=False)
+            snap._zone.nodes = dict(zone.nodes)
+        snap._owned = set()
+        snap._frozen = True
+        self._owned = set()
+        return snap
+
+    def _writable(self):
+        """Raise a ZoneError if the zone is a snapshot."""
+        if self._frozen:
+            raise ZoneError("%s is a read-only snapshot" % self.domain)
+
+    def _own(self, name, view=None):
+        """Return the node of `name`, a dns.name.Name or string, first
+        replacing it with a copy if it may be shared with a snapshot.  The
+        Names and Records made of the node are moved to the copy.
+
+        `view` is a Name of the node, which may no longer be in the zone.
+        """
+        self._writable()
+        if not isinstance(name, dns.name.Name):
+            if name == "@":
+                name = self._zone.origin
+            else:
+                name = dns.name.from_text(name)
+        nodes = self._zone.nodes
+        node = nodes.get(name)
+        if view is not None and view._node is not node:
+            node = view._node
+            name = None
+        if node is None or self._owned is None or id(node) in self._owned:
+            return node
+
+        new, rdatasets = _copy_node(node)
+        self._owned.add(id(new))
+        views = [view]
+        if name is not None:
+            nodes[name] = new
+            if self._names is not None:
+                views.append(self._names.get(str(name)))
+            if name == self._zone.origin:
+                views.append(self._root)
+        for nameobj in views:
+            if nameobj is not None and nameobj._node is node:
+                nameobj._node = new
+                if nameobj._soa is not None:
+                    nameobj._soa._soa = soa_from_node(new)
+                for rec in nameobj._records.values():
+                    rec._rdataset = rdatasets.get(id(rec._rdataset), rec._rdataset)
+        return new
+
+    def _changed(self, name):
+        """Record that the name `name` has been modified."""
+        if name == "@":
+            name = self.domain
+        self._dirty.add(name)
+
+    def get_dirty(self):
+        """Return True if the zone has been modified since it was loaded or
+        last saved to its file."""
+        return bool(self._dirty)
+
+    dirty = property(get_dirty)
+
     def add_name(self, name):
         """Add a new name (hostname) to the zone.
         If a node with the same name already exists it is returned instead.
         """
+        self._writable()
+        name = self._zone._validate_name(name)
+        key = str(name)
+        existing = self._zone.get_node(name)
         node = self._zone.get_node(name, create=True)
         if node is None:
             raise ZoneError("Could not create node named: %s" % name)
 
+        if existing is None:
+            self._changed(key)
+            if self._names is not None:
+                self._names[key] = Name(key, node, self._names_ttl, self)
+            if self._tree is not None:
+                self._tree_insert(name)
+
     def delete_name(self, name):
         """Remove all nodes associated with a name (hostname) from the zone.
         If no such nodes exist, nothing happens.
         """
+        self._writable()
+        name = self._zone._validate_name(name)
+        key = str(name)
+        node = self._zone.get_node(name)
+        if node is None:
+            return
+        self._forget(key, node.rdatasets)
         self._zone.delete_node(name)
+        if name == self._zone.origin:
+            self._root = None
+        self._changed(key)
+        if self._tree is not None:
+            self._tree_remove(name)
+
+        if self._names is not None:
+            self._names.pop(key, None)
 
-    def save(self, filename=None, autoserial=False):
+    def save(self, filename=None, autoserial=False, force=False):
         """Write the zone back to a file.
 
         If `filename` is not specified the zone will be written
@@ -296,33 +1102,860 @@ class Zone(object):
         if `autoserial`is True then the serial will be updated to the
         current date in common YYYYMMDDxx format.  The serial is
         guaranteed to be larger than the previous number.
+
+        The file is replaced atomically.  When writing over the file the
+        zone was read from, only the lines of the names that changed are
+        rewritten and the rest of the file is copied as it is, comments and
+        all; otherwise the whole zone is rendered.
+
+        If the zone has not been modified since it was loaded then writing
+        over the file it was read from is skipped, and the serial left alone,
+        unless `force` is True.  Returns True if the file was written.
+
+        A `partial` zone will not be written over the file it was read
+        from, as that would lose the records that were not loaded, unless
+        `force` is True.
         """
+        with instrument.operation("save", zone=self.domain) as op:
+            written = self._save(filename, autoserial, force)
+            if op:
+                target = filename or self.filename
+                op.set(filename=target, written=written)
+                if written:
+                    op.set(
+                        bytes=os.path.getsize(target),
+                        records=_count_records(self._zone),
+                    )
+        return written
+
+    def _save(self, filename, autoserial, force):
+        in_place = filename in (None, self.filename)
+        if in_place:
+            self._writable()
+        if in_place and not force:
+            if self.partial:
+                raise ZoneError(
+                    "Refusing to overwrite %s with a partially loaded zone"
+                    % self.filename
+                )
+            if not self._dirty:
+                return False
+
+        if autoserial and in_place and not self._dirty and self._can_splice():
+            # Only the serial changes, so just rewrite it in the file
+            soa = soa_from_node(self._own(self._zone.origin))
+            soa.serial = bump_serial(self.filename, self.domain)
+            stat = os.stat(self.filename)
+            self._source = (stat.st_size, stat.st_mtime_ns)
+            return True
+
         if autoserial:
             soa = self.root.soa
-            new_serial = int(strftime("%Y%m%d00", localtime(time())))
-            if new_serial <= soa.serial:
-                new_serial = soa.serial + 1
-            soa.serial = new_serial
+            soa.serial = _next_serial(soa.serial)
 
         if not filename:
             filename = self.filename
-        self._zone.to_file(filename, relativize=False)
+        spliced = in_place and self._can_splice()
+        if spliced:
+            spans = _atomic_write(filename, self._write_spliced)
+        else:
+            spans = _atomic_write(filename, self._write_full)
+
+        if in_place:
+            self._saved(spans, spliced)
+        return True
+
+    def _saved(self, spans, spliced):
+        """Note that the zone has just been written over its file."""
+        stat = os.stat(self.filename)
+        self._spans = spans
+        self._source = (stat.st_size, stat.st_mtime_ns)
+        if not spliced:
+            self._soa_ttl_used = False
+        self._dirty = set()
+
+    def stage(self, autoserial=False):
+        """Write the zone to a temporary file beside the file it was read
+        from, so it can be checked before it replaces that file.  Returns
+        the temporary file's name.
+
+        The file is written as `save` would write it, whether or not the
+        zone has been modified.  It is put in place by `commit_staged` or
+        thrown away by `discard_staged`, which also undoes the serial
+        update made by `autoserial`.
+        """
+        self._writable()
+        if self.partial:
+            raise ZoneError(
+                "Refusing to overwrite %s with a partially loaded zone" % self.filename
+            )
+        if self._staged is not None:
+            raise ZoneError("%s already has a staged save" % self.domain)
+
+        dirty = set(self._dirty)
+        serial = None
+        if autoserial:
+            soa = self.root.soa
+            serial = soa.serial
+            soa.serial = _next_serial(serial)
+
+        try:
+            with instrument.operation("stage", zone=self.domain) as op:
+                spliced = self._can_splice()
+                if spliced:
+                    tmpname, spans = _write_temp(self.filename, self._write_spliced)
+                else:
+                    tmpname, spans = _write_temp(self.filename, self._write_full)
+                if op:
+                    op.set(
+                        filename=tmpname,
+                        bytes=os.path.getsize(tmpname),
+                        records=_count_records(self._zone),
+                    )
+        except BaseException:
+            self._unstage(serial, dirty)
+            raise
+        self._staged = (tmpname, spans, spliced, serial, dirty)
+        return tmpname
+
+    def commit_staged(self):
+        """Replace the zone's file with the one written by `stage`."""
+        if self._staged is None:
+            raise ZoneError("%s has no staged save" % self.domain)
+        tmpname, spans, spliced, _, _ = self._staged
+        self._staged = None
+        _replace(tmpname, self.filename)
+        self._saved(spans, spliced)
+
+    def discard_staged(self):
+        """Remove the file written by `stage`, leaving the zone as it was
+        before."""
+        if self._staged is None:
+            return
+        tmpname, _, _, serial, dirty = self._staged
+        self._staged = None
+        try:
+            os.unlink(tmpname)
+        except OSError:
+            pass
+        self._unstage(serial, dirty)
+
+    def _unstage(self, serial, dirty):
+        if serial is not None:
+            soa_from_node(self._own(self._zone.origin)).serial = serial
+        self._dirty = dirty
+
+    async def asave(self, filename=None, autoserial=False, force=False, executor=None):
+        """Write the zone back to a file, as `save`, from `executor` (by
+        default the event loop's default executor) so that the event loop is
+        not blocked.  The zone should not be modified until it returns.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            executor, self.save, filename, autoserial, force
+        )
+
+    def _can_splice(self):
+        """Return True if the changed names can be spliced into the file the
+        zone was read from, rather than rendering the whole zone.  That is
+        only possible while the file is as it was when last read or
+        written."""
+        if self._spans is None:
+            return False
+        if self._soa_ttl_used and self.domain in self._dirty:
+            # Records relying on the SOA minimum as their TTL would change
+            return False
+        try:
+            stat = os.stat(self.filename)
+        except OSError:
+            return False
+        return (stat.st_size, stat.st_mtime_ns) == self._source
+
+    def _node_text(self, name):
+        node = self._zone.nodes.get(name)
+        if node is None:
+            return ""
+        return node.to_text(name, origin=self._zone.origin, relativize=False)
+
+    def _write_full(self, out):
+        """Write every name of the zone to the file object `out`, in the
+        same form as dns.zone.Zone.to_file.  Returns the new name spans."""
+        spans = {}
+        line = 1
+        for name in sorted(self._zone.nodes.keys()):
+            text = self._node_text(name)
+            out.write(text.encode("utf-8"))
+            out.write(b"\n")
+            count = text.count("\n") + 1
+            if text:
+                spans[name] = [[line, line + count]]
+            line += count
+        return spans
+
+    def _write_spliced(self, out):
+        """Write the file the zone was read from to the file object `out`,
+        replacing the lines of each changed name with its new records.
+        Unchanged parts of the file are copied as they are.  Returns the
+        new name spans."""
+        # (start, end, name, text): lines [start, end) are replaced by text
+        edits = []
+        appended = []
+        dirty = set(self._zone._validate_name(key) for key in self._dirty)
+        for name in dirty:
+            text = self._node_text(name)
+            name_spans = self._spans.get(name)
+            if not name_spans:
+                if text:
+                    appended.append((name, text))
+                continue
+            start, end = name_spans[0]
+            edits.append((start, end, name, text))
+            for start, end in name_spans[1:]:
+                edits.append((start, end, None, ""))
+        edits.sort(key=lambda edit: edit[0])
+
+        # Line number shift for lines following each edit
+        ends = []
+        shifts = []
+        shift = 0
+        for start, end, _, text in edits:
+            count = text.count("\n") + 1 if text else 0
+            shift += count - (end - start)
+            ends.append(end)
+            shifts.append(shift)
+
+        spans = {}
+        for name, name_spans in self._spans.items():
+            if name in dirty:
+                continue
+            new_spans = []
+            for start, end in name_spans:
+                i = bisect_right(ends, start) - 1
+                delta = shifts[i] if i >= 0 else 0
+                new_spans.append([start + delta, end + delta])
+            spans[name] = new_spans
+
+        with open(self.filename, "rb") as src:
+            data = mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                pos = 0
+                line = 1
+                shift = 0
+                for i, (start, end, name, text) in enumerate(edits):
+                    new_pos = _skip_lines(data, pos, start - line)
+                    out.write(data[pos:new_pos])
+                    if text:
+                        out.write(text.encode("utf-8"))
+                        out.write(b"\n")
+                        count = text.count("\n") + 1
+                        spans[name] = [[start + shift, start + shift + count]]
+                    pos = _skip_lines(data, new_pos, end - start)
+                    line = end
+                    shift = shifts[i]
+                tail = data[pos:]
+                out.write(tail)
+                line += tail.count(b"\n")
+            finally:
+                data.close()
+
+        line += shift
+        for name, text in sorted(appended):
+            out.write(text.encode("utf-8"))
+            out.write(b"\n")
+            count = text.count("\n") + 1
+            spans[name] = [[line, line + count]]
+            line += count
+        return spans
+
+
+class ZoneDiff(object):
+    """The differences between two versions of a zone, as returned by
+    Zone.diff and diff_files.
+
+    `removed` and `added` are lists of `(name, ttl, type, value)` tuples,
+    in the same form as iter_records, in canonical (DNSSEC) order of name,
+    type and value.  A record whose TTL changed is both removed and added.
+    """
+
+    def __init__(self, removed, added, old_soa=None, new_soa=None):
+        self._removed = removed
+        self._added = added
+        self._old_soa = old_soa
+        self._new_soa = new_soa
+
+    def __len__(self):
+        return len(self._removed) + len(self._added)
+
+    def get_removed(self):
+        return [_record_tuple(record) for record in self._removed]
+
+    removed = property(get_removed)
+
+    def get_added(self):
+        return [_record_tuple(record) for record in self._added]
+
+    added = property(get_added)
+
+    def to_ixfr(self):
+        """Return the differences as the text of an IXFR style delta: the
+        old SOA, the removed records, the new SOA and then the added
+        records (RFC 1995)."""
+        lines = []
+        for soa, records in (
+            (self._old_soa, self._removed),
+            (self._new_soa, self._added),
+        ):
+            if soa is not None:
+                lines.append(_record_text(soa))
+            for record in records:
+                if record[1] != dns.rdatatype.SOA:
+                    lines.append(_record_text(record))
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def to_changes(self):
+        """Return the differences as a list of changes for Zone.apply.
+
+        All the removals come before the additions, which carry the TTL of
+        the records added, so that a change of TTL alone is applied too.
+        Values are as given by `Records.items`, e.g. the whole text of a
+        TXT record with each of its strings quoted, which apply reads
+        back as the same record.  SOA records are left out, as the serial
+        is managed by Zone.save(autoserial=True).
+        """
+        changes = []
+        for record in self._removed:
+            if record[1] != dns.rdatatype.SOA:
+                name, ttl, rectype, item = _record_tuple(record)
+                changes.append(("delete", name, rectype, item))
+        for record in self._added:
+            if record[1] != dns.rdatatype.SOA:
+                name, ttl, rectype, item = _record_tuple(record)
+                changes.append(("add", name, rectype, item, ttl))
+        return changes
 
 
 # ---- Module Functions ----
 
 
-def zone_from_file(domain, filename):
-    """Read a zone file and return the contents as a Zone object."""
+def zone_from_file(domain, filename, types=None, under=None, cache=None):
+    """Read a zone file and return the contents as a Zone object.
+
+    `types` and `under` restrict the records loaded and `cache` is an
+    optional ZoneCache of parsed zones, see Zone.load_from_file.
+    """
     zone = Zone(domain)
-    zone.load_from_file(filename)
+    zone.load_from_file(filename, types=types, under=under, cache=cache)
     return zone
 
 
+def iter_records(domain, filename, types=None, under=None):
+    """Scan a zone file and yield its records one at a time as
+    `(name, ttl, type, value)` tuples, without loading the whole zone.
+
+    `value` is in the same form as `Records.items`, e.g. a
+    (preference, exchange) tuple for MX records.  `types` and `under`
+    restrict the records returned, see ZoneReader.
+    """
+    if domain[-1:] != ".":
+        domain = domain + "."
+    reader = ZoneReader(domain, filename, types=types, under=under)
+    for name, ttl, rdtype, rd in reader:
+        rectype = dns.rdatatype.to_text(rdtype)
+        yield (str(name), ttl, rectype, _item_from_rdata(rectype, rd))
+
+
+def diff_files(domain, old_filename, new_filename, types=None, under=None):
+    """Compare two zone files for `domain` and return a ZoneDiff, as
+    Zone.diff, without loading either zone into memory.
+
+    Files with their names in sorted order, as written by Zone.save when
+    it renders the whole zone, are read side by side.  Otherwise, e.g. for
+    files written by hand or with names added by an in-place save, the
+    records of each file are first spread by name over temporary bucket
+    files, which are then compared one pair at a time, so only a fraction
+    of either zone is held in memory at once.  `types` and `under` restrict
+    the records compared, see ZoneReader.
+    """
+    if domain[-1:] != ".":
+        domain = domain + "."
+    try:
+        return _diff_sorted_files(domain, old_filename, new_filename, types, under)
+    except _UnsortedError:
+        return _diff_bucketed_files(domain, old_filename, new_filename, types, under)
+
+
+def _diff_sorted_files(domain, old_filename, new_filename, types, under):
+    """diff_files for files with their names in sorted order; raises
+    _UnsortedError if they are not."""
+    old_soa = []
+    new_soa = []
+    old_nodes = _iter_nodes(
+        ZoneReader(domain, old_filename, types=types, under=under), old_soa
+    )
+    new_nodes = _iter_nodes(
+        ZoneReader(domain, new_filename, types=types, under=under), new_soa
+    )
+
+    removed = []
+    added = []
+    changes = {}
+    old = next(old_nodes, None)
+    new = next(new_nodes, None)
+    while old is not None or new is not None:
+        if new is None or (old is not None and old[0] < new[0]):
+            _diff_node(old[0], old[1], None, changes)
+            old = next(old_nodes, None)
+        elif old is None or new[0] < old[0]:
+            _diff_node(new[0], None, new[1], changes)
+            new = next(new_nodes, None)
+        else:
+            _diff_node(old[0], old[1], new[1], changes)
+            old = next(old_nodes, None)
+            new = next(new_nodes, None)
+        # Names arrive in order, so each name's changes are final
+        for name, (old_records, new_records) in changes.items():
+            removed.extend(old_records)
+            added.extend(new_records)
+        changes.clear()
+
+    return ZoneDiff(
+        removed, added, old_soa[0] if old_soa else None, new_soa[0] if new_soa else None
+    )
+
+
+def _iter_nodes(reader, soa):
+    """Yield `(name, node)` for each name read by the ZoneReader `reader`,
+    checking that the names come in sorted order.  The zone's SOA record
+    is appended to the list `soa`."""
+    rdataset_for = None
+    current = None
+    node = None
+    for name, ttl, rdtype, rd in reader:
+        if name != current:
+            if node is not None:
+                if not current < name:
+                    raise _UnsortedError(
+                        "%s is not sorted by name at %s" % (reader.filename, name)
+                    )
+                yield current, node
+            current = name
+            node = dns.node.Node()
+            rdataset_for = node.find_rdataset
+        rdataset_for(dns.rdataclass.IN, rdtype, rd.covers(), True).add(rd, ttl)
+        if rdtype == dns.rdatatype.SOA and name == reader.origin:
+            soa.append((name, rdtype, ttl, rd))
+    if node is not None:
+        yield current, node
+
+
+def _diff_bucketed_files(domain, old_filename, new_filename, types, under):
+    """diff_files for files in any order: each file's records are written
+    out to _DIFF_BUCKETS temporary files by the hash of their name, and
+    each pair of buckets is then loaded and compared."""
+    origin = dns.name.from_text(domain)
+    workdir = tempfile.mkdtemp(prefix="dnszone-diff-")
+    try:
+        soas = []
+        buckets = []
+        for side, filename in enumerate((old_filename, new_filename)):
+            paths = [
+                os.path.join(workdir, "%d.%d" % (side, index))
+                for index in range(_DIFF_BUCKETS)
+            ]
+            files = [open(path, "w") for path in paths]
+            soa = None
+            try:
+                reader = ZoneReader(domain, filename, types=types, under=under)
+                for name, ttl, rdtype, rd in reader:
+                    record = (name, rdtype, ttl, rd)
+                    if rdtype == dns.rdatatype.SOA and name == origin:
+                        soa = record
+                    files[hash(name) % _DIFF_BUCKETS].write(_record_text(record) + "\n")
+            finally:
+                for f in files:
+                    f.close()
+            soas.append(soa)
+            buckets.append(paths)
+
+        changes = {}
+        for old_path, new_path in zip(*buckets):
+            _diff_nodes(
+                ZoneReader(domain, old_path).read_zone().nodes,
+                ZoneReader(domain, new_path).read_zone().nodes,
+                changes,
+            )
+    finally:
+        shutil.rmtree(workdir)
+
+    removed, added = _sorted_changes(changes)
+    return ZoneDiff(removed, added, soas[0], soas[1])
+
+
+def _diff_nodes(nodes, other_nodes, changes):
+    """Compare the dicts of names to dns.node.Node `nodes` and
+    `other_nodes`, storing the differences in `changes` as _diff_node."""
+    for name, node in nodes.items():
+        _diff_node(name, node, other_nodes.get(name), changes)
+    for name, node in other_nodes.items():
+        if name not in nodes:
+            _diff_node(name, None, node, changes)
+
+
+def _sorted_changes(changes):
+    """Return the lists of removed and added records in `changes`, as
+    filled in by _diff_node, in order of name."""
+    removed = []
+    added = []
+    for name in sorted(changes):
+        old, new = changes[name]
+        removed.extend(old)
+        added.extend(new)
+    return removed, added
+
+
+def _diff_node(name, old_node, new_node, changes):
+    """Compare the rdatasets of two versions of the node `name`, either of
+    which may be None.  Any differences are stored in `changes[name]` as a
+    pair of lists of removed and added `(name, rdtype, ttl, rdata)` records,
+    each sorted."""
+    old_sets = {}
+    if old_node is not None:
+        for rds in old_node.rdatasets:
+            old_sets[(rds.rdtype, rds.covers)] = rds
+    removed = []
+    added = []
+    if new_node is not None:
+        for rds in new_node.rdatasets:
+            old_rds = old_sets.pop((rds.rdtype, rds.covers), None)
+            if old_rds is None:
+                added.extend((name, rds.rdtype, rds.ttl, rd) for rd in rds)
+                continue
+            if old_rds.ttl != rds.ttl:
+                old_items = set()
+                new_items = set()
+            else:
+                # Identical text means identical records, and is much
+                # cheaper to compare than the canonical wire form
+                if set(map(str, old_rds)) == set(map(str, rds)):
+                    continue
+                old_items = set(old_rds.items)
+                new_items = set(rds.items)
+                if old_items == new_items:
+                    continue
+            removed.extend(
+                (name, rds.rdtype, old_rds.ttl, rd)
+                for rd in old_rds
+                if rd not in new_items
+            )
+            added.extend(
+                (name, rds.rdtype, rds.ttl, rd) for rd in rds if rd not in old_items
+            )
+    for rds in old_sets.values():
+        removed.extend((name, rds.rdtype, rds.ttl, rd) for rd in rds)
+
+    if removed or added:
+        removed.sort(key=_record_order)
+        added.sort(key=_record_order)
+        changes[name] = (removed, added)
+
+
+def _record_order(record):
+    return record[1], record[3]
+
+
+def _soa_record(zone):
+    """Return the SOA record of the Zone `zone` as `(name, rdtype, ttl,
+    rdata)`, or None if it has none."""
+    name = dns.name.from_text(zone.domain)
+    node = zone._zone.get_node(name)
+    if node is None:
+        return None
+    rds = node.get_rdataset(dns.rdataclass.IN, dns.rdatatype.SOA)
+    if not rds:
+        return None
+    return (name, dns.rdatatype.SOA, rds.ttl, rds.items[0])
+
+
+def _record_tuple(record):
+    """Convert a `(name, rdtype, ttl, rdata)` record into the
+    `(name, ttl, type, value)` form returned by iter_records."""
+    name, rdtype, ttl, rd = record
+    rectype = dns.rdatatype.to_text(rdtype)
+    return (str(name), ttl, rectype, _item_from_rdata(rectype, rd))
+
+
+def _record_text(record):
+    name, rdtype, ttl, rd = record
+    return "%s %d IN %s %s" % (
+        name,
+        ttl,
+        dns.rdatatype.to_text(rdtype),
+        rd.to_text(relativize=False),
+    )
+
+
+def bump_serial(filename, domain):
+    """Update the SOA serial of the zone file `filename` for `domain` in
+    place, without loading the zone, and return the new serial.
+
+    The serial is set in the same YYYYMMDDxx form as Zone.save(autoserial=
+    True).  Only the serial is rewritten; the rest of the file, including
+    its layout and comments, is copied unchanged.
+    """
+    if domain[-1:] != ".":
+        domain = domain + "."
+
+    with open(filename, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            start, end = _find_soa_serial(data, domain)
+            serial = _next_serial(int(data[start:end]))
+
+            def write(out):
+                out.write(data[:start])
+                out.write(str(serial).encode("ascii"))
+                out.write(data[end:])
+
+            _atomic_write(filename, write)
+        finally:
+            data.close()
+
+    return serial
+
+
+def _next_serial(serial):
+    """Return a serial for today in YYYYMMDDxx form that is larger than
+    `serial`."""
+    new_serial = int(strftime("%Y%m%d00", localtime(time())))
+    if new_serial <= serial:
+        new_serial = serial + 1
+    return new_serial
+
+
+# Zone file tokens: newline (or the end), whitespace, comment, quoted
+# string, parenthesis, anything else
+_TOKEN_RE = re.compile(
+    rb'(\n|\Z)|([ \t\r]+)|(;[^\n]*)|("(?:[^"\\]|\\.)*")|([()])|([^\s;()"]+)'
+)
+
+
+def _find_soa_serial(data, domain):
+    """Return the (start, end) offsets of the serial of the SOA record for
+    `domain` in the zone file text `data`."""
+    zone_origin = origin = last_owner = domain.lower().encode("ascii")
+    record = []
+    depth = 0
+    leading = False
+    line_start = True
+    for match in _TOKEN_RE.finditer(data):
+        newline, space, comment, quoted, paren, word = match.groups()
+        if newline is not None:
+            line_start = True
+            if depth > 0 or not record:
+                continue
+            first = record[0][0]
+            if first.upper() == b"$ORIGIN" and len(record) > 1:
+                origin = _absolute(record[1][0], origin)
+            elif not first.startswith(b"$"):
+                if not leading:
+                    last_owner = _absolute(first, origin)
+                if last_owner == zone_origin:
+                    serial = _soa_serial(record, leading)
+                    if serial is not None:
+                        return serial
+            record = []
+            leading = False
+            continue
+
+        if space is not None:
+            if line_start and depth == 0 and not record:
+                leading = True
+        elif paren is not None:
+            depth += 1 if paren == b"(" else -1
+        elif comment is None:
+            record.append((match.group(), match.start(), match.end()))
+        line_start = False
+
+    raise ZoneError("No SOA record for %s found" % domain)
+
+
+def _soa_serial(record, leading):
+    """Return the offsets of the serial if the tokens of `record` are an
+    SOA record, or None."""
+    # The owner is followed by an optional TTL and class, then the type
+    first = 0 if leading else 1
+    end = first + 3
+    types = [token.upper() for token, _, _ in record[first:end]]
+    if b"SOA" not in types:
+        return None
+    # mname, rname, serial
+    index = first + types.index(b"SOA") + 3
+    if len(record) <= index or not record[index][0].isdigit():
+        return None
+    return record[index][1], record[index][2]
+
+
+def _absolute(name, origin):
+    name = name.lower()
+    if name == b"@":
+        return origin
+    if name.endswith(b"."):
+        return name
+    return name + b"." + origin
+
+
+def _atomic_write(filename, write):
+    """Replace `filename` with the output of `write(f)`, called with a
+    binary file object for a temporary file in the same directory.  The
+    temporary file is synced and renamed over `filename`, so readers see
+    either the old or the new file in full.  Returns what `write` returns.
+    """
+    tmpname, result = _write_temp(filename, write)
+    _replace(tmpname, filename)
+    return result
+
+
+def _write_temp(filename, write):
+    """Write the output of `write(f)` to a synced temporary file beside
+    `filename`, with the same permissions and owner, and return the
+    temporary file's name and what `write` returns.  If `filename` is a
+    symlink the file is written beside the file it points to."""
+    filename = os.path.realpath(filename)
+    dirname = os.path.dirname(filename)
+    fd, tmpname = tempfile.mkstemp(
+        dir=dirname, prefix="." + os.path.basename(filename) + "."
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            result = write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            st = os.stat(filename)
+        except FileNotFoundError:
+            os.chmod(tmpname, 0o644)
+        else:
+            os.chmod(tmpname, stat.S_IMODE(st.st_mode))
+            try:
+                # e.g. a zone owned by named, saved as root
+                os.chown(tmpname, st.st_uid, st.st_gid)
+            except PermissionError:
+                pass
+    except BaseException:
+        os.unlink(tmpname)
+        raise
+    return tmpname, result
+
+
+def _replace(tmpname, filename):
+    """Rename the temporary file `tmpname` over `filename`, or the file it
+    links to, and sync the directory."""
+    filename = os.path.realpath(filename)
+    try:
+        os.rename(tmpname, filename)
+    except BaseException:
+        os.unlink(tmpname)
+        raise
+
+    dirname = os.path.dirname(filename)
+    try:
+        dirfd = os.open(dirname, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dirfd)
+    except OSError:
+        pass
+    finally:
+        os.close(dirfd)
+
+
+def _skip_lines(data, pos, count):
+    """Return the offset in `data` of the line `count` lines after the one
+    starting at offset `pos`."""
+    size = len(data)
+    while count > 0 and pos < size:
+        chunk_end = min(pos + (1 << 20), size)
+        newlines = data[pos:chunk_end].count(b"\n")
+        if newlines < count and chunk_end < size:
+            count -= newlines
+            pos = chunk_end
+            continue
+        while count > 0:
+            newline = data.find(b"\n", pos)
+            if newline < 0:
+                return size
+            pos = newline + 1
+            count -= 1
+    return pos
+
+
+def _ends_with_eol(filename):
+    with open(filename, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() == 0:
+            return False
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def _count_records(zone):
+    """Return the number of records in the dns.zone.Zone `zone`."""
+    return sum(len(rds) for node in zone.nodes.values() for rds in node.rdatasets)
+
+
+def _canonical_key(name):
+    """Return a key for the dns.name.Name `name` which sorts in DNS
+    canonical order, its lower-cased labels from the root down."""
+    return tuple(label.lower() for label in reversed(name.labels))
+
+
+def _reverse_key(rdtype, rd):
+    """Return the reverse index key for the rdata `rd`."""
+    attr = _REVERSE_TYPES[rdtype]
+    if attr is not None:
+        return str(getattr(rd, attr)).lower()
+    if rdtype == dns.rdatatype.AAAA:
+        # Written in the file in any of its forms
+        return dns.ipv6.inet_ntoa(dns.ipv6.inet_aton(rd.address))
+    return rd.address
+
+
+def _reverse_value(value):
+    """Return the reverse index key for a value given to owners_of."""
+    if ":" in value:
+        try:
+            return dns.ipv6.inet_ntoa(dns.ipv6.inet_aton(value))
+        except dns.exception.SyntaxError:
+            pass
+    return value.lower()
+
+
+def _item_from_rdata(rectype, rd):
+    """Convert an rdata into the value presented by `Records.items`."""
+    if rectype == "MX":
+        return (rd.preference, str(rd.exchange))
+    return str(rd)
+
+
+def _check_item(rectype, item):
+    """Check that `item` is of the right form for a record of type
+    `rectype` and return it ready for _new_rdata."""
+    if rectype == "MX":
+        assert isinstance(item, tuple)
+        assert len(item) == 2
+        assert isinstance(item[0], integer_types)
+        assert isinstance(item[1], string_types)
+    else:
+        assert isinstance(item, string_types)
+    return item
+
+
 def _new_rdata(rectype, *args):
     """Create a new rdata type of `rectype`.
-    rectype must be one of: 'NS', 'MX', 'A', 'CNAME', 'TXT', 'AAAA'
-    Extra arguments are as required by the rectype.
+    Extra arguments are as required by the rectype: for the types other
+    than 'NS', 'MX', 'A', 'CNAME', 'TXT' and 'AAAA' the record's text, with
+    absolute names, as given by `Records.items`.
     """
     if rectype == "NS":
         name = dns.name.Name(args[0].split("."))
@@ -341,15 +1974,46 @@ def _new_rdata(rectype, *args):
         name = dns.name.Name(args[0].split("."))
         rd = dns.rdtypes.ANY.CNAME.CNAME(dns.rdataclass.IN, dns.rdatatype.CNAME, name)
     elif rectype == "TXT":
-        rd = dns.rdtypes.ANY.TXT.TXT(dns.rdataclass.IN, dns.rdatatype.TXT, args[0])
+        rd = _txt_rdata(args[0])
     elif rectype == "AAAA":
         rd = dns.rdtypes.IN.AAAA.AAAA(dns.rdataclass.IN, dns.rdatatype.AAAA, args[0])
+    elif rectype in _RDTYPES and rectype != "SOA":
+        rd = dns.rdata.from_text(dns.rdataclass.IN, _RDTYPES[rectype], args[0])
     else:
         raise ValueError("rectype not supported: %s" % rectype)
 
     return rd
 
 
+def _txt_rdata(text):
+    """Create a TXT rdata of `text`: either the text of the whole rdata,
+    each of its strings quoted, as given by `Records.items`, or a single
+    unquoted string."""
+    if len(text) > 1 and text[0] == text[-1] == '"':
+        try:
+            return dns.rdata.from_text(dns.rdataclass.IN, dns.rdatatype.TXT, text)
+        except dns.exception.SyntaxError:
+            # Not rdata text; take it as a single string in quotes
+            text = text[1:-1]
+    return dns.rdtypes.ANY.TXT.TXT(dns.rdataclass.IN, dns.rdatatype.TXT, text)
+
+
+def _copy_node(node):
+    """Return a copy of the dns.node.Node `node` whose rdatasets can be
+    changed without changing those of `node`, and a dict of the id of each
+    rdataset of `node` to its copy."""
+    new = node.__class__()
+    rdatasets = {}
+    for rds in node.rdatasets:
+        rds_copy = rds.copy()
+        if rds.rdtype == dns.rdatatype.SOA:
+            # The only rdatas which are changed in place
+            rds_copy.items = [copy.copy(rd) for rd in rds.items]
+        new.rdatasets.append(rds_copy)
+        rdatasets[id(rds)] = rds_copy
+    return new, rdatasets
+
+
 def soa_from_node(node):
     _soa_rec = node.get_rdataset(dns.rdataclass.IN, dns.rdatatype.SOA)
     if _soa_rec:
@@ -0,0 +1,308 @@
+# encoding: utf-8
+
+"""instrument
+
+Hooks for timing the work done by dnszone: loading and saving zones,
+checking them and asking named to reload them.  A hook is told when each
+operation starts and finishes, with the zone, file, byte and record
+counts, subprocess exit codes and how long it took.  With no hook added
+the operations cost next to nothing extra.
+
+MetricsCollector is a hook which totals the operations, to be written as
+a Prometheus textfile or a JSON summary.
+
+Example::
+
+    >>> from dnszone import instrument
+    >>> metrics = instrument.MetricsCollector()
+    >>> instrument.add_hook(metrics)
+    >>> zone = zone_from_file('example.com', '/var/named/zones/example.com')
+    >>> zone.save(autoserial=True)
+    >>> metrics.summary()['load']
+    {'count': 1, 'errors': 0, 'seconds_total': 0.0021, 'seconds_max': 0.0021,
+     'bytes_total': 1024, 'records_total': 13, 'exit_codes': {}}
+    >>> metrics.write_prometheus('/var/lib/node_exporter/dnszone.prom')
+    >>>
+    >>> class SlowZones(instrument.Hook):
+    ...     def finish(self, op):
+    ...         if op.duration > 1.0:
+    ...             print(op.name, op.attrs.get('zone'), op.duration)
+    ...
+    >>> instrument.add_hook(SlowZones())
+"""
+
+__author__ = "Greg Hellings"
+__copyright__ = "(c) Greg Hellings 2019"
+__id__ = "$Id$"
+__url__ = "$URL$"
+__version__ = "1.0"
+
+
+# ---- Imports ----
+
+# - Python Modules -
+import json
+import os
+import tempfile
+import threading
+import warnings
+from time import perf_counter
+
+# ---- Constants ----
+
+# Upper bounds, in seconds, of the buckets of the duration histograms
+BUCKETS = (0.001, 0.01, 0.1, 1.0, 10.0, 60.0)
+
+# The hooks added, replaced rather than changed so it can be read safely
+# from any thread
+_hooks = ()
+_hooks_lock = threading.Lock()
+
+# ---- Classes ----
+
+
+class Hook(object):
+    """Base class for hooks, which need only define the methods they use.
+
+    Both are called with the Operation, from the thread running it.  An
+    exception raised by a hook is turned into a warning, so that it does
+    not break the operation.
+    """
+
+    def start(self, op):
+        """Called as the operation `op` starts."""
+
+    def finish(self, op):
+        """Called when the operation `op` has finished or failed."""
+
+
+class Operation(object):
+    """A timed operation, as passed to hooks.
+
+    `name` : what is being done: 'load', 'save', 'stage', 'check',
+    'reload' or 'reload_all'.
+    `attrs` : dict of details, such as 'zone', 'filename', 'bytes',
+    'records', 'returncode' or 'valid'; which are present depends on the
+    operation and how far it got.
+    `duration` : seconds taken, once finished.
+    `error` : the exception which ended the operation, if any.
+    """
+
+    __slots__ = ("name", "attrs", "duration", "error", "_hooks", "_start")
+
+    def __init__(self, name, attrs, hooks):
+        self.name = name
+        self.attrs = attrs
+        self.duration = None
+        self.error = None
+        self._hooks = hooks
+
+    def __bool__(self):
+        return True
+
+    def set(self, **attrs):
+        """Add details to the operation."""
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        _call(self._hooks, "start", self)
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.duration = perf_counter() - self._start
+        self.error = exc_value
+        _call(self._hooks, "finish", self)
+        return False
+
+
+class _NoOperation(object):
+    """Stands in for an Operation when there are no hooks.  It is false, so
+    details which cost something to find can be skipped with `if op:`."""
+
+    __slots__ = ()
+
+    def __bool__(self):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NO_OPERATION = _NoOperation()
+
+
+class MetricsCollector(Hook):
+    """A hook which totals the operations by name: how many there were,
+    how many failed, their durations, bytes and records, and the exit
+    codes of the subprocesses they ran.
+    """
+
+    def __init__(self, namespace="dnszone"):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def finish(self, op):
+        attrs = op.attrs
+        with self._lock:
+            stats = self._stats.get(op.name)
+            if stats is None:
+                stats = self._stats[op.name] = {
+                    "count": 0,
+                    "errors": 0,
+                    "seconds_total": 0.0,
+                    "seconds_max": 0.0,
+                    "bytes_total": 0,
+                    "records_total": 0,
+                    "exit_codes": {},
+                    "buckets": [0] * len(BUCKETS),
+                }
+            stats["count"] += 1
+            if op.error is not None:
+                stats["errors"] += 1
+            stats["seconds_total"] += op.duration
+            stats["seconds_max"] = max(stats["seconds_max"], op.duration)
+            stats["bytes_total"] += attrs.get("bytes") or 0
+            stats["records_total"] += attrs.get("records") or 0
+            code = attrs.get("returncode")
+            if code is not None:
+                stats["exit_codes"][code] = stats["exit_codes"].get(code, 0) + 1
+            buckets = stats["buckets"]
+            for index, bound in enumerate(BUCKETS):
+                if op.duration <= bound:
+                    buckets[index] += 1
+
+    def reset(self):
+        """Forget everything collected so far."""
+        with self._lock:
+            self._stats = {}
+
+    def summary(self):
+        """Return a dict of operation name to its totals."""
+        with self._lock:
+            summary = {}
+            for name, stats in self._stats.items():
+                stats = dict(stats, exit_codes=dict(stats["exit_codes"]))
+                del stats["buckets"]
+                summary[name] = stats
+            return summary
+
+    def write_json(self, filename):
+        """Write the summary to `filename` as JSON."""
+        _write_file(filename, json.dumps(self.summary(), indent=2, sort_keys=True))
+
+    def prometheus(self):
+        """Return the totals in the Prometheus text exposition format."""
+        ns = self.namespace
+        lines = []
+
+        def metric(name, kind, text):
+            lines.append("# HELP %s_%s %s" % (ns, name, text))
+            lines.append("# TYPE %s_%s %s" % (ns, name, kind))
+
+        with self._lock:
+            stats = sorted(self._stats.items())
+            metric("operation_seconds", "histogram", "Duration of operations.")
+            for name, s in stats:
+                for bound, count in zip(BUCKETS, s["buckets"]):
+                    lines.append(
+                        '%s_operation_seconds_bucket{operation="%s",le="%s"} %d'
+                        % (ns, name, bound, count)
+                    )
+                lines.append(
+                    '%s_operation_seconds_bucket{operation="%s",le="+Inf"} %d'
+                    % (ns, name, s["count"])
+                )
+                lines.append(
+                    '%s_operation_seconds_sum{operation="%s"} %r'
+                    % (ns, name, s["seconds_total"])
+                )
+                lines.append(
+                    '%s_operation_seconds_count{operation="%s"} %d'
+                    % (ns, name, s["count"])
+                )
+            for key, text in (
+                ("errors", "Operations which raised an exception."),
+                ("bytes", "Bytes of zone files read or written."),
+                ("records", "Records loaded or saved."),
+            ):
+                metric("operation_%s_total" % key, "counter", text)
+                for name, s in stats:
+                    value = s[key] if key == "errors" else s[key + "_total"]
+                    lines.append(
+                        '%s_operation_%s_total{operation="%s"} %d'
+                        % (ns, key, name, value)
+                    )
+            metric("subprocess_exits_total", "counter", "Subprocess exit codes.")
+            for name, s in stats:
+                for code, count in sorted(s["exit_codes"].items()):
+                    lines.append(
+                        '%s_subprocess_exits_total{operation="%s",code="%d"} %d'
+                        % (ns, name, code, count)
+                    )
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, filename):
+        """Write the totals to `filename` for node_exporter's textfile
+        collector.  The file is replaced atomically, so it is never read
+        half written."""
+        _write_file(filename, self.prometheus())
+
+
+# ---- Module Functions ----
+
+
+def add_hook(hook):
+    """Start passing operations to `hook`, a Hook."""
+    global _hooks
+    with _hooks_lock:
+        _hooks = _hooks + (hook,)
+
+
+def remove_hook(hook):
+    """Stop passing operations to `hook`."""
+    global _hooks
+    with _hooks_lock:
+        _hooks = tuple(h for h in _hooks if h is not hook)
+
+
+def operation(name, **attrs):
+    """Return a context manager timing the operation `name`, with the
+    details `attrs`, for the hooks.  If there are none, a stand-in which
+    does nothing is returned."""
+    hooks = _hooks
+    if not hooks:
+        return _NO_OPERATION
+    return Operation(name, attrs, hooks)
+
+
+def _call(hooks, method, op):
+    for hook in hooks:
+        try:
+            getattr(hook, method)(op)
+        except Exception as e:
+            warnings.warn(
+                "instrument hook %r failed: %s" % (hook, e), RuntimeWarning, 2
+            )
+
+
+def _write_file(filename, text):
+    """Replace `filename` with `text` atomically."""
+    fd, tmpname = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(filename)), prefix=".metrics-"
+    )
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.chmod(tmpname, 0o644)
+        os.replace(tmpname, filename)
+    except BaseException:
+        os.unlink(tmpname)
+        raise
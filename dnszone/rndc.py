@@ -0,0 +1,353 @@
+# encoding: utf-8
+
+"""rndc
+
+A client for named's control channel, speaking the rndc protocol directly
+so that many commands can be sent over one authenticated connection
+without running the 'rndc' binary for each of them.
+
+Example::
+
+    >>> from dnszone.rndc import RndcClient
+    >>> client = RndcClient.from_key_file('/etc/rndc.key')
+    >>> client.reload('example.com')
+    'zone reload queued'
+    >>> for zone in ('example.net', 'example.org'):
+    ...     client.notify(zone)
+    ...
+    'zone notify queued'
+    'zone notify queued'
+    >>> client.close()
+    >>>
+    >>> from dnszone.zone_reload import ZoneReload
+    >>> r = ZoneReload(client=RndcClient.from_key_file('/etc/rndc.key'))
+    >>> r.reload('example.com')
+"""
+
+__author__ = "Greg Hellings"
+__copyright__ = "(c) Greg Hellings 2019"
+__id__ = "$Id$"
+__url__ = "$URL$"
+__version__ = "1.0"
+
+
+# ---- Imports ----
+
+# - Python Modules -
+import base64
+import hashlib
+import hmac
+import re
+import socket
+import struct
+import threading
+from itertools import count
+from time import time
+
+# ---- Constants ----
+
+DEFAULT_PORT = 953
+
+# Value types of the control channel's serialisation (lib/isccc)
+_BINARY = 1
+_TABLE = 2
+_LIST = 3
+
+_UINT32 = struct.Struct(">I")
+_VALUE = struct.Struct(">BI")
+
+# name -> (algorithm number, hash)
+ALGORITHMS = {
+    "hmac-md5": (157, hashlib.md5),
+    "hmac-sha1": (161, hashlib.sha1),
+    "hmac-sha224": (162, hashlib.sha224),
+    "hmac-sha256": (163, hashlib.sha256),
+    "hmac-sha384": (164, hashlib.sha384),
+    "hmac-sha512": (165, hashlib.sha512),
+}
+# HMAC-MD5 signatures are sent as 22 characters of base64, the others as
+# the algorithm number and 88 characters of zero padded base64
+_HMD5_LENGTH = 22
+_HSHA_LENGTH = 88
+
+# How long a request stays valid, in seconds
+_EXPIRY = 60
+
+_KEY_RE = re.compile(r'\bkey\s+"?([^"\s{]+)"?\s*\{(.*?)\}\s*;', re.S)
+_ALGORITHM_RE = re.compile(r"\balgorithm\s+\"?([\w-]+)\"?\s*;")
+_SECRET_RE = re.compile(r'\bsecret\s+"([^"]+)"\s*;')
+
+# ---- Exceptions ----
+
+
+class RndcError(Exception):
+    """An error from the control channel or the command sent over it."""
+
+
+# ---- Classes ----
+
+
+class RndcClient(object):
+    """A connection to named's control channel.
+
+    `host`, `port` : address of the control channel.
+    `secret` : the base64 secret of the rndc key, as found in rndc.key.
+    `algorithm` : the key's algorithm, one of ALGORITHMS.
+    `timeout` : socket timeout in seconds.
+
+    The connection is opened on first use and kept open for the commands
+    that follow, so the authentication handshake is only made once.  If
+    the connection has been dropped, e.g. because named restarted, it is
+    opened again and the command retried once.  A client may be shared
+    between threads; commands are sent one at a time.
+    """
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=DEFAULT_PORT,
+        secret=None,
+        algorithm="hmac-sha256",
+        timeout=10,
+    ):
+        if algorithm not in ALGORITHMS:
+            raise RndcError("Unsupported algorithm: %s" % algorithm)
+        if secret is None:
+            raise RndcError("An rndc key secret is required")
+        self.host = host
+        self.port = port
+        self.algorithm = algorithm
+        self.timeout = timeout
+        self._secret = base64.b64decode(secret)
+        self._sock = None
+        self._nonce = None
+        self._serial = count(int(time()) & 0xFFFFFF)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_key_file(cls, filename, host="127.0.0.1", port=DEFAULT_PORT, key=None):
+        """Create a client using a key from an rndc.key or rndc.conf style
+        file.  `key` names the key to use; by default the first one."""
+        with open(filename, "r") as f:
+            text = f.read()
+        for match in _KEY_RE.finditer(text):
+            if key is not None and match.group(1) != key:
+                continue
+            body = match.group(2)
+            algorithm = _ALGORITHM_RE.search(body)
+            secret = _SECRET_RE.search(body)
+            if algorithm is None or secret is None:
+                raise RndcError("Incomplete key %s in %s" % (match.group(1), filename))
+            return cls(
+                host,
+                port,
+                secret=secret.group(1),
+                algorithm=algorithm.group(1).lower(),
+            )
+        raise RndcError("No key found in %s" % filename)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Close the connection, if it is open."""
+        with self._lock:
+            self._disconnect()
+
+    def _disconnect(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            finally:
+                self._sock = None
+                self._nonce = None
+
+    def call(self, command):
+        """Send `command`, e.g. 'reload example.com', and return named's
+        reply text.  Raises RndcError if the command failed."""
+        with self._lock:
+            try:
+                try:
+                    reply = self._call(command)
+                except (socket.error, EOFError):
+                    # The connection may simply have gone stale; try once more
+                    self._disconnect()
+                    try:
+                        reply = self._call(command)
+                    except (socket.error, EOFError) as e:
+                        raise RndcError("%s:%d: %s" % (self.host, self.port, e))
+            except Exception:
+                # Leave no half finished exchange on the connection
+                self._disconnect()
+                raise
+
+        data = reply.get(b"_data", {})
+        text = data.get(b"text", b"").decode("utf-8", "replace")
+        if data.get(b"result", b"0") != b"0":
+            error = data.get(b"err", b"").decode("utf-8", "replace")
+            raise RndcError(error or text or "rndc command failed: %s" % command)
+        return text
+
+    def reload(self, zone):
+        """Reload `zone` from its file."""
+        return self.call("reload %s" % zone)
+
+    def reload_all(self):
+        """Reload the configuration and every zone."""
+        return self.call("reload")
+
+    def refresh(self, zone):
+        """Schedule maintenance of the secondary zone `zone`."""
+        return self.call("refresh %s" % zone)
+
+    def notify(self, zone):
+        """Resend NOTIFY messages for `zone`."""
+        return self.call("notify %s" % zone)
+
+    def _call(self, command):
+        if self._sock is None:
+            self._sock = socket.create_connection((self.host, self.port), self.timeout)
+            # The first message of a connection only establishes the nonce
+            reply = self._exchange("null")
+            nonce = reply.get(b"_ctrl", {}).get(b"_nonce")
+            if nonce is None:
+                raise RndcError("No nonce from %s:%d" % (self.host, self.port))
+            self._nonce = nonce
+        return self._exchange(command)
+
+    def _exchange(self, command):
+        now = int(time())
+        ctrl = {
+            "_ser": str(next(self._serial)),
+            "_tim": str(now),
+            "_exp": str(now + _EXPIRY),
+        }
+        if self._nonce is not None:
+            ctrl["_nonce"] = self._nonce
+        message = {"_ctrl": ctrl, "_data": {"type": command}}
+        self._sock.sendall(encode_message(message, self._secret, self.algorithm))
+        reply = read_message(self._sock, self._secret, self.algorithm)
+        if reply.get(b"_ctrl", {}).get(b"_ser") != ctrl["_ser"].encode("ascii"):
+            raise RndcError("Reply does not match request %s" % ctrl["_ser"])
+        return reply
+
+
+# ---- Module Functions ----
+
+
+def encode_message(message, secret, algorithm):
+    """Serialise the dict `message` for the control channel, signed with
+    the key `secret` (bytes) using `algorithm`.  Any `_auth` entry of the
+    message is replaced."""
+    body = _encode_table(
+        dict((key, value) for key, value in message.items() if key != "_auth")
+    )
+    auth = {"_auth": _sign(body, secret, algorithm)}
+    data = _UINT32.pack(1) + _encode_table(auth) + body
+    return _UINT32.pack(len(data)) + data
+
+
+def decode_message(data, secret, algorithm):
+    """Parse and verify a message from the control channel, as returned by
+    encode_message without its length prefix.  Keys and values in the
+    returned dict are bytes."""
+    (version,) = _UINT32.unpack_from(data, 0)
+    if version != 1:
+        raise RndcError("Unknown control channel version %d" % version)
+    table, signed = _decode_table(data, 4, len(data))
+    auth = table.get(b"_auth")
+    if not isinstance(auth, dict) or signed is None:
+        raise RndcError("Unsigned control channel message")
+    expected = _sign(data[signed:], secret, algorithm)
+    for key, value in expected.items():
+        received = auth.get(key.encode("ascii"), b"")
+        if not hmac.compare_digest(received, value):
+            raise RndcError("Bad control channel message signature")
+    return table
+
+
+def read_message(sock, secret, algorithm):
+    """Read one message from the socket `sock` and return it as
+    decode_message."""
+    (length,) = _UINT32.unpack(_recv_exactly(sock, 4))
+    return decode_message(_recv_exactly(sock, length), secret, algorithm)
+
+
+def _recv_exactly(sock, length):
+    chunks = []
+    while length:
+        chunk = sock.recv(length)
+        if not chunk:
+            raise EOFError("Connection closed by the control channel")
+        chunks.append(chunk)
+        length -= len(chunk)
+    return b"".join(chunks)
+
+
+def _sign(body, secret, algorithm):
+    """Return the `_auth` table for the signed part of a message."""
+    number, digestmod = ALGORITHMS[algorithm]
+    digest = base64.b64encode(hmac.new(secret, body, digestmod).digest())
+    if algorithm == "hmac-md5":
+        return {"hmd5": digest[:_HMD5_LENGTH]}
+    return {"hsha": struct.pack("B", number) + digest.ljust(_HSHA_LENGTH, b"\0")}
+
+
+def _encode_table(table):
+    out = []
+    for key, value in table.items():
+        if not isinstance(key, bytes):
+            key = key.encode("ascii")
+        out.append(struct.pack("B", len(key)))
+        out.append(key)
+        out.append(_encode_value(value))
+    return b"".join(out)
+
+
+def _encode_value(value):
+    if isinstance(value, dict):
+        kind, data = _TABLE, _encode_table(value)
+    elif isinstance(value, (list, tuple)):
+        kind, data = _LIST, b"".join(_encode_value(item) for item in value)
+    else:
+        if not isinstance(value, bytes):
+            value = str(value).encode("utf-8")
+        kind, data = _BINARY, value
+    return _VALUE.pack(kind, len(data)) + data
+
+
+def _decode_value(data, pos, end):
+    kind, length = _VALUE.unpack_from(data, pos)
+    start = pos + _VALUE.size
+    pos = start + length
+    if pos > end:
+        raise RndcError("Truncated control channel message")
+    if kind == _TABLE:
+        value = _decode_table(data, start, pos)[0]
+    elif kind == _LIST:
+        value = []
+        while start < pos:
+            item, start = _decode_value(data, start, pos)
+            value.append(item)
+    else:
+        value = data[start:pos]
+    return value, pos
+
+
+def _decode_table(data, pos, end):
+    """Decode the table in `data[pos:end]`, returning the dict and the
+    offset just past its first entry if that is `_auth`."""
+    table = {}
+    signed = None
+    while pos < end:
+        start = pos + 1
+        pos = start + data[pos]
+        key = data[start:pos]
+        value, pos = _decode_value(data, pos, end)
+        if key == b"_auth" and not table:
+            signed = pos
+        table[key] = value
+    return table, signed
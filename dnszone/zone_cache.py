@@ -0,0 +1,377 @@
+# encoding: utf-8
+
+"""zone_cache
+
+A cache of parsed zones stored as compact binary snapshots, so that a zone
+file which has not changed does not have to be parsed again as text.
+
+Example::
+
+    >>> from dnszone.dnszone import zone_from_file
+    >>> from dnszone.zone_cache import ZoneCache
+    >>> cache = ZoneCache('/var/cache/dnszone', max_entries=500)
+    >>> z = zone_from_file('example.com', '/var/named/zones/example.com',
+    ...                    cache=cache)
+    >>> cache.verify_all()
+    []
+"""
+
+__author__ = "Greg Hellings"
+__copyright__ = "(c) Greg Hellings 2019"
+__id__ = "$Id$"
+__url__ = "$URL$"
+__version__ = "1.0"
+
+
+# ---- Imports ----
+
+# - Python Modules -
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+from io import BytesIO
+
+# - dnspython Modules - http://www.dnspython.org/
+import dns.name
+import dns.rdata
+import dns.rdataclass
+import dns.rdatatype
+import dns.rdtypes.IN.A
+import dns.rdtypes.IN.AAAA
+import dns.zone
+
+# ---- Constants ----
+
+MAGIC = b"DNSZSNAP"
+FORMAT_VERSION = 3
+
+# magic, format version, source size, source mtime (ns), source sha256;
+# followed by the zone name and source path as length-prefixed strings
+_HEADER = struct.Struct(">8sBQQ32s")
+_LENGTH = struct.Struct(">H")
+_RDATASET = struct.Struct(">HHII")
+
+# Address records keep the text they were read from, which the wire format
+# would lose (e.g. '0000:...:0001' would come back as '::1'), so these are
+# stored as their text
+_ADDRESS_CLASSES = {
+    dns.rdatatype.A: dns.rdtypes.IN.A.A,
+    dns.rdatatype.AAAA: dns.rdtypes.IN.AAAA.AAAA,
+}
+
+# ---- Classes ----
+
+
+class ZoneCache(object):
+    """A directory of binary zone snapshots, keyed by zone name and the
+    path of the zone file they were parsed from.
+
+    A snapshot is reused while the source file has the same size and
+    modification time.  If only the modification time differs the file's
+    content hash is compared before the snapshot is discarded.  Files
+    pulled in by `$INCLUDE` are not tracked.
+
+    `cache_dir` : directory to hold the snapshots, created if needed.
+    `max_entries` : optional limit on the number of snapshots kept.
+    `max_bytes` : optional limit on the total size of the snapshots.
+
+    When a limit is exceeded the least recently used snapshots are evicted.
+    """
+
+    def __init__(self, cache_dir, max_entries=None, max_bytes=None):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def _path(self, domain, filename):
+        key = "%s\0%s" % (domain, os.path.abspath(filename))
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest + ".snap")
+
+    def load(self, domain, filename):
+        """Return the cached dns.zone.Zone for `filename`, or None if there
+        is no usable snapshot."""
+        path = self._path(domain, filename)
+        try:
+            st = os.stat(filename)
+            f = open(path, "rb")
+        except (IOError, OSError):
+            return None
+
+        with f:
+            header = _read_header(f)
+            if header is None:
+                return None
+            size, mtime, digest, _, _, offset = header
+            if size != st.st_size:
+                return None
+            if mtime != st.st_mtime_ns:
+                if _file_hash(filename) != digest:
+                    return None
+                # Same content, just touched; remember the new mtime
+                _write_header(f.name, st.st_size, st.st_mtime_ns, digest)
+            try:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    zone = loads_zone(data, offset)
+            except Exception:
+                return None
+
+        # Record the hit for LRU eviction
+        try:
+            os.utime(path, None)
+        except FileNotFoundError:
+            # Evicted by another process meanwhile
+            pass
+        return zone
+
+    def source_state(self, filename):
+        """Return the (size, mtime, content hash) of `filename`, to be taken
+        before the file is parsed and handed to `store`."""
+        st = os.stat(filename)
+        return st.st_size, st.st_mtime_ns, _file_hash(filename)
+
+    def store(self, domain, filename, zone, state=None):
+        """Write a snapshot of the dns.zone.Zone `zone` parsed from
+        `filename`.
+
+        `state` is the `source_state` of the file from before it was parsed;
+        if not given it is taken from the file now.
+        """
+        if state is None:
+            state = self.source_state(filename)
+        size, mtime, digest = state
+
+        header = (
+            _HEADER.pack(MAGIC, FORMAT_VERSION, size, mtime, digest)
+            + _pack_string(domain)
+            + _pack_string(os.path.abspath(filename))
+        )
+        fd, tmpname = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(header)
+                f.write(dumps_zone(zone))
+            os.rename(tmpname, self._path(domain, filename))
+        except Exception:
+            os.unlink(tmpname)
+            raise
+
+        self.evict()
+
+    def invalidate(self, domain, filename):
+        """Remove the snapshot for `filename`, if there is one."""
+        try:
+            os.unlink(self._path(domain, filename))
+        except OSError:
+            pass
+
+    def entries(self):
+        """Return the snapshot paths, least recently used first."""
+        paths = []
+        for entry in os.listdir(self.cache_dir):
+            if entry.endswith(".snap"):
+                path = os.path.join(self.cache_dir, entry)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    # Evicted by another process meanwhile
+                    continue
+                paths.append((st.st_mtime, path, st.st_size))
+        paths.sort()
+        return [(path, size) for _, path, size in paths]
+
+    def evict(self):
+        """Remove least recently used snapshots until the cache is within
+        its limits."""
+        entries = self.entries()
+        total = sum(size for _, size in entries)
+        while entries and (
+            (self.max_entries is not None and len(entries) > self.max_entries)
+            or (self.max_bytes is not None and total > self.max_bytes)
+        ):
+            path, size = entries.pop(0)
+            _unlink(path)
+            total -= size
+
+    def verify(self, domain, filename):
+        """Check the snapshot for `filename` against the file's content hash,
+        removing it if it is stale.  Returns True if the snapshot is valid."""
+        return self._verify(self._path(domain, filename))
+
+    def verify_all(self):
+        """Check every snapshot against the content hash of its source file,
+        removing the stale ones.  Returns the list of removed paths."""
+        return [path for path, _ in self.entries() if not self._verify(path)]
+
+    def _verify(self, path):
+        try:
+            with open(path, "rb") as f:
+                header = _read_header(f)
+        except (IOError, OSError):
+            return False
+
+        if header is not None:
+            try:
+                if _file_hash(header[4]) == header[2]:
+                    return True
+            except (IOError, OSError):
+                pass
+
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+        return False
+
+    def clear(self):
+        """Remove every snapshot."""
+        for path, _ in self.entries():
+            _unlink(path)
+
+
+# ---- Module Functions ----
+
+
+def dumps_zone(zone):
+    """Serialise the dns.zone.Zone `zone` to bytes.
+
+    The zone origin is written first, then each node as its owner name
+    followed by its rdatasets, all in uncompressed wire format; except that
+    addresses are written as text, so they read back exactly as they were.
+    """
+    out = BytesIO()
+    write = out.write
+
+    def write_name(name):
+        wire = name.to_wire()
+        write(_LENGTH.pack(len(wire)))
+        write(wire)
+
+    write_name(zone.origin)
+    for name, node in zone.nodes.items():
+        write_name(name)
+        write(_LENGTH.pack(len(node.rdatasets)))
+        for rds in node.rdatasets:
+            write(_RDATASET.pack(rds.rdtype, rds.covers, rds.ttl, len(rds)))
+            for rd in rds:
+                if rds.rdtype in _ADDRESS_CLASSES:
+                    wire = rd.address.encode("ascii")
+                else:
+                    buf = BytesIO()
+                    rd.to_wire(buf)
+                    wire = buf.getvalue()
+                write(_LENGTH.pack(len(wire)))
+                write(wire)
+    return out.getvalue()
+
+
+def loads_zone(data, offset=0):
+    """Build a dns.zone.Zone from the output of `dumps_zone`, starting at
+    `offset` into `data` (bytes or an mmap)."""
+    unpack_len = _LENGTH.unpack_from
+    unpack_rds = _RDATASET.unpack_from
+    rdata_from_wire = dns.rdata.from_wire
+    IN = dns.rdataclass.IN
+
+    def read_name(pos):
+        (length,) = unpack_len(data, pos)
+        start = pos + 2
+        pos = start + length
+        return _name_from_wire(data[start:pos]), pos
+
+    origin, pos = read_name(offset)
+    zone = dns.zone.Zone(origin, relativize=False)
+    nodes = zone.nodes
+    end = len(data)
+    while pos < end:
+        name, pos = read_name(pos)
+        node = zone.node_factory()
+        (count,) = unpack_len(data, pos)
+        pos += 2
+        for _ in range(count):
+            rdtype, covers, ttl, items = unpack_rds(data, pos)
+            pos += _RDATASET.size
+            rds = node.find_rdataset(IN, rdtype, covers, True)
+            rds.ttl = ttl
+            address_class = _ADDRESS_CLASSES.get(rdtype)
+            for _ in range(items):
+                (length,) = unpack_len(data, pos)
+                start = pos + 2
+                pos = start + length
+                # Snapshots hold no duplicates, so skip Rdataset.add's checks
+                if address_class is not None:
+                    text = bytes(data[start:pos]).decode("ascii")
+                    rds.items.append(address_class(IN, rdtype, text))
+                else:
+                    rds.items.append(
+                        rdata_from_wire(IN, rdtype, data[start:pos], 0, length)
+                    )
+        nodes[name] = node
+    return zone
+
+
+def _name_from_wire(wire):
+    """Decode an uncompressed wire format name; much quicker than
+    dns.name.from_wire, which has to allow for compression."""
+    labels = []
+    pos = 0
+    while True:
+        length = wire[pos]
+        start = pos + 1
+        pos = start + length
+        labels.append(wire[start:pos])
+        if not length:
+            return dns.name.Name(labels)
+
+
+def _read_header(f):
+    """Return (size, mtime, digest, domain, filename, body offset) from the
+    header of an open snapshot, or None if it is not a usable snapshot,
+    e.g. one cut short or corrupted."""
+    data = f.read(_HEADER.size)
+    if len(data) != _HEADER.size:
+        return None
+    magic, version, size, mtime, digest = _HEADER.unpack(data)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        return None
+    strings = []
+    try:
+        for _ in range(2):
+            (length,) = _LENGTH.unpack(f.read(_LENGTH.size))
+            value = f.read(length)
+            if len(value) != length:
+                return None
+            strings.append(value.decode("utf-8"))
+    except (struct.error, UnicodeDecodeError):
+        return None
+    return size, mtime, digest, strings[0], strings[1], f.tell()
+
+
+def _pack_string(value):
+    value = value.encode("utf-8")
+    return _LENGTH.pack(len(value)) + value
+
+
+def _write_header(path, size, mtime, digest):
+    with open(path, "r+b") as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, size, mtime, digest))
+
+
+def _unlink(path):
+    """Remove `path`, unless another process already has."""
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def _file_hash(filename):
+    h = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.digest()
@@ -20,6 +20,24 @@ Example::
     >>> c.isValid('example.com', '/var/named/zones/example.com')
     True
     >>>
+    >>> results = c.check_many([('example.com', '/var/named/zones/example.com'),
+    ...                         ('foo.com', '/var/named/zones/example.com')],
+    ...                        workers=8)
+    >>> [r.valid for r in results]
+    [True, False]
+    >>> results[1].error
+    'zone foo.com/IN: has no NS records'
+    >>>
+    >>> from dnszone.zone_check import CheckCache
+    >>> c = ZoneCheck(cache=CheckCache('/var/cache/dnszone/checks'))
+    >>> c.isValid('example.com', '/var/named/zones/example.com')
+    True
+    >>> c.isValid('example.com', '/var/named/zones/example.com')  # no fork
+    True
+    >>>
+    >>> c = ZoneCheck(engine='native')  # no named-checkzone needed
+    >>> c.isValid('foo.com', '/var/named/zones/example.com')
+    False
 """
 
 __author__ = "Greg Hellings"
@@ -32,13 +50,126 @@ __version__ = "1.0"
 # ---- Imports ----
 
 # - Python Modules -
+import hashlib
+import os
+import shutil
 import subprocess
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+
+from . import instrument, zone_validate
 
 # ---- Exceptions ----
 
 
 # ---- Classes ----
 
+CheckResult = namedtuple(
+    "CheckResult", ["zonename", "filename", "valid", "error", "duration"]
+)
+CheckResult.__doc__ = """The outcome of checking one zone file: `valid` is True
+if it passed, `error` holds named-checkzone's output if it did not, and
+`duration` is the time taken in seconds."""
+
+
+class CheckCache(object):
+    """A directory recording the zone files which have passed
+    named-checkzone, so that unchanged files need not be checked again.
+
+    Entries are keyed by the zone name, the SHA-256 of the file's content
+    and the identity of the named-checkzone binary, so editing the file or
+    upgrading BIND invalidates them.  Files pulled in by `$INCLUDE` are not
+    part of the key.
+
+    `cache_dir` : directory to hold the entries, created if needed.
+    `max_entries` : limit on the number of entries kept; the least
+    recently used are removed first.
+
+    A CheckCache may be used from several threads at once, as by
+    ZoneCheck.check_many, and several processes may share the directory.
+    """
+
+    def __init__(self, cache_dir, max_entries=10000):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self._count = None
+        self._lock = threading.Lock()
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def key(self, zonename, filename, binary):
+        """Return the cache key for checking `filename` as `zonename` with
+        the named-checkzone identified by `binary`."""
+        h = hashlib.sha256()
+        with open(filename, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        key = "%s\0%s\0%s" % (zonename.lower().rstrip("."), h.hexdigest(), binary)
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".ok")
+
+    def lookup(self, key):
+        """Return True if `key` has passed before."""
+        try:
+            # Record the hit for LRU eviction
+            os.utime(self._path(key), None)
+        except OSError:
+            return False
+        return True
+
+    def store(self, key):
+        """Record that `key` has passed."""
+        path = self._path(key)
+        with self._lock:
+            if os.path.exists(path):
+                os.utime(path, None)
+                return
+            open(path, "wb").close()
+            if self._count is None:
+                self._count = len(self.entries())
+            else:
+                self._count += 1
+            if self._count > self.max_entries:
+                self._evict()
+
+    def entries(self):
+        """Return the entry paths, least recently used first."""
+        paths = []
+        for entry in os.listdir(self.cache_dir):
+            if entry.endswith(".ok"):
+                path = os.path.join(self.cache_dir, entry)
+                try:
+                    paths.append((os.stat(path).st_mtime, path))
+                except FileNotFoundError:
+                    # Evicted by another process meanwhile
+                    pass
+        paths.sort()
+        return [path for _, path in paths]
+
+    def evict(self):
+        """Remove least recently used entries until the cache is within its
+        limit."""
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        entries = self.entries()
+        excess = max(len(entries) - self.max_entries, 0)
+        for path in entries[:excess]:
+            _unlink(path)
+        self._count = len(entries) - excess
+
+    def clear(self):
+        """Remove every entry."""
+        with self._lock:
+            for path in self.entries():
+                _unlink(path)
+            self._count = 0
+
 
 class ZoneCheck(object):
     """A wrapper around bind's named-checkzone utility, used for checking the
@@ -46,19 +177,73 @@ class ZoneCheck(object):
 
     `checkzone` : string containing path to named-checkzone binary.  Or leave
     as "named-checkzone" to search with default PATH.
+    `cache` : optional CheckCache; zone files which have passed before, and
+    not changed since, are not checked again unless `bypass_cache` is given.
+    `engine` : "checkzone" to run named-checkzone, or "native" to check the
+    zone in this process with zone_validate instead.
     """
 
-    def __init__(self, checkzone="checkzone"):
+    def __init__(self, checkzone="checkzone", cache=None, engine="checkzone"):
+        if engine not in ("checkzone", "native"):
+            raise ValueError("Unknown engine: %s" % engine)
         self.checkzone = checkzone
+        self.cache = cache
+        self.engine = engine
         self.error = None
+        self._binary = None
+
+    def _binary_id(self):
+        """Identify the named-checkzone binary by its path, size and
+        modification time, which change when BIND is upgraded."""
+        if self.engine == "native":
+            return "native:%s" % zone_validate.__version__
+        if self._binary is None:
+            path = shutil.which(self.checkzone) or self.checkzone
+            path = os.path.realpath(path)
+            st = os.stat(path)
+            self._binary = "%s:%d:%d" % (path, st.st_size, st.st_mtime_ns)
+        return self._binary
 
-    def isValid(self, zonename, filename):
+    def _cache_key(self, zonename, filename, bypass_cache):
+        """Return the cache key for a check, or None if it is not to be
+        cached."""
+        if self.cache is None or bypass_cache:
+            return None
+        try:
+            return self.cache.key(zonename, filename, self._binary_id())
+        except (IOError, OSError):
+            # Let named-checkzone report the missing file or binary
+            return None
+
+    def isValid(self, zonename, filename, bypass_cache=False):
         """Ask named to check the syntax of a zone file by calling the
         named-checkzone commmand.
         """
+        with instrument.operation(
+            "check", zone=zonename, filename=filename, engine=self.engine
+        ) as op:
+            valid = self._is_valid(zonename, filename, bypass_cache, op)
+            op.set(valid=valid)
+        return valid
+
+    def _is_valid(self, zonename, filename, bypass_cache, op):
+        key = self._cache_key(zonename, filename, bypass_cache)
+        if key is not None and self.cache.lookup(key):
+            op.set(cached=True)
+            self.error = None
+            return True
+
+        if self.engine == "native":
+            error = self._native_check(zonename, filename)
+            self.error = error
+            if error is None and key is not None:
+                self.cache.store(key)
+            return error is None
+
         cmd = [self.checkzone, "-q", zonename, filename]
 
         r = subprocess.call(cmd)
+        op.set(returncode=r)
 
         if r != 0:
             self.error = "Bad syntax"
@@ -66,4 +251,91 @@ class ZoneCheck(object):
 
         else:
             self.error = None
+            if key is not None:
+                self.cache.store(key)
             return True
+
+    def check(self, zonename, filename, bypass_cache=False):
+        """Check the syntax of a zone file with named-checkzone and return
+        a CheckResult.  Unlike isValid this leaves `error` alone, so it may
+        be used from several threads at once.
+        """
+        with instrument.operation(
+            "check", zone=zonename, filename=filename, engine=self.engine
+        ) as op:
+            result = self._check(zonename, filename, bypass_cache, op)
+            op.set(valid=result.valid)
+        return result
+
+    def _check(self, zonename, filename, bypass_cache, op):
+        start = monotonic()
+        key = self._cache_key(zonename, filename, bypass_cache)
+        if key is not None and self.cache.lookup(key):
+            op.set(cached=True)
+            return CheckResult(zonename, filename, True, None, monotonic() - start)
+
+        if self.engine == "native":
+            error = self._native_check(zonename, filename)
+            if error is None and key is not None:
+                self.cache.store(key)
+            return CheckResult(
+                zonename, filename, error is None, error, monotonic() - start
+            )
+
+        cmd = [self.checkzone, zonename, filename]
+        try:
+            proc = subprocess.run(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                universal_newlines=True,
+            )
+        except OSError as e:
+            return CheckResult(zonename, filename, False, str(e), monotonic() - start)
+        duration = monotonic() - start
+        op.set(returncode=proc.returncode)
+
+        if proc.returncode != 0:
+            error = proc.stdout.strip() or "Bad syntax"
+            return CheckResult(zonename, filename, False, error, duration)
+        if key is not None:
+            self.cache.store(key)
+        return CheckResult(zonename, filename, True, None, duration)
+
+    def _native_check(self, zonename, filename):
+        """Check a zone file with zone_validate, returning the errors found
+        as text, or None if there were none."""
+        errors = [
+            str(problem)
+            for problem in zone_validate.validate_file(zonename, filename)
+            if problem.severity == zone_validate.ERROR
+        ]
+        return "\n".join(errors) if errors else None
+
+    def check_many(self, pairs, workers=None, bypass_cache=False):
+        """Check many zone files at once.
+
+        `pairs` is an iterable of `(zonename, filename)`.  Up to `workers`
+        named-checkzone processes are run at a time, by default one per CPU.
+        Returns a list of CheckResult, in the same order as `pairs`.
+        """
+        pairs = list(pairs)
+        if workers is None:
+            workers = os.cpu_count() or 1
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(
+                executor.map(
+                    lambda pair: self.check(*pair, bypass_cache=bypass_cache), pairs
+                )
+            )
+
+
+# ---- Module Functions ----
+
+
+def _unlink(path):
+    """Remove `path`, unless another thread or process already has."""
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,188 @@
+# encoding: utf-8
+
+"""zone_deploy
+
+A pipeline to save, check and reload many modified zones at once.  Each
+zone moves through the stages on its own, so a slow zone does not hold up
+the others, and only zones which pass their check replace their files.
+
+Example::
+
+    >>> from dnszone.zone_check import ZoneCheck
+    >>> from dnszone.zone_deploy import ZoneDeployer
+    >>> deployer = ZoneDeployer(checker=ZoneCheck(engine='native'),
+    ...                         check_workers=8)
+    >>> report = deployer.deploy(zones, autoserial=True)
+    >>> report.deployed
+    ['example.com.', 'example.net.']
+    >>> report.failed
+    {'example.org.': ('check', "error: example.org./NS: zone has no NS records")}
+    >>> report.timings
+    {'write': 0.21, 'check': 0.05, 'promote': 0.002, 'reload': 0.3}
+"""
+
+__author__ = "Greg Hellings"
+__copyright__ = "(c) Greg Hellings 2019"
+__id__ = "$Id$"
+__url__ = "$URL$"
+__version__ = "1.0"
+
+
+# ---- Imports ----
+
+# - Python Modules -
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+
+from .zone_check import ZoneCheck
+from .zone_reload import ReloadScheduler, ZoneReload
+
+# ---- Constants ----
+
+STAGES = ("write", "check", "promote", "reload")
+
+# ---- Classes ----
+
+
+class DeployReport(object):
+    """The outcome of ZoneDeployer.deploy.
+
+    `deployed` : domains whose files were replaced and reloaded, in the
+    order they were given.
+    `failed` : dict of domain to `(stage, error)` for the zones that did
+    not make it, `stage` being the one of STAGES at which they failed and
+    `error` the check output or exception.  A zone that failed to reload
+    has still had its file replaced.
+    `timings` : dict of stage to the total seconds spent in it, over all
+    the zones.
+    `elapsed` : seconds taken by the whole deploy.
+    """
+
+    def __init__(self):
+        self.deployed = []
+        self.failed = {}
+        self.timings = dict.fromkeys(STAGES, 0.0)
+        self.elapsed = 0.0
+
+    def __repr__(self):
+        return "<DeployReport deployed=%d failed=%d elapsed=%.3fs>" % (
+            len(self.deployed),
+            len(self.failed),
+            self.elapsed,
+        )
+
+
+class ZoneDeployer(object):
+    """Saves, checks and reloads a set of modified zones.
+
+    `checker` : the ZoneCheck used to check each zone's new file; by
+    default a ZoneCheck().
+    `reloader` : the ZoneReload used to reload the zones; by default a
+    ZoneReload().
+    `write_workers`, `check_workers`, `reload_workers` : the most zones in
+    each of those stages at once.
+    `global_threshold` : reload every zone with one `reload_all` when more
+    than this many zones are deployed, see ReloadScheduler.
+    """
+
+    def __init__(
+        self,
+        checker=None,
+        reloader=None,
+        write_workers=4,
+        check_workers=4,
+        reload_workers=4,
+        global_threshold=None,
+    ):
+        self.checker = checker if checker is not None else ZoneCheck()
+        self.reloader = reloader if reloader is not None else ZoneReload()
+        self.write_workers = write_workers
+        self.check_workers = check_workers
+        self.reload_workers = reload_workers
+        self.global_threshold = global_threshold
+
+    def deploy(self, zones, autoserial=False, reload=True):
+        """Deploy the Zone objects in `zones` and return a DeployReport.
+
+        Each zone is written to a temporary file beside its own with
+        Zone.stage, updating the serial if `autoserial` is True, and
+        checked.  If it passes, the temporary file replaces the zone's
+        file; if not, it is removed and the zone is left as it was.  Once
+        every zone has been through, the replaced zones are reloaded
+        unless `reload` is False.
+        """
+        report = DeployReport()
+        start = monotonic()
+        lock = threading.Lock()
+        write_slots = threading.BoundedSemaphore(self.write_workers)
+        check_slots = threading.BoundedSemaphore(self.check_workers)
+        zones = list(zones)
+
+        def timed(stage, func, *args):
+            began = monotonic()
+            try:
+                return func(*args)
+            finally:
+                with lock:
+                    report.timings[stage] += monotonic() - began
+
+        def deploy_one(zone):
+            stage = "write"
+            try:
+                with write_slots:
+                    tmpname = timed(stage, zone.stage, autoserial)
+                stage = "check"
+                try:
+                    with check_slots:
+                        result = timed(stage, self.checker.check, zone.domain, tmpname)
+                except BaseException:
+                    zone.discard_staged()
+                    raise
+                if not result.valid:
+                    zone.discard_staged()
+                    return zone.domain, (stage, result.error)
+                stage = "promote"
+                timed(stage, zone.commit_staged)
+            except Exception as e:
+                return zone.domain, (stage, e)
+            return zone.domain, None
+
+        workers = max(self.write_workers + self.check_workers, 1)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            outcomes = list(executor.map(deploy_one, zones))
+
+        promoted = []
+        for domain, failure in outcomes:
+            if failure is None:
+                promoted.append(domain)
+            else:
+                report.failed[domain] = failure
+
+        reload_failed = set()
+        if reload and promoted:
+            began = monotonic()
+            # Queue every zone before flushing, so the threshold for a
+            # reload of every zone sees them all
+            scheduler = ReloadScheduler(
+                self.reloader,
+                debounce=3600,
+                max_concurrent=self.reload_workers,
+                global_threshold=self.global_threshold,
+            )
+            try:
+                for domain in promoted:
+                    scheduler.request(domain)
+                errors = scheduler.flush()
+            finally:
+                scheduler.close()
+            for domain, error in errors:
+                # A failed reload of every zone fails them all
+                for failed in promoted if domain is None else [domain]:
+                    report.failed[failed] = ("reload", error)
+                    reload_failed.add(failed)
+            report.timings["reload"] = monotonic() - began
+
+        report.deployed = [d for d in promoted if d not in reload_failed]
+        report.elapsed = monotonic() - start
+        return report
@@ -0,0 +1,422 @@
+# encoding: utf-8
+
+"""zone_reader
+
+A streaming reader for zone files.  Records are tokenised and handed
+back one at a time, so a zone file can be scanned without building a
+dns.zone.Zone holding every node in memory.
+
+Example::
+
+    >>> from dnszone.zone_reader import ZoneReader
+    >>> reader = ZoneReader('example.com', '/var/named/zones/example.com')
+    >>> for name, ttl, rdtype, rdata in reader:
+    ...     print(name, ttl, rdtype, rdata)
+    ...
+"""
+
+__author__ = "Greg Hellings"
+__copyright__ = "(c) Greg Hellings 2019"
+__id__ = "$Id$"
+__url__ = "$URL$"
+__version__ = "1.0"
+
+
+# ---- Imports ----
+
+# - Python Modules -
+import re
+import sys
+
+# - dnspython Modules - http://www.dnspython.org/
+import dns.exception
+import dns.grange
+import dns.name
+import dns.rdata
+import dns.rdataclass
+import dns.rdatatype
+import dns.rdtypes.ANY.SOA
+import dns.tokenizer
+import dns.ttl
+import dns.zone
+from six import string_types
+
+# ---- Constants ----
+
+# A `$` in a $GENERATE template, with its optional {offset,width,base}
+_GENERATE_MODIFIER = re.compile(r"\$(?:\{([+-]?\d+)(?:,(\d+)(?:,([doxX]))?)?\})?")
+
+# ---- Classes ----
+
+
+class ZoneReader(object):
+    """Reads the records of a zone file as a stream.
+
+    Iterating over a ZoneReader yields `(name, ttl, rdtype, rdata)` tuples,
+    where `name` is an absolute dns.name.Name, `rdtype` the integer record
+    type and `rdata` the parsed dns.rdata.Rdata.  `$ORIGIN`, `$TTL`,
+    `$INCLUDE` and `$GENERATE` are honoured in the same way as
+    dns.zone.from_file.
+
+    `types` : optional iterable of record types (e.g. 'A', 'MX') to return.
+    `under` : optional domain name; only names at or below it are returned.
+
+    Records that do not match the filters are skipped without parsing
+    their rdata.
+    """
+
+    def __init__(self, domain, filename, types=None, under=None, allow_include=True):
+        if isinstance(domain, string_types):
+            domain = dns.name.from_text(domain)
+        self.origin = domain
+        self.filename = filename
+        self.allow_include = allow_include
+
+        self.types = None
+        if types is not None:
+            self.types = set()
+            for rectype in types:
+                if isinstance(rectype, string_types):
+                    rectype = dns.rdatatype.from_text(rectype)
+                self.types.add(rectype)
+
+        if isinstance(under, string_types):
+            under = dns.name.from_text(under)
+        self.under = under
+
+        # Details of how the file was written, used to decide whether it
+        # can be updated in place; see Zone.save.
+        self.line_span = None
+        self.included = False
+        self.generated = False
+        # Names outside the zone whose records were skipped, as named does
+        self.out_of_zone = []
+        self.last_ttl_used = False
+        self.soa_ttl_used = False
+
+    def _wanted(self, name, rdtype):
+        if self.types is not None and rdtype not in self.types:
+            return False
+        if self.under is not None and not name.is_subdomain(self.under):
+            return False
+        return True
+
+    def __iter__(self):
+        with open(self.filename, "r") as f:
+            for record in self._read(f):
+                yield record
+
+    def read_zone(self, spans=None):
+        """Read the matching records into a new dns.zone.Zone.
+
+        Names are kept absolute, as with dns.zone.from_file(relativize=False).
+        No origin checks are made, as a filtered zone may legitimately have
+        no SOA or NS records.
+
+        If `spans` is a dict it is filled with the lines of the file holding
+        each name's records, as lists of [start, end) line number pairs keyed
+        by dns.name.Name.  Records from `$INCLUDE`d files have no span.
+        """
+        zone = dns.zone.Zone(self.origin, relativize=False)
+        nodes = zone.nodes
+        for name, ttl, rdtype, rd in self:
+            node = nodes.get(name)
+            if node is None:
+                node = zone.node_factory()
+                nodes[name] = node
+            rds = node.find_rdataset(dns.rdataclass.IN, rdtype, rd.covers(), True)
+            rds.add(rd, ttl)
+
+            if spans is not None and self.line_span is not None:
+                start, end = self.line_span
+                name_spans = spans.setdefault(name, [])
+                if name_spans and name_spans[-1][1] == start:
+                    name_spans[-1][1] = end
+                else:
+                    name_spans.append([start, end])
+        return zone
+
+    def _read(self, f):
+        self.tok = self._top_tok = dns.tokenizer.Tokenizer(f, self.filename)
+        self.current_origin = self.origin
+        self.last_name = self.origin
+        self.last_ttl = 0
+        self.last_ttl_known = False
+        self.default_ttl = 0
+        self.default_ttl_known = False
+        self.default_ttl_from_soa = False
+        saved_state = []
+        current_file = None
+
+        try:
+            while True:
+                token = self.tok.get(True, True)
+                if token.is_eof():
+                    if current_file is not None:
+                        current_file.close()
+                        current_file = None
+                    if saved_state:
+                        (
+                            self.tok,
+                            self.current_origin,
+                            self.last_name,
+                            current_file,
+                            self.last_ttl,
+                            self.last_ttl_known,
+                            self.default_ttl,
+                            self.default_ttl_known,
+                        ) = saved_state.pop(-1)
+                        continue
+                    break
+                elif token.is_eol():
+                    continue
+                elif token.is_comment():
+                    self.tok.get_eol()
+                    continue
+                elif token.value[0] == "$":
+                    c = token.value.upper()
+                    if c == "$TTL":
+                        token = self.tok.get()
+                        if not token.is_identifier():
+                            raise dns.exception.SyntaxError("bad $TTL")
+                        self.default_ttl = dns.ttl.from_text(token.value)
+                        self.default_ttl_known = True
+                        self.default_ttl_from_soa = False
+                        self.tok.get_eol()
+                    elif c == "$ORIGIN":
+                        self.current_origin = self.tok.get_name()
+                        self.tok.get_eol()
+                    elif c == "$INCLUDE" and self.allow_include:
+                        token = self.tok.get()
+                        filename = token.value
+                        token = self.tok.get()
+                        if token.is_identifier():
+                            new_origin = dns.name.from_text(
+                                token.value, self.current_origin
+                            )
+                            self.tok.get_eol()
+                        elif not token.is_eol_or_eof():
+                            raise dns.exception.SyntaxError("bad origin in $INCLUDE")
+                        else:
+                            new_origin = self.current_origin
+                        saved_state.append(
+                            (
+                                self.tok,
+                                self.current_origin,
+                                self.last_name,
+                                current_file,
+                                self.last_ttl,
+                                self.last_ttl_known,
+                                self.default_ttl,
+                                self.default_ttl_known,
+                            )
+                        )
+                        current_file = open(filename, "r")
+                        self.tok = dns.tokenizer.Tokenizer(current_file, filename)
+                        self.current_origin = new_origin
+                        self.included = True
+                    elif c == "$GENERATE":
+                        for record in self._generate_line():
+                            yield record
+                    else:
+                        raise dns.exception.SyntaxError(
+                            "Unknown master file directive '" + c + "'"
+                        )
+                    continue
+                self.tok.unget(token)
+                record = self._rr_line()
+                if record is not None:
+                    yield record
+        except dns.exception.SyntaxError as detail:
+            (filename, line_number) = self.tok.where()
+            raise dns.exception.SyntaxError(
+                "%s:%d: %s" % (filename, line_number, detail)
+            )
+        finally:
+            # Close any $INCLUDEd files left open by an abandoned iteration
+            if current_file is not None:
+                current_file.close()
+            for state in saved_state:
+                if state[3] is not None:
+                    state[3].close()
+
+    def _eat_line(self):
+        while True:
+            token = self.tok.get()
+            if token.is_eol_or_eof():
+                break
+
+    def _ttl_and_class(self, token):
+        """Read the optional TTL and class starting at `token`, returning
+        the TTL and the token after them."""
+        try:
+            ttl = dns.ttl.from_text(token.value)
+            self.last_ttl = ttl
+            self.last_ttl_known = True
+            token = self.tok.get()
+            if not token.is_identifier():
+                raise dns.exception.SyntaxError
+        except dns.ttl.BadTTL:
+            if not (self.last_ttl_known or self.default_ttl_known):
+                raise dns.exception.SyntaxError("Missing default TTL value")
+            if self.default_ttl_known:
+                ttl = self.default_ttl
+                if self.default_ttl_from_soa:
+                    self.soa_ttl_used = True
+            else:
+                ttl = self.last_ttl
+                self.last_ttl_used = True
+        try:
+            rdclass = dns.rdataclass.from_text(token.value)
+            token = self.tok.get()
+            if not token.is_identifier():
+                raise dns.exception.SyntaxError
+        except dns.exception.SyntaxError:
+            raise
+        except Exception:
+            rdclass = dns.rdataclass.IN
+        if rdclass != dns.rdataclass.IN:
+            raise dns.exception.SyntaxError("RR class is not zone's class")
+        return ttl, token
+
+    def _generate_line(self):
+        """Process a `$GENERATE range lhs [ttl] [class] type rhs` line,
+        yielding the records it stands for.  The records have no line span,
+        as they cannot be rewritten one name at a time."""
+        token = self.tok.get()
+        try:
+            start, stop, step = dns.grange.from_text(token.value)
+        except Exception:
+            raise dns.exception.SyntaxError("bad range in $GENERATE")
+        token = self.tok.get()
+        if not token.is_identifier():
+            raise dns.exception.SyntaxError("bad $GENERATE")
+        lhs = token.value
+        token = self.tok.get()
+        if not token.is_identifier():
+            raise dns.exception.SyntaxError("bad $GENERATE")
+        ttl, token = self._ttl_and_class(token)
+        try:
+            rdtype = dns.rdatatype.from_text(token.value)
+        except Exception:
+            raise dns.exception.SyntaxError("unknown rdatatype '%s'" % token.value)
+        rhs = []
+        token = self.tok.get()
+        while not token.is_eol_or_eof():
+            rhs.append(token.value)
+            token = self.tok.get()
+        if not rhs:
+            raise dns.exception.SyntaxError("bad $GENERATE")
+        rhs = " ".join(rhs)
+
+        self.generated = True
+        self.line_span = None
+        for i in range(start, stop + 1, step):
+            name = dns.name.from_text(_generate_text(lhs, i), self.current_origin)
+            self.last_name = name
+            if not name.is_subdomain(self.origin):
+                self.out_of_zone.append(name)
+                continue
+            if not self._wanted(name, rdtype):
+                continue
+            try:
+                rd = dns.rdata.from_text(
+                    dns.rdataclass.IN,
+                    rdtype,
+                    _generate_text(rhs, i),
+                    self.current_origin,
+                    False,
+                )
+            except dns.exception.SyntaxError:
+                raise
+            except Exception:
+                (ty, va) = sys.exc_info()[:2]
+                raise dns.exception.SyntaxError(
+                    "caught exception %s: %s" % (str(ty), str(va))
+                )
+            rd.choose_relativity(self.origin, False)
+            yield (name, ttl, rdtype, rd)
+
+    def _rr_line(self):
+        """Process one record line, returning the record or None if it
+        is skipped."""
+        start = self.tok.line_number
+        token = self.tok.get(want_leading=True)
+        if not token.is_whitespace():
+            self.last_name = dns.name.from_text(token.value, self.current_origin)
+        else:
+            token = self.tok.get()
+            if token.is_eol_or_eof():
+                # leading whitespace followed by EOL is an empty line
+                return None
+            self.tok.unget(token)
+        name = self.last_name
+        if not name.is_subdomain(self.origin):
+            self.out_of_zone.append(name)
+            self._eat_line()
+            return None
+
+        token = self.tok.get()
+        if not token.is_identifier():
+            raise dns.exception.SyntaxError
+        ttl, token = self._ttl_and_class(token)
+        rdclass = dns.rdataclass.IN
+        # Type
+        try:
+            rdtype = dns.rdatatype.from_text(token.value)
+        except Exception:
+            raise dns.exception.SyntaxError("unknown rdatatype '%s'" % token.value)
+
+        wanted = self._wanted(name, rdtype)
+        if not wanted and not (
+            rdtype == dns.rdatatype.SOA and not self.default_ttl_known
+        ):
+            self._eat_line()
+            return None
+
+        try:
+            rd = dns.rdata.from_text(
+                rdclass, rdtype, self.tok, self.current_origin, False
+            )
+        except dns.exception.SyntaxError:
+            raise
+        except Exception:
+            # All exceptions that occur in the processing of rdata are
+            # treated as syntax errors, as dns.zone does.
+            (ty, va) = sys.exc_info()[:2]
+            raise dns.exception.SyntaxError(
+                "caught exception %s: %s" % (str(ty), str(va))
+            )
+
+        if not self.default_ttl_known and isinstance(rd, dns.rdtypes.ANY.SOA.SOA):
+            # Without a $TTL the SOA minimum becomes the default TTL
+            self.default_ttl = rd.minimum
+            self.default_ttl_known = True
+            self.default_ttl_from_soa = True
+
+        if not wanted:
+            return None
+
+        if self.tok is self._top_tok:
+            # The record's lines, including the EOL it ended with
+            self.line_span = (start, max(self.tok.line_number, start + 1))
+        else:
+            self.line_span = None
+
+        rd.choose_relativity(self.origin, False)
+        return (name, ttl, rdtype, rd)
+
+
+# ---- Module Functions ----
+
+
+def _generate_text(template, index):
+    """Return the $GENERATE `template` with each `$` replaced by `index`,
+    as modified by any `{offset,width,base}` following it."""
+
+    def replace(match):
+        offset, width, base = match.groups()
+        value = index + int(offset or 0)
+        return "%0*{}".format(base or "d") % (int(width or 0), value)
+
+    return _GENERATE_MODIFIER.sub(replace, template)
@@ -22,6 +22,14 @@ Example::
     >>> r.reload('example.com')
     zone reload up-to-date
     >>>
+    >>> from dnszone.zone_reload import ReloadScheduler
+    >>> s = ReloadScheduler(r, debounce=2.0, max_concurrent=4)
+    >>> for i in range(50):
+    ...     s.request('example.com')   # one reload, two seconds from now
+    ...
+    >>> s.flush()                      # reload now and wait for it
+    []
+    >>> s.close()
 """
 
 __author__ = "Greg Hellings"
@@ -35,6 +43,12 @@ __version__ = "1.0"
 
 # - Python Modules -
 import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+
+from . import instrument
+from .rndc import RndcError
 
 # ---- Exceptions ----
 
@@ -52,18 +66,198 @@ class ZoneReload(object):
 
     `rndc` : string containing path to rndc binary.  Or leave as "rndc"
     to search with default PATH.
+    `client` : optional rndc.RndcClient; if given, commands are sent over
+    its control channel connection instead of running rndc.
     """
 
-    def __init__(self, rndc="rndc"):
+    def __init__(self, rndc="rndc", client=None):
         self.rndc = rndc
+        self.client = client
+
+    def _call_client(self, command, *args):
+        try:
+            getattr(self.client, command)(*args)
+        except RndcError as e:
+            raise ZoneReloadError("rndc %s failed: %s" % (command, e))
 
     def reload(self, zone):
         """Ask named to perform a zone reload by calling the
         rndc commmand.
         """
-        cmd = [self.rndc, "reload", zone]
+        with instrument.operation("reload", zone=zone) as op:
+            if self.client is not None:
+                return self._call_client("reload", zone)
+
+            cmd = [self.rndc, "reload", zone]
+
+            r = subprocess.call(cmd)
+            op.set(returncode=r)
+
+            if r != 0:
+                raise ZoneReloadError("rndc failed with return code %d" % r)
+
+    def reload_all(self):
+        """Ask named to reload every zone by calling the rndc command."""
+        with instrument.operation("reload_all") as op:
+            if self.client is not None:
+                return self._call_client("reload_all")
+
+            cmd = [self.rndc, "reload"]
+
+            r = subprocess.call(cmd)
+            op.set(returncode=r)
+
+            if r != 0:
+                raise ZoneReloadError("rndc failed with return code %d" % r)
+
+
+class ReloadScheduler(object):
+    """Queues zone reloads, so that a burst of requests for one zone
+    becomes a single reload.
+
+    `reloader` : the ZoneReload used to reload zones; a default ZoneReload
+    if not given.
+    `debounce` : seconds to hold a request, during which further requests
+    for the same zone are merged into it.
+    `max_concurrent` : the most reloads to run at once.
+    `global_threshold` : if more than this many zones are waiting, reload
+    every zone with one `reload_all` instead.
+
+    A zone requested again while it is being reloaded is reloaded again
+    afterwards, as the new request may be for a change the running reload
+    missed.  A reload of every zone never runs alongside reloads of single
+    zones.  Reloads that fail are kept and returned by `flush`.
+    """
+
+    def __init__(
+        self, reloader=None, debounce=1.0, max_concurrent=4, global_threshold=None
+    ):
+        self.reloader = reloader if reloader is not None else ZoneReload()
+        self.debounce = debounce
+        self.max_concurrent = max_concurrent
+        self.global_threshold = global_threshold
+
+        self._cond = threading.Condition()
+        # zone -> time the reload is due
+        self._pending = {}
+        # zones being reloaded; None for a reload of every zone
+        self._running = set()
+        self._errors = []
+        self._closed = False
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent)
+        self._thread = threading.Thread(target=self._run, name="ReloadScheduler")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def request(self, zone):
+        """Ask for `zone` to be reloaded once the debounce window has
+        passed."""
+        with self._cond:
+            if self._closed:
+                raise ZoneReloadError("ReloadScheduler is closed")
+            if zone not in self._pending:
+                self._pending[zone] = monotonic() + self.debounce
+                self._cond.notify_all()
+
+    def get_pending(self):
+        """Return the set of zones waiting to be reloaded."""
+        with self._cond:
+            return set(self._pending)
+
+    pending = property(get_pending)
+
+    def wait(self, timeout=None):
+        """Wait until there are no reloads waiting or running.  Returns
+        False if `timeout` seconds pass first."""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not self._pending and not self._running, timeout
+            )
+
+    def flush(self, timeout=None):
+        """Start every waiting reload now, without waiting out the debounce
+        window, and wait for them all to finish.  Returns the failed reloads
+        since the last flush, as a list of `(zone, exception)`; `zone` is
+        None for a reload of every zone."""
+        with self._cond:
+            for zone in self._pending:
+                self._pending[zone] = 0
+            self._cond.notify_all()
+        if not self.wait(timeout):
+            raise ZoneReloadError("Timed out waiting for zone reloads")
+        with self._cond:
+            errors = self._errors
+            self._errors = []
+        return errors
+
+    def close(self):
+        """Flush any waiting reloads and stop the scheduler."""
+        try:
+            self.flush()
+        finally:
+            with self._cond:
+                self._closed = True
+                self._cond.notify_all()
+            self._thread.join()
+            self._executor.shutdown()
+
+    def _run(self):
+        cond = self._cond
+        pending = self._pending
+        running = self._running
+        with cond:
+            while not (self._closed and not pending):
+                if None in running:
+                    # Zones asked for meanwhile wait for the reload of every
+                    # zone to finish
+                    cond.wait()
+                    continue
+                now = monotonic()
+                waiting = [zone for zone in pending if zone not in running]
+                due = set(zone for zone in waiting if pending[zone] <= now)
+                if (
+                    due
+                    and self.global_threshold is not None
+                    and len(pending) > self.global_threshold
+                ):
+                    # One reload of everything beats many of single zones,
+                    # once those already running have finished
+                    if not running:
+                        pending.clear()
+                        self._start(None)
+                        continue
+                    cond.wait()
+                    continue
+                for zone in due:
+                    del pending[zone]
+                    self._start(zone)
+
+                timeout = None
+                later = [pending[zone] for zone in waiting if zone not in due]
+                if later:
+                    timeout = max(min(later) - now, 0)
+                cond.wait(timeout)
 
-        r = subprocess.call(cmd)
+    def _start(self, zone):
+        self._running.add(zone)
+        self._executor.submit(self._reload, zone)
 
-        if r != 0:
-            raise ZoneReloadError("rndc failed with return code %d" % r)
+    def _reload(self, zone):
+        try:
+            if zone is None:
+                self.reloader.reload_all()
+            else:
+                self.reloader.reload(zone)
+        except Exception as e:
+            with self._cond:
+                self._errors.append((zone, e))
+        finally:
+            with self._cond:
+                self._running.discard(zone)
+                self._cond.notify_all()
@@ -0,0 +1,208 @@
+# encoding: utf-8
+
+"""zone_set
+
+Load many zones at once, parsing the zone files in parallel across a
+pool of processes.
+
+Example::
+
+    >>> from dnszone.zone_set import zones_from_directory
+    >>> zones = zones_from_directory('/var/named/zones', workers=8)
+    >>> zones['example.com.'].root.soa.serial
+    2007012902
+    >>> zones.errors
+    {'broken.com.': SyntaxError('broken.com:12: unknown rdatatype ...')}
+    >>>
+    >>> from dnszone.zone_set import zones_from_named_conf
+    >>> zones = zones_from_named_conf('/etc/named.conf')
+"""
+
+__author__ = "Greg Hellings"
+__copyright__ = "(c) Greg Hellings 2019"
+__id__ = "$Id$"
+__url__ = "$URL$"
+__version__ = "1.0"
+
+
+# ---- Imports ----
+
+# - Python Modules -
+import os
+import pickle
+import re
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+
+from .dnszone import ZoneError, zone_from_file
+
+# ---- Constants ----
+
+_COMMENT_RE = re.compile(r'"(?:[^"\\]|\\.)*"|/\*.*?\*/|//[^\n]*|#[^\n]*', re.S)
+_ZONE_RE = re.compile(r'\bzone\s+"?([^"\s{]+)"?\s*(?:\w+\s*)?\{')
+_FILE_RE = re.compile(r'(?<![\w-])file\s+"([^"]+)"\s*;')
+_OPTIONS_RE = re.compile(r"\boptions\s*\{")
+_DIRECTORY_RE = re.compile(r'(?<![\w-])directory\s+"([^"]+)"\s*;')
+
+# ---- Classes ----
+
+
+class ZoneSet(Mapping):
+    """A read-only mapping of domain to Zone for a group of zones.
+
+    Zones which could not be loaded are left out of the mapping and their
+    errors kept in `errors`, a dict of domain to the exception raised, so
+    one bad file does not stop the rest from loading.
+    """
+
+    def __init__(self, zones=None, errors=None):
+        self._zones = zones if zones is not None else {}
+        self.errors = errors if errors is not None else {}
+
+    def __getitem__(self, domain):
+        return self._zones[domain]
+
+    def __iter__(self):
+        return iter(self._zones)
+
+    def __len__(self):
+        return len(self._zones)
+
+    def load(self, files, workers=None, cache=None):
+        """Load the zones in `files`, a mapping of domain to zone file.
+
+        The files are parsed by a pool of `workers` processes, by default
+        one per CPU.  With `workers=1` they are parsed in this process.
+        `cache` is an optional zone_cache.ZoneCache, see
+        Zone.load_from_file.  Returns the ZoneSet.
+        """
+        jobs = [
+            (_domain(domain), filename, cache) for domain, filename in files.items()
+        ]
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers == 1 or len(jobs) < 2:
+            self._collect(jobs, map(_load_zone, jobs))
+            return self
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # Hand the zones out in batches to keep the overhead down
+            chunksize = max(1, len(jobs) // (workers * 4))
+            self._collect(jobs, executor.map(_load_zone, jobs, chunksize=chunksize))
+        return self
+
+    def _collect(self, jobs, results):
+        for job, (zone, error) in zip(jobs, results):
+            domain = job[0]
+            if error is None:
+                self._zones[domain] = zone
+                self.errors.pop(domain, None)
+            else:
+                self._zones.pop(domain, None)
+                self.errors[domain] = error
+
+
+# ---- Module Functions ----
+
+
+def zones_from_files(files, workers=None, cache=None):
+    """Load the zones in `files`, a mapping of domain to zone file, and
+    return them as a ZoneSet.  See ZoneSet.load."""
+    return ZoneSet().load(files, workers=workers, cache=cache)
+
+
+def zones_from_directory(directory, suffix="", workers=None, cache=None):
+    """Load every zone file in `directory` and return them as a ZoneSet.
+
+    Each file is taken to hold the zone it is named after, less `suffix`;
+    e.g. with `suffix='.zone'` the file 'example.com.zone' holds the zone
+    'example.com.'.  Hidden files and files not ending in `suffix` are
+    ignored.
+    """
+    files = {}
+    for entry in sorted(os.listdir(directory)):
+        path = os.path.join(directory, entry)
+        if entry.startswith(".") or not os.path.isfile(path):
+            continue
+        if suffix:
+            if not entry.endswith(suffix) or entry == suffix:
+                continue
+            end = len(entry) - len(suffix)
+            entry = entry[:end]
+        files[entry] = path
+    return zones_from_files(files, workers=workers, cache=cache)
+
+
+def zones_from_named_conf(filename, workers=None, cache=None):
+    """Load the zones declared in the named.conf style file `filename` and
+    return them as a ZoneSet.  See parse_named_conf."""
+    return zones_from_files(parse_named_conf(filename), workers=workers, cache=cache)
+
+
+def parse_named_conf(filename):
+    """Return a dict of domain to zone file for the zones declared in the
+    named.conf style file `filename`.
+
+    Zones without a `file`, such as forward zones, are left out.  Relative
+    file names are taken to be relative to the `directory` given in the
+    `options` block, or else to the directory holding `filename`.
+    `include` statements are not followed.
+    """
+    with open(filename, "r") as f:
+        text = _COMMENT_RE.sub(_strip_comment, f.read())
+
+    directory = os.path.dirname(os.path.abspath(filename))
+    match = _OPTIONS_RE.search(text)
+    if match:
+        start = match.end()
+        match = _DIRECTORY_RE.search(text, start, _block_end(text, start))
+        if match:
+            directory = match.group(1)
+
+    files = {}
+    for match in _ZONE_RE.finditer(text):
+        start = match.end()
+        end = _block_end(text, start)
+        body = text[start:end]
+        file_match = _FILE_RE.search(body)
+        if file_match:
+            path = os.path.join(directory, file_match.group(1))
+            files[match.group(1)] = path
+    return files
+
+
+def _strip_comment(match):
+    text = match.group(0)
+    return text if text.startswith('"') else " "
+
+
+def _block_end(text, pos):
+    """Return the position of the '}' closing the block starting at `pos`."""
+    depth = 1
+    while depth:
+        close = text.find("}", pos)
+        if close < 0:
+            raise ZoneError("Unbalanced braces in named.conf")
+        depth += text.count("{", pos, close) - 1
+        pos = close + 1
+    return pos - 1
+
+
+def _domain(domain):
+    if domain[-1:] != ".":
+        domain = domain + "."
+    return domain
+
+
+def _load_zone(job):
+    """Load one zone, returning `(zone, None)` or `(None, error)`."""
+    domain, filename, cache = job
+    try:
+        return zone_from_file(domain, filename, cache=cache), None
+    except Exception as e:
+        try:
+            pickle.dumps(e)
+        except Exception:
+            # The error has to make it back from the worker process
+            e = ZoneError("%s: %s: %s" % (filename, type(e).__name__, e))
+        return None, e
@@ -0,0 +1,267 @@
+# encoding: utf-8
+
+"""zone_validate
+
+An in-process zone validator covering the common checks made by
+'named-checkzone', without needing BIND installed or a process per zone.
+
+Example::
+
+    >>> from dnszone.zone_validate import validate_file
+    >>> for problem in validate_file('example.com', '/var/named/zones/example.com'):
+    ...     print(problem)
+    ...
+    error: example.com./NS: 'ns1.example.com.' is a CNAME (illegal)
+    warning: www.example.com./MX: 'mail.example.com.' is a CNAME (illegal)
+    >>>
+    >>> from dnszone.dnszone import zone_from_file
+    >>> z = zone_from_file('example.com', '/var/named/zones/example.com')
+    >>> z.validate()
+    [Problem(severity='error', name='www.example.com.', rectype='MX', ...)]
+"""
+
+__author__ = "Greg Hellings"
+__copyright__ = "(c) Greg Hellings 2019"
+__id__ = "$Id$"
+__url__ = "$URL$"
+__version__ = "1.1"
+
+
+# ---- Imports ----
+
+# - Python Modules -
+from collections import namedtuple
+
+# - dnspython Modules - http://www.dnspython.org/
+import dns.exception
+import dns.name
+import dns.rdataclass
+import dns.rdatatype
+import dns.zone
+from six import string_types
+
+from .zone_reader import ZoneReader
+
+# ---- Constants ----
+
+ERROR = "error"
+WARNING = "warning"
+
+_IN = dns.rdataclass.IN
+_SOA = dns.rdatatype.SOA
+_NS = dns.rdatatype.NS
+_MX = dns.rdatatype.MX
+_CNAME = dns.rdatatype.CNAME
+_ADDRESS_TYPES = (dns.rdatatype.A, dns.rdatatype.AAAA)
+# Types which may sit alongside a CNAME (RFC 2181, RFC 4035)
+_CNAME_COMPANIONS = (
+    _CNAME,
+    dns.rdatatype.RRSIG,
+    dns.rdatatype.NSEC,
+    dns.rdatatype.NSEC3,
+)
+
+# ---- Classes ----
+
+
+class Problem(namedtuple("Problem", ["severity", "name", "rectype", "message"])):
+    """A problem found in a zone: `severity` is ERROR or WARNING, `name`
+    the owner name as a string and `rectype` the record type concerned, if
+    any."""
+
+    __slots__ = ()
+
+    def __str__(self):
+        where = self.name
+        if self.rectype:
+            where = "%s/%s" % (where, self.rectype)
+        return "%s: %s: %s" % (self.severity, where, self.message)
+
+
+# ---- Module Functions ----
+
+
+def validate_zone(zone, max_ttl=None):
+    """Check the dns.zone.Zone `zone` and return a list of Problems, errors
+    first.
+
+    The zone is checked for a single SOA and for NS records at its origin,
+    CNAMEs alongside other data, NS and MX records pointing at CNAMEs, NS
+    records of the zone or its delegations whose in-zone targets have no
+    address, records hidden below a delegation other than its glue, the
+    SOA timers and, if `max_ttl` is given, TTLs over that limit.
+    """
+    origin = zone.origin
+    nodes = zone.nodes
+    problems = []
+
+    def report(severity, name, rdtype, message):
+        rectype = dns.rdatatype.to_text(rdtype) if rdtype is not None else None
+        problems.append(Problem(severity, str(name), rectype, message))
+
+    apex = nodes.get(origin)
+    soa = apex.get_rdataset(_IN, _SOA) if apex is not None else None
+    if not soa:
+        report(ERROR, origin, _SOA, "zone has no SOA record")
+    else:
+        if len(soa) > 1:
+            report(ERROR, origin, _SOA, "zone has more than one SOA record")
+        _check_soa(report, origin, soa[0])
+    if apex is None or not apex.get_rdataset(_IN, _NS):
+        report(ERROR, origin, _NS, "zone has no NS records")
+
+    # (owner, type, target) of every NS and MX record, checked once all the
+    # names are known
+    targets = []
+    delegations = set()
+    for name, node in nodes.items():
+        rdtypes = set()
+        for rds in node.rdatasets:
+            if not rds:
+                continue
+            rdtype = rds.rdtype
+            rdtypes.add(rdtype)
+            if max_ttl is not None and rds.ttl > max_ttl:
+                report(ERROR, name, rdtype, "TTL %d exceeds %d" % (rds.ttl, max_ttl))
+            if rdtype == _NS:
+                if name != origin:
+                    delegations.add(name)
+                targets.extend((name, rdtype, rd.target) for rd in rds)
+            elif rdtype == _MX:
+                targets.extend((name, rdtype, rd.exchange) for rd in rds)
+            elif rdtype == _SOA and name != origin:
+                report(ERROR, name, rdtype, "SOA record not at zone apex")
+
+        if _CNAME in rdtypes:
+            others = [t for t in rdtypes if t not in _CNAME_COMPANIONS]
+            if others:
+                report(
+                    ERROR,
+                    name,
+                    _CNAME,
+                    "CNAME and other data (%s)"
+                    % ", ".join(sorted(dns.rdatatype.to_text(t) for t in others)),
+                )
+
+    glue = set()
+    for owner, rdtype, target in targets:
+        if not target.is_subdomain(origin):
+            continue
+        node = nodes.get(target)
+        if node is not None and node.get_rdataset(_IN, _CNAME):
+            # As named-checkzone, whose default for an MX is only to warn
+            severity = ERROR if rdtype == _NS else WARNING
+            report(severity, owner, rdtype, "'%s' is a CNAME (illegal)" % target)
+        elif rdtype == _NS:
+            glue.add(target)
+            if node is None or not any(
+                node.get_rdataset(_IN, t) for t in _ADDRESS_TYPES
+            ):
+                report(
+                    ERROR,
+                    owner,
+                    rdtype,
+                    "'%s' has no address records (A or AAAA)" % target,
+                )
+
+    if delegations:
+        for name, node in nodes.items():
+            if name in delegations or not _below_delegation(name, origin, delegations):
+                continue
+            for rds in node.rdatasets:
+                if rds and not (rds.rdtype in _ADDRESS_TYPES and name in glue):
+                    report(
+                        WARNING,
+                        name,
+                        rds.rdtype,
+                        "record below a delegation is occluded",
+                    )
+
+    problems.sort(key=lambda problem: problem.severity != ERROR)
+    return problems
+
+
+def validate_file(domain, filename, max_ttl=None):
+    """Read the zone file `filename` for `domain` and return a list of
+    Problems, as validate_zone.
+
+    As the records are read this also reports what cannot be seen once
+    the zone has been loaded: duplicate records, more than one record of a
+    type which may only have one (such as CNAME), records of one name and
+    type with differing TTLs, and records outside the zone, such as glue
+    for name servers in other zones, which named ignores.  A file which
+    cannot be parsed is reported as a single error.
+    """
+    if isinstance(domain, string_types):
+        if domain[-1:] != ".":
+            domain = domain + "."
+        domain = dns.name.from_text(domain)
+    problems = []
+    zone = dns.zone.Zone(domain, relativize=False)
+    nodes = zone.nodes
+    reader = ZoneReader(domain, filename)
+    try:
+        for name, ttl, rdtype, rd in reader:
+            node = nodes.get(name)
+            if node is None:
+                node = nodes[name] = zone.node_factory()
+            rds = node.find_rdataset(_IN, rdtype, rd.covers(), True)
+            count = len(rds)
+            if count and rds.ttl != ttl:
+                problems.append(
+                    Problem(
+                        WARNING,
+                        str(name),
+                        dns.rdatatype.to_text(rdtype),
+                        "TTL %d differs from the other records' TTL %d"
+                        % (ttl, rds.ttl),
+                    )
+                )
+            if count and dns.rdatatype.is_singleton(rdtype) and rd != rds[0]:
+                # dnspython would quietly replace the one already there
+                problems.append(
+                    Problem(
+                        ERROR,
+                        str(name),
+                        dns.rdatatype.to_text(rdtype),
+                        "multiple RRs of singleton type",
+                    )
+                )
+                continue
+            rds.add(rd, ttl)
+            if len(rds) == count:
+                problems.append(
+                    Problem(
+                        WARNING,
+                        str(name),
+                        dns.rdatatype.to_text(rdtype),
+                        "duplicate record '%s'" % rd.to_text(),
+                    )
+                )
+    except (IOError, OSError, dns.exception.DNSException) as e:
+        return [Problem(ERROR, str(domain), None, str(e))]
+
+    for name in dict.fromkeys(reader.out_of_zone):
+        problems.append(Problem(WARNING, str(name), None, "ignoring out-of-zone data"))
+
+    problems = validate_zone(zone, max_ttl=max_ttl) + problems
+    problems.sort(key=lambda problem: problem.severity != ERROR)
+    return problems
+
+
+def _check_soa(report, origin, soa):
+    if soa.retry >= soa.refresh:
+        report(WARNING, origin, _SOA, "SOA retry is not less than refresh")
+    if soa.expire < soa.refresh + soa.retry:
+        report(WARNING, origin, _SOA, "SOA expire is less than refresh + retry")
+    if soa.minimum > 86400:
+        report(WARNING, origin, _SOA, "SOA minimum (negative TTL) exceeds 1 day")
+
+
+def _below_delegation(name, origin, delegations):
+    """Return True if `name` is below one of the names in `delegations`."""
+    while name != origin and len(name) > len(origin):
+        name = name.parent()
+        if name in delegations:
+            return True
+    return False
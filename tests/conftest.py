@@ -0,0 +1,54 @@
+import os
+import shutil
+import threading
+import time
+
+from pytest import fixture
+
+from dnszone.zone_reload import ZoneReloadError
+
+ZONE_FILE = os.path.join(os.path.dirname(__file__), "files", "example.com")
+
+
+class FakeReload(object):
+    """Stands in for ZoneReload, recording the zones reloaded and the most
+    reloads run at once."""
+
+    def __init__(self, delay=0, fail=()):
+        self.delay = delay
+        self.fail = fail
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def _call(self, zone):
+        with self.lock:
+            self.calls.append(zone)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self.lock:
+            self.active -= 1
+        if zone in self.fail:
+            raise ZoneReloadError("rndc failed with return code 1")
+
+    def reload(self, zone):
+        self._call(zone)
+
+    def reload_all(self):
+        self._call(None)
+
+
+@fixture
+def zone_file(tmp_path):
+    path = str(tmp_path / "example.com")
+    shutil.copy(ZONE_FILE, path)
+    return path
+
+
+@fixture
+def fake_reload():
+    """The FakeReload class, to be called with the delay and failures
+    wanted."""
+    return FakeReload
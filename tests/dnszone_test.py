@@ -10,10 +10,22 @@ Copyright (c) 2019 Greg Hellings. All rights reserved.
 import os
 import tempfile
 import unittest
+from collections.abc import Mapping
+from unittest import mock
 
 from six import assertCountEqual
 
-from dnszone.dnszone import SOA, Name, RecordsError, Zone, ZoneError, zone_from_file
+from dnszone.dnszone import (
+    SOA,
+    Name,
+    RecordsError,
+    Zone,
+    ZoneError,
+    bump_serial,
+    diff_files,
+    iter_records,
+    zone_from_file,
+)
 
 
 class BasicZoneTest(unittest.TestCase):
@@ -93,7 +105,17 @@ class ZoneLoadTest(unittest.TestCase):
 
     def test_names_type(self):
         names = self.zone.names
-        self.assertIsInstance(names, dict)
+        self.assertIsInstance(names, Mapping)
+
+    def test_names_read_only(self):
+        names = self.zone.names
+        with self.assertRaises(TypeError):
+            names["x.example.com."] = None
+
+    def test_names_cached(self):
+        first = self.zone.names["foo.example.com."]
+        second = self.zone.names["foo.example.com."]
+        self.assertIs(first, second)
 
     def test_names_foo_A(self):
         records = self.zone.names["foo.example.com."].records("A").items
@@ -154,6 +176,73 @@ class ZoneLoadFunctionTest(unittest.TestCase):
         self.assertEqual(type(root), Name)
 
 
+class ZonePartialLoadTest(unittest.TestCase):
+    def setUp(self):
+        self.zone_file = os.path.join(os.path.dirname(__file__), "files", "example.com")
+
+    def test_types(self):
+        zone = zone_from_file("example.com", self.zone_file, types=["SOA", "NS"])
+        self.assertTrue(zone.partial)
+        self.assertEqual(zone.root.soa.serial, 2007012501)
+        self.assertEqual(
+            zone.root.records("NS").items, ["ns1.example.com.", "ns2.example.com."]
+        )
+        self.assertIsNone(zone.root.records("MX"))
+        self.assertEqual(list(zone.names.keys()), ["example.com."])
+
+    def test_under(self):
+        zone = zone_from_file(
+            "example.com", self.zone_file, types=["A"], under="bar.example.com."
+        )
+        self.assertIsNone(zone.root)
+        self.assertEqual(list(zone.names.keys()), ["bar.example.com."])
+        records = zone.names["bar.example.com."].records("A").items
+        self.assertEqual(records, ["10.0.0.2", "10.0.0.3"])
+
+    def test_full_load_not_partial(self):
+        zone = zone_from_file("example.com", self.zone_file)
+        self.assertFalse(zone.partial)
+
+    def test_save_refused(self):
+        zone = zone_from_file("example.com", self.zone_file, types=["SOA", "NS"])
+        self.assertRaises(ZoneError, zone.save)
+        self.assertRaises(ZoneError, zone.save, self.zone_file)
+
+    def test_save_elsewhere(self):
+        zone = zone_from_file("example.com", self.zone_file, types=["SOA", "NS"])
+        saved_filename = tempfile.mkstemp()[1]
+        zone.save(saved_filename)
+        z = zone_from_file("example.com", saved_filename)
+        self.assertIsNone(z.root.records("MX"))
+
+    def test_save_forced(self):
+        zone = zone_from_file("example.com", self.zone_file, types=["SOA", "NS"])
+        zone.filename = tempfile.mkstemp()[1]
+        zone.save(force=True)
+        self.assertTrue(os.path.getsize(zone.filename) > 0)
+
+
+class IterRecordsTest(unittest.TestCase):
+    def setUp(self):
+        self.zone_file = os.path.join(os.path.dirname(__file__), "files", "example.com")
+
+    def test_all_records(self):
+        records = list(iter_records("example.com", self.zone_file))
+        self.assertEqual(len(records), 13)
+        self.assertIn(("foo.example.com.", 86400, "A", "10.0.0.1"), records)
+
+    def test_mx_values(self):
+        records = list(iter_records("example.com", self.zone_file, types=["MX"]))
+        self.assertEqual(
+            records,
+            [
+                ("example.com.", 86400, "MX", (10, "mail.example.com.")),
+                ("example.com.", 86400, "MX", (20, "mail2.example.com.")),
+                ("foo.example.com.", 86400, "MX", (10, "mail.example.com.")),
+            ],
+        )
+
+
 class ZoneModifyTest(unittest.TestCase):
     def setUp(self):
         self.zone = Zone("example.com.")
@@ -307,6 +396,20 @@ class ZoneModifyTest(unittest.TestCase):
             msg=("%s | %s") % (self.zone.names.keys(), expected),
         )
 
+    def test_names_index_tracks_add_delete(self):
+        # the cached name index is updated in place
+        names = self.zone.names
+        self.zone.add_name("zip.example.com.")
+        self.assertIn("zip.example.com.", names)
+        self.zone.delete_name("zip.example.com.")
+        self.assertNotIn("zip.example.com.", names)
+
+    def test_names_index_follows_minttl(self):
+        foo = self.zone.names["foo.example.com."]
+        self.zone.root.soa.minttl = 300
+        self.assertIs(self.zone.names["foo.example.com."], foo)
+        self.assertEqual(foo.ttl, 300)
+
     def test_names_bar_clear_all_records(self):
         # clear all records for bar.example.com.
         self.zone.names["bar.example.com."].clear_all_records()
@@ -370,6 +473,884 @@ class ZoneModifyTest(unittest.TestCase):
         )  # noqa: E501
 
 
+class ZoneDirtyTest(unittest.TestCase):
+    def setUp(self):
+        zone_file = os.path.join(os.path.dirname(__file__), "files", "example.com")
+        self.filename = tempfile.mkstemp()[1]
+        with open(zone_file) as src, open(self.filename, "w") as dst:
+            dst.write(src.read())
+        self.zone = zone_from_file("example.com", self.filename)
+
+    def tearDown(self):
+        os.unlink(self.filename)
+
+    def test_clean_after_load(self):
+        self.assertFalse(self.zone.dirty)
+
+    def test_reads_stay_clean(self):
+        self.zone.names["foo.example.com."].records("A").items
+        self.zone.root.soa.serial
+        self.assertFalse(self.zone.dirty)
+
+    def test_records_add(self):
+        self.zone.root.records("NS").add("ns3.example.com.")
+        self.assertTrue(self.zone.dirty)
+
+    def test_records_add_duplicate(self):
+        self.zone.root.records("NS").add("ns1.example.com.")
+        self.assertFalse(self.zone.dirty)
+
+    def test_records_delete(self):
+        self.zone.names["bar.example.com."].records("A").delete("10.0.0.2")
+        self.assertTrue(self.zone.dirty)
+
+    def test_clear_all_records(self):
+        self.zone.names["bar.example.com."].clear_all_records()
+        self.assertTrue(self.zone.dirty)
+
+    def test_add_name(self):
+        self.zone.add_name("zip.example.com.")
+        self.assertTrue(self.zone.dirty)
+
+    def test_add_existing_name(self):
+        self.zone.add_name("foo.example.com.")
+        self.assertFalse(self.zone.dirty)
+
+    def test_delete_name(self):
+        self.zone.delete_name("foo.example.com.")
+        self.assertTrue(self.zone.dirty)
+
+    def test_delete_missing_name(self):
+        self.zone.delete_name("nothere.example.com.")
+        self.assertFalse(self.zone.dirty)
+
+    def test_soa_setter(self):
+        self.zone.root.soa.refresh = 1
+        self.assertTrue(self.zone.dirty)
+
+    def test_save_unchanged_skipped(self):
+        mtime = os.stat(self.filename).st_mtime_ns
+        self.assertFalse(self.zone.save(autoserial=True))
+        self.assertEqual(os.stat(self.filename).st_mtime_ns, mtime)
+        self.assertEqual(self.zone.root.soa.serial, 2007012501)
+
+    def test_save_changed(self):
+        self.zone.root.records("A").add("10.2.3.4")
+        self.assertTrue(self.zone.save(autoserial=True))
+        self.assertFalse(self.zone.dirty)
+        z = zone_from_file("example.com", self.filename)
+        self.assertEqual(z.root.records("A").items, ["10.0.0.1", "10.2.3.4"])
+        self.assertTrue(z.root.soa.serial > 2007012501)
+
+    def test_save_forced(self):
+        self.assertTrue(self.zone.save(autoserial=True, force=True))
+        z = zone_from_file("example.com", self.filename)
+        self.assertTrue(z.root.soa.serial > 2007012501)
+
+
+class ZoneIncrementalSaveTest(unittest.TestCase):
+    def setUp(self):
+        zone_file = os.path.join(os.path.dirname(__file__), "files", "example.com")
+        self.filename = tempfile.mkstemp()[1]
+        with open(zone_file) as src, open(self.filename, "w") as dst:
+            dst.write(src.read())
+        self.zone = zone_from_file("example.com", self.filename)
+
+    def tearDown(self):
+        os.unlink(self.filename)
+
+    def read(self):
+        with open(self.filename) as f:
+            return f.read()
+
+    def assertSaved(self):
+        self.assertTrue(self.zone.save())
+        saved = zone_from_file("example.com", self.filename)
+
+        def render(zone):
+            # names and types left with no records are not written out
+            texts = dict((str(k), v.to_text(k)) for k, v in zone.nodes.items())
+            return dict((k, v) for k, v in texts.items() if v)
+
+        self.assertEqual(render(saved._zone), render(self.zone._zone))
+
+    def test_unchanged_lines_kept(self):
+        self.zone.names["bar.example.com."].records("A").add("10.0.0.4")
+        self.assertSaved()
+        text = self.read()
+        self.assertIn("; serial number YYMMDDNN", text)
+        self.assertIn("$ORIGIN example.com.", text)
+        self.assertIn("foo     IN      A       10.0.0.1", text)
+        self.assertNotIn("bar     IN      A       10.0.0.2", text)
+
+    def test_add_delete_names(self):
+        self.zone.add_name("zip.example.com.")
+        self.zone.names["zip.example.com."].records("A", create=True).add("10.9.8.7")
+        self.zone.delete_name("foofoo.example.com.")
+        self.assertSaved()
+        self.assertNotIn("foofoo", self.read())
+
+    def test_repeated_saves(self):
+        self.zone.root.records("MX").delete((20, "mail2.example.com."))
+        self.assertSaved()
+        self.zone.names["barbar.example.com."].clear_all_records()
+        self.zone.add_name("new.example.com.")
+        self.zone.names["new.example.com."].records("TXT", create=True).add("hi")
+        self.assertSaved()
+        self.zone.names["foo.example.com."].records("A").delete("10.0.0.1")
+        self.zone.names["new.example.com."].records("TXT").add("there")
+        self.zone.root.soa.serial += 1
+        self.assertSaved()
+        self.assertIn("$ORIGIN example.com.", self.read())
+
+    def test_changed_file_rewritten(self):
+        with open(self.filename, "a") as f:
+            f.write("; edited elsewhere\n")
+        self.zone.names["bar.example.com."].records("A").add("10.0.0.4")
+        self.assertSaved()
+        self.assertNotIn("$ORIGIN", self.read())
+
+    def test_generate(self):
+        generate = os.path.join(
+            os.path.dirname(__file__), "files", "generate.example.com"
+        )
+        with open(generate) as src, open(self.filename, "w") as dst:
+            dst.write(src.read())
+        self.zone = zone_from_file("example.com", self.filename)
+        self.assertEqual(
+            self.zone.names["host2.example.com."].records("A").items, ["10.0.1.2"]
+        )
+        self.assertEqual(
+            self.zone.names["mx012.example.com."].records("MX").items,
+            [(10, "mail2.example.com.")],
+        )
+        self.zone.names["host2.example.com."].records("A").add("10.0.1.9")
+        self.assertSaved()
+        self.assertNotIn("$GENERATE", self.read())
+
+    def test_symlink_followed(self):
+        link = self.filename + ".link"
+        os.symlink(self.filename, link)
+        self.addCleanup(os.unlink, link)
+        zone = zone_from_file("example.com", link)
+        zone.names["bar.example.com."].records("A").add("10.0.0.4")
+        self.assertTrue(zone.save())
+        self.assertTrue(os.path.islink(link))
+        self.assertIn("10.0.0.4", self.read())
+
+    def test_owner_kept(self):
+        os.chmod(self.filename, 0o640)
+        st = os.stat(self.filename)
+        self.zone.names["bar.example.com."].records("A").add("10.0.0.4")
+        with mock.patch("dnszone.dnszone.os.chown") as chown:
+            self.zone.save()
+        self.assertEqual(chown.call_args[0][1:], (st.st_uid, st.st_gid))
+        self.assertEqual(os.stat(self.filename).st_mode & 0o777, 0o640)
+
+        self.zone.names["bar.example.com."].records("A").add("10.0.0.5")
+        with mock.patch("dnszone.dnszone.os.chown", side_effect=PermissionError):
+            self.assertTrue(self.zone.save())
+
+    def test_no_temp_files_left(self):
+        self.zone.names["bar.example.com."].records("A").add("10.0.0.4")
+        self.zone.save()
+        dirname, basename = os.path.split(self.filename)
+        leftovers = [f for f in os.listdir(dirname) if f.startswith("." + basename)]
+        self.assertEqual(leftovers, [])
+
+
+class ZoneApplyTest(unittest.TestCase):
+    def setUp(self):
+        self.zone = Zone("example.com.")
+        zone_file = os.path.join(os.path.dirname(__file__), "files", "example.com")
+        self.zone.load_from_file(zone_file)
+
+    def test_add_delete_replace(self):
+        self.zone.apply(
+            [
+                ("add", "bar.example.com.", "A", "10.0.0.4"),
+                ("delete", "bar.example.com.", "A", "10.0.0.2"),
+                ("add", "example.com.", "MX", (30, "mail3.example.com.")),
+                ("replace", "example.com.", "NS", ["ns9.example.com."]),
+                ("delete", "foo.example.com.", "MX", (10, "mail.example.com.")),
+            ]
+        )
+        names = self.zone.names
+        self.assertEqual(
+            names["bar.example.com."].records("A").items, ["10.0.0.3", "10.0.0.4"]
+        )
+        self.assertEqual(
+            self.zone.root.records("MX").items,
+            [
+                (10, "mail.example.com."),
+                (20, "mail2.example.com."),
+                (30, "mail3.example.com."),
+            ],
+        )
+        self.assertEqual(self.zone.root.records("NS").items, ["ns9.example.com."])
+        self.assertEqual(names["foo.example.com."].records("MX").items, [])
+        self.assertTrue(self.zone.dirty)
+
+    def test_txt_text(self):
+        self.zone.apply(
+            [
+                ("add", "txt.example.com.", "TXT", '"v=spf1" "include:x"'),
+                ("add", "txt.example.com.", "TXT", '"say \\"hi\\"\\059 bye"'),
+                ("add", "txt.example.com.", "TXT", "two words"),
+                ("add", "txt.example.com.", "TXT", '"unbalanced" "'),
+            ]
+        )
+        records = self.zone.names["txt.example.com."].records("TXT")
+        self.assertEqual(
+            [rd.strings for rd in records._rdataset],
+            [
+                [b"v=spf1", b"include:x"],
+                [b'say "hi"; bye'],
+                [b"two words"],
+                [b'unbalanced" '],
+            ],
+        )
+        self.assertEqual(records.items[0], '"v=spf1" "include:x"')
+        records.delete('"v=spf1" "include:x"')
+        self.assertEqual(len(records), 3)
+
+    def test_singleton_replaced(self):
+        self.zone.apply([("add", "foofoo.example.com.", "CNAME", "bar.example.com.")])
+        cname = self.zone.names["foofoo.example.com."].records("CNAME")
+        self.assertEqual(cname.items, ["bar.example.com."])
+        cname.add("foo.example.com.")
+        self.assertEqual(cname.items, ["foo.example.com."])
+        cname.replace(["bar.example.com.", "baz.example.com."])
+        self.assertEqual(cname.items, ["baz.example.com."])
+
+    def test_new_names(self):
+        names = self.zone.names
+        self.zone.apply(
+            [
+                ("add", "zip.example.com.", "A", "10.9.8.7"),
+                ("add", "zip.example.com.", "TXT", '"hello"'),
+            ]
+        )
+        self.assertIn("zip.example.com.", names)
+        zip_name = names["zip.example.com."]
+        self.assertEqual(zip_name.records("A").items, ["10.9.8.7"])
+        self.assertEqual(zip_name.records("TXT").items, ['"hello"'])
+        self.assertEqual(zip_name._node.get_rdataset(1, 1).ttl, 86400)
+
+    def test_sequential_within_name(self):
+        self.zone.apply(
+            [
+                ("add", "bar.example.com.", "A", "10.0.0.4"),
+                ("delete", "bar.example.com.", "A", "10.0.0.4"),
+            ]
+        )
+        self.assertEqual(
+            self.zone.names["bar.example.com."].records("A").items,
+            ["10.0.0.2", "10.0.0.3"],
+        )
+
+    def test_invalid_change_rejected(self):
+        changes = [
+            ("add", "bar.example.com.", "A", "10.0.0.4"),
+            ("add", "bar.example.com.", "A", "not-an-address"),
+        ]
+        self.assertRaises(ZoneError, self.zone.apply, changes)
+        self.assertRaises(
+            ZoneError, self.zone.apply, [("frob", "bar.example.com.", "A", "1.2.3.4")]
+        )
+        self.assertRaises(
+            ZoneError, self.zone.apply, [("add", "www.example.org.", "A", "1.2.3.4")]
+        )
+        self.assertEqual(
+            self.zone.names["bar.example.com."].records("A").items,
+            ["10.0.0.2", "10.0.0.3"],
+        )
+        self.assertFalse(self.zone.dirty)
+
+    def test_rollback(self):
+        changes = [
+            ("add", "zip.example.com.", "A", "10.9.8.7"),
+            ("add", "bar.example.com.", "A", "10.0.0.4"),
+            ("add", "foo.example.com.", "TXT", "new"),
+            ("delete", "foofoo.example.com.", "CNAME", "nothere.example.com."),
+        ]
+        self.assertRaises(ZoneError, self.zone.apply, changes)
+        self.assertNotIn("zip.example.com.", self.zone.names)
+        self.assertIsNone(self.zone.names["foo.example.com."].records("TXT"))
+        self.assertEqual(
+            self.zone.names["bar.example.com."].records("A").items,
+            ["10.0.0.2", "10.0.0.3"],
+        )
+        self.assertFalse(self.zone.dirty)
+
+    def test_noop_stays_clean(self):
+        self.zone.apply([("add", "bar.example.com.", "A", "10.0.0.2")])
+        self.assertFalse(self.zone.dirty)
+
+
+class ZoneReverseIndexTest(unittest.TestCase):
+    def setUp(self):
+        zone_file = os.path.join(os.path.dirname(__file__), "files", "example.com")
+        self.zone = zone_from_file("example.com", zone_file)
+
+    def test_addresses(self):
+        self.assertEqual(
+            self.zone.owners_of("10.0.0.1"),
+            [("example.com.", "A"), ("foo.example.com.", "A")],
+        )
+        self.assertEqual(
+            self.zone.owners_of("0:0::2"), [("barbar.example.com.", "AAAA")]
+        )
+        self.assertEqual(self.zone.owners_of("10.9.9.9"), [])
+
+    def test_targets(self):
+        self.assertEqual(
+            self.zone.owners_of("MAIL.example.com."),
+            [("example.com.", "MX"), ("foo.example.com.", "MX")],
+        )
+        self.assertEqual(
+            self.zone.owners_of("foo.example.com."),
+            [("foofoo.example.com.", "CNAME")],
+        )
+
+    def test_incremental(self):
+        self.assertEqual(len(self.zone.owners_of("10.0.0.2")), 1)
+        bar = self.zone.names["bar.example.com."]
+        bar.records("A").delete("10.0.0.2")
+        bar.records("A").add("10.0.0.9")
+        self.zone.root.records("MX").delete((10, "mail.example.com."))
+        self.zone.delete_name("foofoo.example.com.")
+        self.zone.names["foo.example.com."].clear_all_records()
+        self.assertEqual(self.zone.owners_of("10.0.0.2"), [])
+        self.assertEqual(self.zone.owners_of("10.0.0.9"), [("bar.example.com.", "A")])
+        self.assertEqual(self.zone.owners_of("mail.example.com."), [])
+        self.assertEqual(self.zone.owners_of("foo.example.com."), [])
+        self.assertEqual(self.zone.owners_of("10.0.0.1"), [("example.com.", "A")])
+
+    def test_apply(self):
+        self.zone.owners_of("10.0.0.1")
+        self.zone.apply(
+            [
+                ("replace", "foo.example.com.", "A", ["10.0.0.5"]),
+                ("add", "new.example.com.", "CNAME", "foo.example.com."),
+            ]
+        )
+        self.assertEqual(self.zone.owners_of("10.0.0.1"), [("example.com.", "A")])
+        self.assertEqual(self.zone.owners_of("10.0.0.5"), [("foo.example.com.", "A")])
+        self.assertEqual(len(self.zone.owners_of("foo.example.com.")), 2)
+
+    def test_ptr_records(self):
+        ptrs = self.zone.ptr_records()
+        self.assertEqual(len(ptrs), 6)
+        self.assertIn(("1.0.0.10.in-addr.arpa.", "foo.example.com."), ptrs)
+        self.assertEqual(
+            self.zone.ptr_records("10.0.0.2/31"),
+            [
+                ("2.0.0.10.in-addr.arpa.", "bar.example.com."),
+                ("3.0.0.10.in-addr.arpa.", "bar.example.com."),
+            ],
+        )
+        self.assertEqual(len(self.zone.ptr_records("::/64")), 2)
+
+
+class ZoneSubtreeTest(unittest.TestCase):
+    def setUp(self):
+        zone_file = os.path.join(os.path.dirname(__file__), "files", "example.com")
+        self.zone = zone_from_file("example.com", zone_file)
+        for name in ("a.lab", "b.lab", "x.a.lab", "lab", "labs"):
+            self.zone.add_name(name + ".example.com.")
+
+    def test_canonical_order(self):
+        self.assertEqual(
+            self.zone.names_under(),
+            [
+                "example.com.",
+                "bar.example.com.",
+                "barbar.example.com.",
+                "foo.example.com.",
+                "foofoo.example.com.",
+                "lab.example.com.",
+                "a.lab.example.com.",
+                "x.a.lab.example.com.",
+                "b.lab.example.com.",
+                "labs.example.com.",
+            ],
+        )
+
+    def test_names_under(self):
+        self.assertEqual(
+            self.zone.names_under("a.lab.example.com."),
+            ["a.lab.example.com.", "x.a.lab.example.com."],
+        )
+        self.assertEqual(len(self.zone.names_under("LAB.example.com.")), 4)
+        self.assertEqual(self.zone.names_under("none.example.com."), [])
+
+    def test_kept_up_to_date(self):
+        self.zone.names_under()
+        self.zone.add_name("c.lab.example.com.")
+        self.zone.delete_name("a.lab.example.com.")
+        self.zone.apply([("add", "d.lab.example.com.", "A", "10.0.0.4")])
+        self.assertEqual(
+            self.zone.names_under("lab.example.com."),
+            [
+                "lab.example.com.",
+                "x.a.lab.example.com.",
+                "b.lab.example.com.",
+                "c.lab.example.com.",
+                "d.lab.example.com.",
+            ],
+        )
+
+    def test_delete_subtree(self):
+        self.zone.names["a.lab.example.com."]
+        self.assertEqual(self.zone.delete_subtree("lab.example.com."), 4)
+        self.assertNotIn("x.a.lab.example.com.", self.zone.names)
+        self.assertIn("labs.example.com.", self.zone.names)
+        self.assertIsNone(self.zone._zone.get_node("b.lab.example.com."))
+        self.assertEqual(len(self.zone.names_under()), 6)
+        self.assertEqual(self.zone.delete_subtree("lab.example.com."), 0)
+
+
+class RecordsBulkTest(unittest.TestCase):
+    def setUp(self):
+        zone_file = os.path.join(os.path.dirname(__file__), "files", "example.com")
+        self.zone = zone_from_file("example.com", zone_file)
+        self.bar = self.zone.names["bar.example.com."]
+
+    def test_add_many(self):
+        self.bar.records("A").add_many(["10.0.0.3", "10.0.0.4", "10.0.0.4"])
+        self.assertEqual(
+            self.bar.records("A").items, ["10.0.0.2", "10.0.0.3", "10.0.0.4"]
+        )
+        self.assertTrue(self.zone.dirty)
+
+    def test_add_many_checks_first(self):
+        records = self.bar.records("A")
+        self.assertRaises(Exception, records.add_many, ["10.0.0.5", "bad address"])
+        self.assertEqual(records.items, ["10.0.0.2", "10.0.0.3"])
+
+    def test_delete_many(self):
+        records = self.bar.records("A")
+        self.assertRaises(RecordsError, records.delete_many, ["10.0.0.2", "10.9.9.9"])
+        self.assertEqual(records.items, ["10.0.0.2", "10.0.0.3"])
+        self.assertFalse(self.zone.dirty)
+        records.delete_many(["10.0.0.2", "10.0.0.3"])
+        self.assertEqual(records.items, [])
+
+    def test_replace_minimal(self):
+        records = self.bar.records("A")
+        kept = records._rdataset.items[1]
+        records.replace(["10.0.0.3", "10.0.0.7"])
+        self.assertEqual(records.items, ["10.0.0.3", "10.0.0.7"])
+        self.assertIs(records._rdataset.items[0], kept)
+        self.assertEqual(self.zone.owners_of("10.0.0.2"), [])
+
+    def test_replace_unchanged(self):
+        self.bar.records("A").replace(["10.0.0.3", "10.0.0.2"])
+        self.assertFalse(self.zone.dirty)
+
+    def test_shared_between_records(self):
+        first = self.bar.records("A")
+        second = self.bar.records("A")
+        first.add("10.0.0.8")
+        second.delete("10.0.0.8")
+        first.add("10.0.0.8")
+        self.assertEqual(second.items, ["10.0.0.2", "10.0.0.3", "10.0.0.8"])
+
+    def test_delete_one_at_a_time(self):
+        records = self.bar.records("A")
+        records.add_many(["10.1.%d.%d" % (i // 256, i % 256) for i in range(20000)])
+        for i in range(0, 20000, 2):
+            records.delete("10.1.%d.%d" % (i // 256, i % 256))
+        items = records.items
+        self.assertEqual(len(items), 10002)
+        self.assertEqual(items[:4], ["10.0.0.2", "10.0.0.3", "10.1.0.1", "10.1.0.3"])
+        self.assertEqual(len(self.bar.records("A")._rdataset), 10002)
+        self.assertFalse(hasattr(self.zone, "_members"))
+
+    def test_changed_rdataset_still_usable(self):
+        records = self.bar.records("A")
+        records.add("10.0.0.8")
+        records.delete("10.0.0.2")
+        rds = records._rdataset
+        self.assertEqual(rds.copy(), rds)
+        self.assertEqual(rds[0].address, "10.0.0.3")
+        self.assertIn("10.0.0.8", rds.to_text())
+        snapshot = self.zone.snapshot()
+        records.delete("10.0.0.8")
+        self.assertEqual(
+            snapshot.names["bar.example.com."].records("A").items,
+            ["10.0.0.3", "10.0.0.8"],
+        )
+
+    def test_cname_replaced(self):
+        records = self.zone.names["foofoo.example.com."].records("CNAME")
+        records.add("bar.example.com.")
+        self.assertEqual(records.items, ["bar.example.com."])
+        self.assertTrue(self.zone.dirty)
+
+
+class ZoneViewsTest(unittest.TestCase):
+    def setUp(self):
+        zone_file = os.path.join(os.path.dirname(__file__), "files", "example.com")
+        self.zone = zone_from_file("example.com", zone_file)
+
+    def test_reused(self):
+        self.assertIs(self.zone.root, self.zone.root)
+        self.assertIs(self.zone.root.soa, self.zone.root.soa)
+        self.assertIs(self.zone.names, self.zone.names)
+        foo = self.zone.names["foo.example.com."]
+        self.assertIs(foo.records("A"), foo.records("A"))
+
+    def test_slots(self):
+        foo = self.zone.names["foo.example.com."]
+        for obj in (foo, foo.records("A"), self.zone.root.soa):
+            self.assertRaises(AttributeError, setattr, obj, "other", 1)
+
+    def test_concurrent_iteration(self):
+        records = self.zone.names["bar.example.com."].records("A")
+        pairs = [(a, b) for a in records for b in records]
+        self.assertEqual(len(pairs), 4)
+        self.assertEqual(len(records), 2)
+
+    def test_change_while_iterating_items(self):
+        records = self.zone.names["bar.example.com."].records("A")
+        records.add("10.0.0.4")
+        for item in records.items:
+            records.delete(item)
+        self.assertEqual(records.items, [])
+
+    def test_root_replaced(self):
+        root = self.zone.root
+        self.zone.delete_name("example.com.")
+        self.assertIsNone(self.zone.root)
+        self.zone.apply([("add", "example.com.", "A", "10.0.0.5")])
+        self.assertIsNot(self.zone.root, root)
+        self.assertEqual(self.zone.root.records("A").items, ["10.0.0.5"])
+        self.assertIsNone(self.zone.root.soa)
+
+    def test_records_after_clear(self):
+        foo = self.zone.names["foo.example.com."]
+        records = foo.records("A")
+        foo.clear_all_records()
+        self.assertIsNone(foo.records("A"))
+        foo.records("A", create=True).add("10.0.0.6")
+        self.assertIsNot(foo.records("A"), records)
+        self.assertEqual(foo.records("A").items, ["10.0.0.6"])
+
+    def test_clear_all_records_exclude(self):
+        root = self.zone.root
+        rdatasets = root._node.rdatasets
+        root.clear_all_records(exclude="SOA")
+        self.assertEqual(root.records("NS"), None)
+        self.assertEqual(root.records("MX"), None)
+        self.assertEqual(root.soa.serial, 2007012501)
+        self.assertGreater(len(rdatasets), 1)
+
+
+class ZoneSnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.zone_file = os.path.join(os.path.dirname(__file__), "files", "example.com")
+        self.zone = zone_from_file("example.com", self.zone_file)
+        self.snap = self.zone.snapshot()
+
+    def test_unchanged(self):
+        bar = self.zone.names["bar.example.com."]
+        records = bar.records("A")
+        soa = self.zone.root.soa
+        records.add("10.0.0.4")
+        records.delete("10.0.0.2")
+        soa.serial += 1
+        self.zone.names["foo.example.com."].clear_all_records()
+        self.zone.delete_name("barbar.example.com.")
+        self.zone.apply(
+            [
+                ("add", "new.example.com.", "A", "10.0.0.9"),
+                ("replace", "foo.example.com.", "MX", [(20, "mx.example.com.")]),
+            ]
+        )
+
+        original = zone_from_file("example.com", self.zone_file)
+        self.assertEqual(len(original.diff(self.snap)), 0)
+        self.assertEqual(len(self.snap.diff(self.zone)), 10)
+        self.assertEqual(records.items, ["10.0.0.3", "10.0.0.4"])
+        self.assertIs(self.zone.root.soa, soa)
+        self.assertEqual(soa.serial, 2007012502)
+        self.assertEqual(self.snap.root.soa.serial, 2007012501)
+
+    def test_shared_until_changed(self):
+        nodes = self.zone._zone.nodes
+        snap_nodes = self.snap._zone.nodes
+        for name, node in nodes.items():
+            self.assertIs(snap_nodes[name], node)
+        self.zone.names["bar.example.com."].records("A").add("10.0.0.4")
+        changed = [name for name in nodes if snap_nodes[name] is not nodes[name]]
+        self.assertEqual([str(name) for name in changed], ["bar.example.com."])
+        self.zone.names["bar.example.com."].records("A").add("10.0.0.5")
+        self.assertIs(nodes[changed[0]], self.zone.names["bar.example.com."]._node)
+
+    def test_read_only(self):
+        bar = self.snap.names["bar.example.com."]
+        self.assertRaises(ZoneError, bar.records("A").add, "10.0.0.4")
+        self.assertRaises(ZoneError, bar.clear_all_records)
+        self.assertRaises(ZoneError, setattr, self.snap.root.soa, "serial", 1)
+        self.assertRaises(ZoneError, self.snap.add_name, "new.example.com.")
+        self.assertRaises(ZoneError, self.snap.delete_name, "bar.example.com.")
+        self.assertRaises(ZoneError, self.snap.save, force=True)
+        self.assertEqual(bar.records("A").items, ["10.0.0.2", "10.0.0.3"])
+
+    def test_zero_ttl_read(self):
+        self.zone.root.records("TXT", create=True).add("x")
+        self.zone.apply([("add", "bar.example.com.", "TXT", "y", 0)])
+        snap = self.zone.snapshot()
+        root = snap.names["example.com."].records("TXT")
+        self.assertEqual(root.items, ['"x"'])
+        self.assertEqual(root._rdataset.ttl, 86400)
+        bar = snap.names["bar.example.com."].records("TXT")
+        self.assertEqual(bar.items, ['"y"'])
+        self.assertEqual(bar._rdataset.ttl, 0)
+
+    def test_save_snapshot(self):
+        self.zone.names["bar.example.com."].records("A").add("10.0.0.4")
+        filename = tempfile.mkstemp()[1]
+        self.addCleanup(os.unlink, filename)
+        self.snap.save(filename)
+        saved = zone_from_file("example.com", filename)
+        self.assertEqual(len(saved.diff(self.snap)), 0)
+
+    def test_removed_name(self):
+        bar = self.zone.names["bar.example.com."]
+        self.zone.delete_name("bar.example.com.")
+        bar.records("A").add("10.0.0.4")
+        self.assertEqual(
+            self.snap.names["bar.example.com."].records("A").items,
+            ["10.0.0.2", "10.0.0.3"],
+        )
+
+
+class ZoneDiffTest(unittest.TestCase):
+    def setUp(self):
+        zone_file = os.path.join(os.path.dirname(__file__), "files", "example.com")
+        self.old = zone_from_file("example.com", zone_file)
+        self.new = zone_from_file("example.com", zone_file)
+        self.new.apply(
+            [
+                ("delete", "bar.example.com.", "A", "10.0.0.2"),
+                ("add", "bar.example.com.", "A", "10.0.0.9"),
+                ("add", "zip.example.com.", "TXT", "hello"),
+                ("delete", "foofoo.example.com.", "CNAME", "foo.example.com."),
+            ]
+        )
+        self.new.root.soa.serial = 2007012502
+        self.files = []
+
+    def tearDown(self):
+        for filename in self.files:
+            os.unlink(filename)
+
+    def _save(self, zone):
+        filename = tempfile.mkstemp()[1]
+        self.files.append(filename)
+        zone.save(filename, force=True)
+        return filename
+
+    def test_no_changes(self):
+        diff = self.old.diff(self.old)
+        self.assertEqual(len(diff), 0)
+        self.assertEqual(diff.added, [])
+        self.assertEqual(diff.removed, [])
+
+    def test_diff(self):
+        diff = self.old.diff(self.new)
+        self.assertEqual(
+            diff.removed,
+            [
+                (
+                    "example.com.",
+                    86400,
+                    "SOA",
+                    "ns1.example.com. hostmaster.example.com. "
+                    "2007012501 28800 7200 864000 86400",
+                ),
+                ("bar.example.com.", 86400, "A", "10.0.0.2"),
+                ("foofoo.example.com.", 86400, "CNAME", "foo.example.com."),
+            ],
+        )
+        self.assertEqual(
+            diff.added,
+            [
+                (
+                    "example.com.",
+                    86400,
+                    "SOA",
+                    "ns1.example.com. hostmaster.example.com. "
+                    "2007012502 28800 7200 864000 86400",
+                ),
+                ("bar.example.com.", 86400, "A", "10.0.0.9"),
+                ("zip.example.com.", 86400, "TXT", '"hello"'),
+            ],
+        )
+
+    def test_ttl_change(self):
+        self.new.names["foo.example.com."].records("A")._rdataset.ttl = 300
+        diff = self.old.diff(self.new)
+        self.assertIn(("foo.example.com.", 86400, "A", "10.0.0.1"), diff.removed)
+        self.assertIn(("foo.example.com.", 300, "A", "10.0.0.1"), diff.added)
+
+    def test_to_ixfr(self):
+        lines = self.old.diff(self.new).to_ixfr().splitlines()
+        self.assertEqual(len(lines), 6)
+        self.assertIn(" 2007012501 ", lines[0])
+        self.assertEqual(lines[1], "bar.example.com. 86400 IN A 10.0.0.2")
+        self.assertIn(" 2007012502 ", lines[3])
+        self.assertEqual(lines[5], 'zip.example.com. 86400 IN TXT "hello"')
+
+    def test_to_changes(self):
+        changes = self.old.diff(self.new).to_changes()
+        self.assertEqual(len(changes), 4)
+        self.old.apply(changes)
+        diff = self.old.diff(self.new)
+        self.assertEqual([r[2] for r in diff.removed + diff.added], ["SOA", "SOA"])
+
+    def test_to_changes_ttl_and_other_types(self):
+        self.new.names["foo.example.com."].records("A")._rdataset.ttl = 300
+        self.new.apply(
+            [
+                ("add", "_sip._udp.example.com.", "SRV", "10 5 5060 sip.example.com."),
+                ("add", "ptr.example.com.", "PTR", "foo.example.com.", 600),
+            ]
+        )
+        self.old.apply(self.old.diff(self.new).to_changes())
+        diff = self.old.diff(self.new)
+        self.assertEqual([r[2] for r in diff.removed + diff.added], ["SOA", "SOA"])
+        self.assertEqual(
+            self.old.names["ptr.example.com."].records("PTR").items,
+            ["foo.example.com."],
+        )
+
+    def test_to_changes_txt(self):
+        spf = '"v=spf1" "include:x"'
+        escaped = '"say \\"hi\\"\\059 bye"'
+        self.new.apply(
+            [
+                ("add", "txt.example.com.", "TXT", spf),
+                ("add", "txt.example.com.", "TXT", escaped),
+            ]
+        )
+        self.new.names["zip.example.com."].records("TXT").add("two words")
+        records = self.new.names["txt.example.com."].records("TXT")
+        self.assertEqual(
+            [rd.strings for rd in records._rdataset],
+            [[b"v=spf1", b"include:x"], [b'say "hi"; bye']],
+        )
+
+        self.old.apply(self.old.diff(self.new).to_changes())
+        diff = self.old.diff(self.new)
+        self.assertEqual([r[2] for r in diff.removed + diff.added], ["SOA", "SOA"])
+        self.assertEqual(
+            self.old.names["zip.example.com."].records("TXT").items,
+            ['"hello"', '"two words"'],
+        )
+
+    def test_diff_files(self):
+        old_file = self._save(self.old)
+        new_file = self._save(self.new)
+        diff = diff_files("example.com", old_file, new_file)
+        expected = self.old.diff(self.new)
+        self.assertEqual(diff.removed, expected.removed)
+        self.assertEqual(diff.added, expected.added)
+        self.assertEqual(diff.to_ixfr(), expected.to_ixfr())
+
+    def test_diff_files_unsorted(self):
+        zone_file = os.path.join(os.path.dirname(__file__), "files", "example.com")
+        new_file = self._save(self.new)
+        diff = diff_files("example.com", zone_file, new_file)
+        expected = self.old.diff(self.new)
+        self.assertEqual(diff.removed, expected.removed)
+        self.assertEqual(diff.added, expected.added)
+
+    def test_diff_files_after_splice(self):
+        old_file = self._save(self.old)
+        new_file = self._save(self.old)
+        zone = zone_from_file("example.com", new_file)
+        zone.apply([("add", "aaa.example.com.", "A", "10.0.0.8")])
+        zone.save()
+        diff = diff_files("example.com", old_file, new_file)
+        self.assertEqual(diff.added, [("aaa.example.com.", 86400, "A", "10.0.0.8")])
+        self.assertEqual(diff.removed, [])
+
+
+class BumpSerialTest(unittest.TestCase):
+    def setUp(self):
+        zone_file = os.path.join(os.path.dirname(__file__), "files", "example.com")
+        with open(zone_file) as f:
+            self.original = f.read()
+        self.filename = tempfile.mkstemp()[1]
+        self.write(self.original)
+
+    def tearDown(self):
+        os.unlink(self.filename)
+
+    def write(self, text):
+        with open(self.filename, "w") as f:
+            f.write(text)
+
+    def read(self):
+        with open(self.filename) as f:
+            return f.read()
+
+    def test_bump(self):
+        serial = bump_serial(self.filename, "example.com")
+        self.assertTrue(serial > 2007012501)
+        self.assertEqual(self.read(), self.original.replace("2007012501", str(serial)))
+        self.assertEqual(
+            zone_from_file("example.com", self.filename).root.soa.serial, serial
+        )
+
+    def test_bump_twice(self):
+        first = bump_serial(self.filename, "example.com")
+        self.assertEqual(bump_serial(self.filename, "example.com"), first + 1)
+
+    def test_bump_future_serial(self):
+        self.write(self.original.replace("2007012501", "9999999999"))
+        self.assertEqual(bump_serial(self.filename, "example.com"), 10000000000)
+
+    def test_bump_origin_owner(self):
+        self.write(
+            "$ORIGIN com.\n"
+            "$TTL 300\n"
+            "example  IN  SOA  ns1.example.com. root.example.com. 5 1 1 1 1\n"
+            "         IN  NS   ns1.example.com."
+        )
+        self.assertTrue(bump_serial(self.filename, "example.com.") > 5)
+
+    def test_bump_other_owner(self):
+        self.write(
+            "$TTL 300\nsub IN SOA ns1.example.com. root.example.com. 5 1 1 1 1\n"
+        )
+        self.assertRaises(ZoneError, bump_serial, self.filename, "example.com")
+
+    def test_bump_no_soa(self):
+        self.write("$TTL 300\n@ IN NS ns1.example.com.\n")
+        self.assertRaises(ZoneError, bump_serial, self.filename, "example.com")
+
+    def test_save_autoserial_in_place(self):
+        zone = zone_from_file("example.com", self.filename)
+        self.assertTrue(zone.save(autoserial=True, force=True))
+        serial = zone.root.soa.serial
+        self.assertTrue(serial > 2007012501)
+        self.assertEqual(self.read(), self.original.replace("2007012501", str(serial)))
+        # later edits are still spliced into the file correctly
+        zone.names["bar.example.com."].records("A").add("10.0.0.4")
+        zone.save()
+        saved = zone_from_file("example.com", self.filename)
+        self.assertEqual(saved.root.soa.serial, serial)
+        self.assertEqual(
+            saved.names["bar.example.com."].records("A").items,
+            ["10.0.0.2", "10.0.0.3", "10.0.0.4"],
+        )
+
+
 class ZoneModifySaveTest(unittest.TestCase):
     def setUp(self):
         self.zone = Zone("example.com.")
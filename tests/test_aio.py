@@ -0,0 +1,104 @@
+import asyncio
+import os
+import stat
+
+from pytest import fixture, raises
+
+from dnszone.aio import AsyncZoneCheck, AsyncZoneReload, aload_zone
+from dnszone.zone_check import CheckCache, ZoneCheck
+from dnszone.zone_reload import ZoneReload, ZoneReloadError
+
+
+def _script(path, body):
+    path.write_text("#!/bin/sh\n" + body)
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(path)
+
+
+@fixture
+def checkzone(tmp_path):
+    return _script(
+        tmp_path / "named-checkzone",
+        'if [ "$1" = "example.com" ]; then echo OK; exit 0; fi\n'
+        'echo "zone $1/IN: has no NS records"; exit 1\n',
+    )
+
+
+@fixture
+def rndc(tmp_path):
+    log = tmp_path / "rndc.log"
+    script = _script(
+        tmp_path / "rndc",
+        'echo "$@" >> %s\n[ "$2" != "bad.com" ]\n' % log,
+    )
+    return script, log
+
+
+def test_aload_and_asave(zone_file):
+    async def update():
+        zone = await aload_zone("example.com", zone_file)
+        zone.names["foo.example.com."].records("A").add("10.0.0.9")
+        return await zone.asave()
+
+    assert asyncio.run(update())
+    with open(zone_file) as f:
+        assert "10.0.0.9" in f.read()
+
+
+def test_async_check(checkzone, zone_file):
+    check = AsyncZoneCheck(checkzone=checkzone)
+
+    async def run():
+        return await asyncio.gather(
+            check.is_valid("example.com", zone_file),
+            check.check("foo.com", zone_file),
+        )
+
+    valid, result = asyncio.run(run())
+    assert valid
+    assert not result.valid
+    assert result.error == "zone foo.com/IN: has no NS records"
+
+
+def test_async_check_many(checkzone, zone_file, tmp_path):
+    check = AsyncZoneCheck(checkzone=checkzone, cache=CheckCache(str(tmp_path / "c")))
+    pairs = [("example.com", zone_file)] * 3 + [("foo.com", zone_file)]
+    results = asyncio.run(check.check_many(pairs, workers=2))
+    assert [r.valid for r in results] == [True, True, True, False]
+    assert len(check.cache.entries()) == 1
+
+
+def test_async_check_native(zone_file):
+    check = AsyncZoneCheck(engine="native")
+    result = asyncio.run(check.check("example.com", zone_file))
+    assert not result.valid
+    assert "no address records" in result.error
+
+
+def test_async_reload(rndc):
+    script, log = rndc
+    reload = AsyncZoneReload(rndc=script)
+
+    async def run():
+        await asyncio.gather(reload.reload("a.com"), reload.reload("b.com"))
+        await reload.reload_all()
+
+    asyncio.run(run())
+    assert sorted(log.read_text().splitlines()) == [
+        "reload",
+        "reload a.com",
+        "reload b.com",
+    ]
+    with raises(ZoneReloadError):
+        asyncio.run(reload.reload("bad.com"))
+
+
+def test_not_sync_subclasses(checkzone):
+    check = AsyncZoneCheck(checkzone=checkzone, engine="native")
+    assert not isinstance(check, ZoneCheck)
+    assert isinstance(check.checker, ZoneCheck)
+    assert check.engine == "native"
+    assert check.checkzone == checkzone
+    reload = AsyncZoneReload(rndc="/usr/sbin/rndc")
+    assert not isinstance(reload, ZoneReload)
+    assert reload.reloader.rndc == "/usr/sbin/rndc"
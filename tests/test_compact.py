@@ -0,0 +1,128 @@
+import os
+
+from pytest import fixture, raises
+
+from dnszone import compact
+from dnszone.compact import compact_zone_from_file
+from dnszone.dnszone import RecordsError, iter_records, zone_from_file
+
+ZONE_FILE = os.path.join(os.path.dirname(__file__), "files", "example.com")
+
+
+@fixture
+def zone(zone_file):
+    return compact_zone_from_file("example.com", zone_file)
+
+
+def test_load(zone):
+    names = zone.names
+    assert names["bar.example.com."].records("A").items == ["10.0.0.2", "10.0.0.3"]
+    assert names["barbar.example.com."].records("AAAA").items == ["::1", "::2"]
+    assert names["foo.example.com."].records("MX").items == [(10, "mail.example.com.")]
+    assert names["foofoo.example.com."].records("A") is None
+    assert zone.root.soa.serial == 2007012501
+    assert sorted(names) == sorted(zone_from_file("example.com", ZONE_FILE).names)
+    with raises(KeyError):
+        names["nothere.example.com."]
+
+
+def test_add_delete(zone):
+    records = zone.names["bar.example.com."].records("A")
+    records.add("10.0.0.3")
+    assert not zone.dirty
+    records.add("10.0.0.4")
+    records.delete("10.0.0.2")
+    assert records.items == ["10.0.0.3", "10.0.0.4"]
+    assert zone.dirty
+    with raises(RecordsError):
+        records.delete("10.0.0.2")
+    with raises(RecordsError):
+        records.add("not an address")
+
+    new = zone.names["foofoo.example.com."].records("AAAA", create=True)
+    new.add("2001:db8::1")
+    assert zone.names["foofoo.example.com."].records("AAAA").items == ["2001:db8::1"]
+
+
+def test_unsorted_additions(zone, monkeypatch):
+    monkeypatch.setattr(compact, "_MAX_TAIL", 2)
+    for index, name in enumerate(["foo", "bar", "foo", "bar"]):
+        zone.names[name + ".example.com."].records("A").add("10.1.0.%d" % index)
+    assert zone.names["foo.example.com."].records("A").items == [
+        "10.0.0.1",
+        "10.1.0.0",
+        "10.1.0.2",
+    ]
+    assert zone.names["bar.example.com."].records("A").items == [
+        "10.0.0.2",
+        "10.0.0.3",
+        "10.1.0.1",
+        "10.1.0.3",
+    ]
+
+
+def test_save(zone, zone_file):
+    zone.names["bar.example.com."].records("A").add("10.0.0.9")
+    zone.names["foo.example.com."].records("TXT", create=True).add("hello")
+    zone.delete_name("barbar.example.com.")
+    zone.save(autoserial=True)
+    assert not zone.dirty
+
+    saved = zone_from_file("example.com", zone_file)
+    assert saved.root.soa.serial > 2007012501
+    assert saved.names["bar.example.com."].records("A").items == [
+        "10.0.0.2",
+        "10.0.0.3",
+        "10.0.0.9",
+    ]
+    assert saved.names["foo.example.com."].records("TXT").items == ['"hello"']
+    assert "barbar.example.com." not in saved.names
+    assert len(list(iter_records("example.com", zone_file))) == 13
+
+
+def test_to_zone(zone):
+    converted = zone.to_zone()
+    original = zone_from_file("example.com", ZONE_FILE)
+    assert len(original.diff(converted)) == 0
+    assert converted.names["foo.example.com."].records("A").items == ["10.0.0.1"]
+
+
+def test_repeated_records(zone_file):
+    with open(zone_file, "a") as out:
+        out.write("bar IN A 10.0.0.2\nbar IN AAAA ::5\nfoo IN A 10.0.0.1\n")
+    zone = compact_zone_from_file("example.com", zone_file)
+    assert zone.names["bar.example.com."].records("A").items == [
+        "10.0.0.2",
+        "10.0.0.3",
+    ]
+    assert list(zone.iter_addresses()) == [
+        ("example.com.", "A", "10.0.0.1"),
+        ("foo.example.com.", "A", "10.0.0.1"),
+        ("bar.example.com.", "A", "10.0.0.2"),
+        ("bar.example.com.", "A", "10.0.0.3"),
+        ("bar.example.com.", "AAAA", "::5"),
+        ("barbar.example.com.", "AAAA", "::1"),
+        ("barbar.example.com.", "AAAA", "::2"),
+    ]
+
+    zone.save()
+    saved = zone_from_file("example.com", zone_file)
+    assert len(list(iter_records("example.com", zone_file))) == 14
+    assert saved.names["bar.example.com."].records("A").items == [
+        "10.0.0.2",
+        "10.0.0.3",
+    ]
+
+
+def test_sorted_only_after_changes(zone):
+    table = zone._tables["A"]
+    list(zone.iter_addresses())
+    owners = table.owners
+    list(zone.iter_addresses())
+    zone.names["bar.example.com."].records("A").delete("10.0.0.2")
+    list(zone.iter_addresses())
+    assert table.owners is owners
+    zone.names["bar.example.com."].records("A").add("10.0.0.9")
+    zone.names["foo.example.com."].records("A").add("10.0.0.8")
+    list(zone.iter_addresses())
+    assert table.owners is not owners
@@ -0,0 +1,120 @@
+import json
+import os
+
+from pytest import fixture, raises, warns
+
+from dnszone import instrument
+from dnszone.dnszone import zone_from_file
+from dnszone.zone_check import ZoneCheck
+from dnszone.zone_reload import ZoneReload, ZoneReloadError
+
+
+@fixture
+def metrics():
+    collector = instrument.MetricsCollector()
+    instrument.add_hook(collector)
+    yield collector
+    instrument.remove_hook(collector)
+
+
+class Recorder(instrument.Hook):
+    def __init__(self):
+        self.events = []
+
+    def start(self, op):
+        self.events.append(("start", op.name, dict(op.attrs)))
+
+    def finish(self, op):
+        self.events.append(("finish", op.name, dict(op.attrs)))
+
+
+def test_no_hooks():
+    op = instrument.operation("load", zone="example.com.")
+    assert not op
+    with op:
+        op.set(records=1)
+
+
+def test_start_and_finish(zone_file):
+    recorder = Recorder()
+    instrument.add_hook(recorder)
+    try:
+        zone_from_file("example.com", zone_file)
+    finally:
+        instrument.remove_hook(recorder)
+    zone_from_file("example.com", zone_file)
+    assert [e[:2] for e in recorder.events] == [
+        ("start", "load"),
+        ("finish", "load"),
+    ]
+    attrs = recorder.events[1][2]
+    assert attrs["zone"] == "example.com."
+    assert attrs["records"] == 13
+    assert attrs["bytes"] == os.path.getsize(zone_file)
+
+
+def test_load_and_save(metrics, zone_file):
+    zone = zone_from_file("example.com", zone_file)
+    zone.names["foo.example.com."].records("A").add("10.0.0.9")
+    zone.save()
+    zone.save()
+    summary = metrics.summary()
+    assert summary["load"]["count"] == 1
+    assert summary["load"]["records_total"] == 13
+    assert summary["save"]["count"] == 2
+    assert summary["save"]["records_total"] == 14
+    assert summary["save"]["bytes_total"] == os.path.getsize(zone_file)
+
+
+def test_check_and_reload(metrics, mocker, zone_file):
+    mocker.patch("dnszone.zone_check.subprocess.call", return_value=1)
+    assert not ZoneCheck().isValid("example.com", zone_file)
+    call = mocker.patch("dnszone.zone_reload.subprocess.call", return_value=0)
+    ZoneReload().reload("example.com")
+    call.return_value = 2
+    with raises(ZoneReloadError):
+        ZoneReload().reload_all()
+    summary = metrics.summary()
+    assert summary["check"]["exit_codes"] == {1: 1}
+    assert summary["check"]["errors"] == 0
+    assert summary["reload"]["exit_codes"] == {0: 1}
+    assert summary["reload_all"]["errors"] == 1
+
+
+def test_prometheus(metrics, tmp_path, zone_file):
+    zone_from_file("example.com", zone_file)
+    filename = str(tmp_path / "dnszone.prom")
+    metrics.write_prometheus(filename)
+    with open(filename) as f:
+        text = f.read()
+    assert "# TYPE dnszone_operation_seconds histogram" in text
+    assert 'dnszone_operation_seconds_count{operation="load"} 1' in text
+    assert 'dnszone_operation_seconds_bucket{operation="load",le="+Inf"} 1' in text
+    assert 'dnszone_operation_records_total{operation="load"} 13' in text
+    assert sorted(os.listdir(str(tmp_path))) == ["dnszone.prom", "example.com"]
+
+
+def test_json(metrics, tmp_path, zone_file):
+    zone_from_file("example.com", zone_file)
+    filename = str(tmp_path / "dnszone.json")
+    metrics.write_json(filename)
+    with open(filename) as f:
+        summary = json.load(f)
+    assert summary["load"]["count"] == 1
+    metrics.reset()
+    assert metrics.summary() == {}
+
+
+def test_failing_hook(zone_file):
+    class Broken(instrument.Hook):
+        def finish(self, op):
+            raise ValueError("broken")
+
+    hook = Broken()
+    instrument.add_hook(hook)
+    try:
+        with warns(RuntimeWarning):
+            zone = zone_from_file("example.com", zone_file)
+    finally:
+        instrument.remove_hook(hook)
+    assert zone.root is not None
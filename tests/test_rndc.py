@@ -0,0 +1,170 @@
+import base64
+import socket
+import threading
+
+from pytest import fixture, raises
+
+from dnszone.rndc import (
+    RndcClient,
+    RndcError,
+    decode_message,
+    encode_message,
+    read_message,
+)
+from dnszone.zone_reload import ZoneReload, ZoneReloadError
+
+SECRET = base64.b64encode(b"0123456789abcdef0123456789abcdef").decode("ascii")
+KEY = base64.b64decode(SECRET)
+
+
+class ControlChannel(object):
+    """A stand-in for named's control channel."""
+
+    def __init__(self, algorithm="hmac-sha256", zones=("example.com",)):
+        self.algorithm = algorithm
+        self.zones = zones
+        self.commands = []
+        self.connections = 0
+        self.listener = socket.socket()
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(5)
+        self.port = self.listener.getsockname()[1]
+        self.thread = threading.Thread(target=self._serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                return
+            self.connections += 1
+            with conn:
+                self._handle(conn)
+
+    def _handle(self, conn):
+        nonce = None
+        while True:
+            try:
+                request = read_message(conn, KEY, self.algorithm)
+            except (EOFError, OSError, RndcError):
+                return
+            ctrl = request[b"_ctrl"]
+            command = request[b"_data"][b"type"].decode("ascii")
+            data = {"type": command, "result": "0"}
+            if nonce is None:
+                nonce = b"12345"
+            elif ctrl.get(b"_nonce") != nonce:
+                return
+            else:
+                self.commands.append(command)
+                words = command.split()
+                if command == "drop":
+                    return
+                if len(words) > 1 and words[1] not in self.zones:
+                    data.update(result="1", err="not found")
+                else:
+                    data["text"] = "zone %s queued" % words[0]
+            reply = {
+                "_ctrl": {"_ser": ctrl[b"_ser"], "_rpl": "1", "_nonce": nonce},
+                "_data": data,
+            }
+            conn.sendall(encode_message(reply, KEY, self.algorithm))
+
+    def close(self):
+        self.listener.close()
+
+
+@fixture
+def server():
+    server = ControlChannel()
+    yield server
+    server.close()
+
+
+def test_auth_layout():
+    message = encode_message({"_data": {"type": "null"}}, KEY, "hmac-md5")
+    assert message[8:29] == (
+        b"\x05_auth\x02\x00\x00\x00\x20\x04hmd5\x01\x00\x00\x00\x16"
+    )
+    message = encode_message({"_data": {"type": "null"}}, KEY, "hmac-sha256")
+    assert message[8:30] == (
+        b"\x05_auth\x02\x00\x00\x00\x63\x04hsha\x01\x00\x00\x00\x59\xa3"
+    )
+
+
+def test_roundtrip():
+    message = {"_ctrl": {"_ser": "1"}, "_data": {"type": "reload", "list": ["a"]}}
+    data = encode_message(message, KEY, "hmac-sha1")
+    decoded = decode_message(data[4:], KEY, "hmac-sha1")
+    assert decoded[b"_ctrl"] == {b"_ser": b"1"}
+    assert decoded[b"_data"] == {b"type": b"reload", b"list": [b"a"]}
+
+
+def test_bad_signature():
+    data = bytearray(encode_message({"_data": {"type": "null"}}, KEY, "hmac-md5"))
+    data[-1] ^= 1
+    with raises(RndcError):
+        decode_message(bytes(data[4:]), KEY, "hmac-md5")
+    data = encode_message({"_data": {"type": "null"}}, b"other", "hmac-md5")
+    with raises(RndcError):
+        decode_message(data[4:], KEY, "hmac-md5")
+
+
+def test_client_persistent_connection(server):
+    with RndcClient(port=server.port, secret=SECRET) as client:
+        assert client.reload("example.com") == "zone reload queued"
+        assert client.notify("example.com") == "zone notify queued"
+        assert client.refresh("example.com") == "zone refresh queued"
+        client.reload_all()
+    assert server.commands == [
+        "reload example.com",
+        "notify example.com",
+        "refresh example.com",
+        "reload",
+    ]
+    assert server.connections == 1
+
+
+def test_client_error(server):
+    client = RndcClient(port=server.port, secret=SECRET)
+    with raises(RndcError) as error:
+        client.reload("foo.com")
+    assert "not found" in str(error.value)
+    client.close()
+
+
+def test_client_reconnects(server):
+    client = RndcClient(port=server.port, secret=SECRET)
+    client.reload("example.com")
+    # The server drops the connection without replying
+    with raises(RndcError):
+        client.call("drop")
+    assert client.reload("example.com") == "zone reload queued"
+    assert server.connections >= 2
+    client.close()
+
+
+def test_client_md5(tmp_path):
+    server = ControlChannel(algorithm="hmac-md5")
+    key_file = tmp_path / "rndc.key"
+    key_file.write_text(
+        'key "rndc-key" {\n\talgorithm hmac-md5;\n\tsecret "%s";\n};\n' % SECRET
+    )
+    client = RndcClient.from_key_file(str(key_file), port=server.port)
+    assert client.algorithm == "hmac-md5"
+    assert client.reload("example.com") == "zone reload queued"
+    client.close()
+    server.close()
+
+
+def test_zone_reload_client(server, mocker):
+    call = mocker.patch("dnszone.zone_reload.subprocess.call")
+    reload = ZoneReload(client=RndcClient(port=server.port, secret=SECRET))
+    reload.reload("example.com")
+    reload.reload_all()
+    with raises(ZoneReloadError):
+        reload.reload("foo.com")
+    assert not call.called
+    assert server.commands == ["reload example.com", "reload", "reload foo.com"]
@@ -0,0 +1,146 @@
+import os
+import pickle
+import shutil
+
+from pytest import fixture
+
+from dnszone.dnszone import zone_from_file
+from dnszone.zone_cache import ZoneCache, dumps_zone, loads_zone
+
+ZONE_FILE = os.path.join(os.path.dirname(__file__), "files", "example.com")
+
+
+@fixture
+def cache(tmp_path):
+    return ZoneCache(str(tmp_path / "cache"))
+
+
+def test_dumps_loads_roundtrip():
+    zone = zone_from_file("example.com", ZONE_FILE)
+    copy = loads_zone(dumps_zone(zone._zone))
+    assert copy.origin == zone._zone.origin
+    assert copy == zone._zone
+
+
+def test_cache_miss_then_hit(cache, zone_file, mocker):
+    zone = zone_from_file("example.com", zone_file, cache=cache)
+    assert len(cache.entries()) == 1
+    from_file = mocker.patch("dnszone.dnszone.ZoneReader")
+    cached = zone_from_file("example.com", zone_file, cache=cache)
+    assert not from_file.called
+    assert cached.root.soa.serial == zone.root.soa.serial
+    assert cached.names["bar.example.com."].records("A").items == [
+        "10.0.0.2",
+        "10.0.0.3",
+    ]
+
+
+def test_cache_keeps_text(cache, zone_file):
+    zone = zone_from_file("example.com", zone_file)
+    zone_from_file("example.com", zone_file, cache=cache)
+    cached = zone_from_file("example.com", zone_file, cache=cache)
+    assert cached.names["barbar.example.com."].records("AAAA").items == [
+        "0000:0000:0000:0000:0000:0000:0000:0001",
+        "0000:0000:0000:0000:0000:0000:0000:0002",
+    ]
+    for key, name in zone.names.items():
+        for rectype in ("A", "AAAA", "MX", "NS", "CNAME"):
+            records = name.records(rectype)
+            if records is not None:
+                assert cached.names[key].records(rectype).items == records.items
+    pickled = pickle.loads(pickle.dumps(zone))
+    assert pickled.names["barbar.example.com."].records("AAAA").items == (
+        zone.names["barbar.example.com."].records("AAAA").items
+    )
+
+
+def test_cache_detects_change(cache, zone_file):
+    zone_from_file("example.com", zone_file, cache=cache)
+    with open(zone_file, "a") as f:
+        f.write("new     IN      A       10.0.0.9\n")
+    zone = zone_from_file("example.com", zone_file, cache=cache)
+    assert "new.example.com." in zone.names
+
+
+def test_cache_touched_file_reused(cache, zone_file, mocker):
+    zone_from_file("example.com", zone_file, cache=cache)
+    st = os.stat(zone_file)
+    os.utime(zone_file, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    from_file = mocker.patch("dnszone.dnszone.ZoneReader")
+    zone_from_file("example.com", zone_file, cache=cache)
+    assert not from_file.called
+
+
+def test_cache_verify_and_invalidate(cache, zone_file):
+    zone_from_file("example.com", zone_file, cache=cache)
+    assert cache.verify("example.com.", zone_file)
+    assert cache.verify_all() == []
+    with open(zone_file, "a") as f:
+        f.write("; comment\n")
+    assert len(cache.verify_all()) == 1
+    assert cache.entries() == []
+
+    zone_from_file("example.com", zone_file, cache=cache)
+    cache.invalidate("example.com.", zone_file)
+    assert cache.load("example.com.", zone_file) is None
+
+
+def test_cache_lru_eviction(tmp_path, zone_file):
+    cache = ZoneCache(str(tmp_path / "cache"), max_entries=2)
+    paths = []
+    for i in range(3):
+        path = str(tmp_path / ("zone%d" % i))
+        shutil.copy(zone_file, path)
+        paths.append(path)
+        zone_from_file("example.com", path, cache=cache)
+        # make sure each entry has a distinct LRU timestamp
+        for entry, _ in cache.entries():
+            st = os.stat(entry)
+            os.utime(entry, (st.st_atime - 10, st.st_mtime - 10))
+    assert len(cache.entries()) == 2
+    assert cache.load("example.com.", paths[0]) is None
+    assert cache.load("example.com.", paths[2]) is not None
+
+
+def test_cache_corrupt_snapshot(cache, zone_file):
+    zone_from_file("example.com", zone_file, cache=cache)
+    (path, size) = cache.entries()[0]
+    with open(path, "rb") as f:
+        data = f.read()
+    for broken in (data[:60], data[:-7], data[:57] + b"\xff" * 40 + data[97:]):
+        with open(path, "wb") as f:
+            f.write(broken)
+        assert cache.load("example.com.", zone_file) is None
+        zone = zone_from_file("example.com", zone_file, cache=cache)
+        assert zone.names["bar.example.com."].records("A").items == [
+            "10.0.0.2",
+            "10.0.0.3",
+        ]
+    with open(path, "wb") as f:
+        f.write(data[:60])
+    assert cache.verify_all() == [path]
+
+
+def test_cache_entry_removed_meanwhile(tmp_path, zone_file, mocker):
+    cache = ZoneCache(str(tmp_path / "cache"), max_entries=1)
+    zone_from_file("example.com", zone_file, cache=cache)
+    listdir = os.listdir(cache.cache_dir) + ["gone.snap"]
+    mocker.patch("dnszone.zone_cache.os.listdir", return_value=listdir)
+    assert len(cache.entries()) == 1
+    unlink = mocker.patch("dnszone.zone_cache.os.unlink", side_effect=FileNotFoundError)
+    cache.max_entries = 0
+    cache.evict()
+    cache.clear()
+    assert unlink.call_count == 2
+
+
+def test_large_rdataset():
+    zone = zone_from_file("example.com", ZONE_FILE)
+    records = zone.names["bar.example.com."].records("A")
+    records.add_many(
+        ["10.%d.%d.%d" % (i >> 16, i >> 8 & 255, i & 255) for i in range(70000)]
+    )
+    copy = loads_zone(dumps_zone(zone._zone))
+    rds = copy.find_rdataset("bar.example.com.", "A")
+    assert len(rds) == 70000
+    assert rds[-1].address == "10.1.17.111"
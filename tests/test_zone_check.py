@@ -1,6 +1,8 @@
+import subprocess
+
 from pytest import fixture
 
-from dnszone.zone_check import ZoneCheck
+from dnszone.zone_check import CheckCache, ZoneCheck
 
 
 @fixture
@@ -18,3 +20,131 @@ def test_zone_check_good(zone, mocker):
     mocker.patch("dnszone.zone_check.subprocess.call", return_value=0)
     assert zone.isValid("a", "b")
     assert zone.error is None
+
+
+def _completed(returncode, stdout=""):
+    return subprocess.CompletedProcess([], returncode, stdout=stdout)
+
+
+def test_check_good(zone, mocker):
+    run = mocker.patch(
+        "dnszone.zone_check.subprocess.run", return_value=_completed(0, "OK\n")
+    )
+    result = zone.check("a", "b")
+    assert result.valid
+    assert result.error is None
+    assert result.duration >= 0
+    assert run.call_args[0][0] == ["checkzone", "a", "b"]
+
+
+def test_check_bad(zone, mocker):
+    mocker.patch(
+        "dnszone.zone_check.subprocess.run",
+        return_value=_completed(1, "zone a/IN: has no NS records\n"),
+    )
+    result = zone.check("a", "b")
+    assert not result.valid
+    assert result.error == "zone a/IN: has no NS records"
+    assert zone.error is None
+
+
+def test_check_missing_binary():
+    zone = ZoneCheck(checkzone="/nonexistent/named-checkzone")
+    result = zone.check("a", "b")
+    assert not result.valid
+    assert "nonexistent" in result.error
+
+
+def test_check_many(zone, mocker):
+    def run(cmd, **kwargs):
+        return _completed(0 if cmd[1].startswith("good") else 1)
+
+    mocker.patch("dnszone.zone_check.subprocess.run", side_effect=run)
+    pairs = [("good%d" % i, "f") for i in range(5)] + [("bad", "f")]
+    results = zone.check_many(pairs, workers=3)
+    assert [r.zonename for r in results] == [p[0] for p in pairs]
+    assert [r.valid for r in results] == [True] * 5 + [False]
+    assert results[-1].error == "Bad syntax"
+
+
+@fixture
+def cached(tmp_path):
+    checkzone = tmp_path / "named-checkzone"
+    checkzone.write_text("#!/bin/sh\n")
+    zone_file = tmp_path / "example.com"
+    zone_file.write_text("example zone\n")
+    cache = CheckCache(str(tmp_path / "cache"), max_entries=2)
+    return ZoneCheck(checkzone=str(checkzone), cache=cache), str(zone_file)
+
+
+def test_cache_skips_unchanged(cached, mocker):
+    zone, zone_file = cached
+    call = mocker.patch("dnszone.zone_check.subprocess.call", return_value=0)
+    assert zone.isValid("example.com", zone_file)
+    assert zone.isValid("example.com", zone_file)
+    assert call.call_count == 1
+    run = mocker.patch("dnszone.zone_check.subprocess.run")
+    assert zone.check("example.com", zone_file).valid
+    assert not run.called
+
+
+def test_cache_not_used_for_failures(cached, mocker):
+    zone, zone_file = cached
+    call = mocker.patch("dnszone.zone_check.subprocess.call", return_value=1)
+    assert not zone.isValid("example.com", zone_file)
+    assert not zone.isValid("example.com", zone_file)
+    assert call.call_count == 2
+
+
+def test_cache_key_changes(cached, mocker):
+    zone, zone_file = cached
+    call = mocker.patch("dnszone.zone_check.subprocess.call", return_value=0)
+    zone.isValid("example.com", zone_file)
+    zone.isValid("example.org", zone_file)
+    assert call.call_count == 2
+    with open(zone_file, "a") as f:
+        f.write("changed\n")
+    zone.isValid("example.com", zone_file)
+    assert call.call_count == 3
+
+
+def test_cache_bypass(cached, mocker):
+    zone, zone_file = cached
+    call = mocker.patch("dnszone.zone_check.subprocess.call", return_value=0)
+    zone.isValid("example.com", zone_file)
+    zone.isValid("example.com", zone_file, bypass_cache=True)
+    assert call.call_count == 2
+
+
+def test_cache_eviction(cached, mocker):
+    zone, zone_file = cached
+    mocker.patch("dnszone.zone_check.subprocess.call", return_value=0)
+    for name in ("a.com", "b.com", "c.com"):
+        zone.isValid(name, zone_file)
+    assert len(zone.cache.entries()) == 2
+    zone.cache.clear()
+    assert zone.cache.entries() == []
+
+
+def test_cache_concurrent_eviction(tmp_path, mocker):
+    checkzone = tmp_path / "named-checkzone"
+    checkzone.write_text("#!/bin/sh\n")
+    zone_file = tmp_path / "example.com"
+    zone_file.write_text("example zone\n")
+    cache = CheckCache(str(tmp_path / "cache"), max_entries=5)
+    zone = ZoneCheck(checkzone=str(checkzone), cache=cache)
+    mocker.patch("dnszone.zone_check.subprocess.run", return_value=_completed(0))
+    for batch in range(5):
+        pairs = [("z%d-%d.com" % (batch, i), str(zone_file)) for i in range(64)]
+        results = zone.check_many(pairs, workers=32)
+        assert all(r.valid for r in results)
+        assert len(cache.entries()) <= 5
+
+
+def test_cache_entry_removed_meanwhile(cached, mocker):
+    zone, zone_file = cached
+    mocker.patch("dnszone.zone_check.subprocess.call", return_value=0)
+    zone.isValid("a.com", zone_file)
+    mocker.patch("dnszone.zone_check.os.stat", side_effect=FileNotFoundError)
+    assert zone.cache.entries() == []
+    zone.cache.evict()
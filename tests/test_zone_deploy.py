@@ -0,0 +1,103 @@
+import os
+import shutil
+
+from pytest import fixture
+
+from dnszone.dnszone import zone_from_file
+from dnszone.zone_check import ZoneCheck
+from dnszone.zone_deploy import ZoneDeployer
+from dnszone.zone_reload import ZoneReloadError
+
+ZONE_FILE = os.path.join(os.path.dirname(__file__), "files", "example.com")
+GLUE = "ns1     IN      A       10.0.0.53\nns2     IN      A       10.0.0.54\n"
+
+
+@fixture
+def zones(tmp_path):
+    zones = []
+    for domain in ("example.com", "example.net", "example.org"):
+        path = str(tmp_path / domain)
+        with open(ZONE_FILE) as src, open(path, "w") as dst:
+            dst.write(src.read().replace("example.com.", domain + "."))
+            dst.write(GLUE)
+        zone = zone_from_file(domain, path)
+        zone.names["foo.%s." % domain].records("A").add("10.0.0.9")
+        zones.append(zone)
+    # Break example.org by removing its NS records
+    zones[2].root.clear_all_records(exclude="SOA")
+    return zones
+
+
+def _read(zone):
+    with open(zone.filename) as f:
+        return f.read()
+
+
+def test_deploy(zones, fake_reload):
+    reloader = fake_reload()
+    before = _read(zones[2])
+    serial = zones[2].root.soa.serial
+    deployer = ZoneDeployer(checker=ZoneCheck(engine="native"), reloader=reloader)
+    report = deployer.deploy(zones, autoserial=True)
+
+    assert report.deployed == ["example.com.", "example.net."]
+    assert list(report.failed) == ["example.org."]
+    stage, error = report.failed["example.org."]
+    assert stage == "check"
+    assert "zone has no NS records" in error
+    assert sorted(reloader.calls) == ["example.com.", "example.net."]
+    assert set(report.timings) == {"write", "check", "promote", "reload"}
+    assert report.elapsed >= report.timings["reload"]
+
+    for zone in zones[:2]:
+        assert "10.0.0.9" in _read(zone)
+        assert not zone.dirty
+        assert zone.root.soa.serial > 2007012501
+    # The failed zone is left as it was, serial and all
+    assert _read(zones[2]) == before
+    assert zones[2].root.soa.serial == serial
+    assert zones[2].dirty
+    leftovers = [
+        f for f in os.listdir(os.path.dirname(zones[0].filename)) if f[0] == "."
+    ]
+    assert leftovers == []
+
+
+def test_deploy_reload_failure(zones, fake_reload):
+    reloader = fake_reload(fail=("example.net.",))
+    deployer = ZoneDeployer(checker=ZoneCheck(engine="native"), reloader=reloader)
+    report = deployer.deploy(zones[:2])
+    assert report.deployed == ["example.com."]
+    assert report.failed["example.net."][0] == "reload"
+    assert "10.0.0.9" in _read(zones[1])
+
+
+def test_deploy_global_reload(zones, fake_reload):
+    reloader = fake_reload()
+    deployer = ZoneDeployer(
+        checker=ZoneCheck(engine="native"), reloader=reloader, global_threshold=1
+    )
+    report = deployer.deploy(zones[:2])
+    assert report.deployed == ["example.com.", "example.net."]
+    assert reloader.calls == [None]
+
+
+def test_deploy_write_failure(zones, tmp_path, fake_reload):
+    zones[0].filename = str(tmp_path / "missing" / "example.com")
+    deployer = ZoneDeployer(checker=ZoneCheck(engine="native"), reloader=fake_reload())
+    report = deployer.deploy(zones[:2], reload=False)
+    assert report.deployed == ["example.net."]
+    assert report.failed["example.com."][0] == "write"
+
+
+def test_stage_discard(tmp_path):
+    path = str(tmp_path / "example.com")
+    shutil.copy(ZONE_FILE, path)
+    zone = zone_from_file("example.com", path)
+    tmpname = zone.stage(autoserial=True)
+    assert os.path.exists(tmpname)
+    assert zone.root.soa.serial != 2007012501
+    zone.discard_staged()
+    assert not os.path.exists(tmpname)
+    assert zone.root.soa.serial == 2007012501
+    assert not zone.dirty
@@ -0,0 +1,80 @@
+import os
+
+import dns.exception
+import dns.rdatatype
+from pytest import fixture, raises
+
+from dnszone.zone_reader import ZoneReader
+
+ZONE_FILE = os.path.join(os.path.dirname(__file__), "files", "example.com")
+
+
+@fixture
+def records():
+    return list(ZoneReader("example.com.", ZONE_FILE))
+
+
+def test_reader_all_records(records):
+    assert len(records) == 13
+    name, ttl, rdtype, rd = records[0]
+    assert str(name) == "example.com."
+    assert ttl == 86400
+    assert rdtype == dns.rdatatype.SOA
+
+
+def test_reader_origin(records):
+    names = [str(r[0]) for r in records]
+    assert "foo.example.com." in names
+    assert "barbar.example.com." in names
+
+
+def test_reader_types():
+    records = list(ZoneReader("example.com.", ZONE_FILE, types=["A", "AAAA"]))
+    assert set(r[2] for r in records) == {dns.rdatatype.A, dns.rdatatype.AAAA}
+    assert len(records) == 6
+
+
+def test_reader_under():
+    records = list(ZoneReader("example.com.", ZONE_FILE, under="bar.example.com."))
+    assert [str(r[3]) for r in records] == ["10.0.0.2", "10.0.0.3"]
+
+
+def test_reader_include_and_ttl(tmp_path):
+    included = tmp_path / "hosts"
+    included.write_text("host1  IN  A  10.1.1.1\nhost2  60  IN  A  10.1.1.2\n")
+    zone = tmp_path / "example.org"
+    zone.write_text(
+        "$TTL 300\n"
+        "@  IN  SOA  ns1.example.org. root.example.org. 1 2 3 4 5\n"
+        "   IN  NS   ns1.example.org.\n"
+        "$INCLUDE %s lab.example.org.\n"
+        "www  IN  CNAME  host1.lab\n" % included
+    )
+    records = [
+        (str(n), ttl, str(rd)) for n, ttl, t, rd in ZoneReader("example.org", str(zone))
+    ]
+    assert ("host1.lab.example.org.", 300, "10.1.1.1") in records
+    assert ("host2.lab.example.org.", 60, "10.1.1.2") in records
+    # the origin is restored after the $INCLUDE
+    assert ("www.example.org.", 300, "host1.lab.example.org.") in records
+
+
+def test_reader_syntax_error(tmp_path):
+    zone = tmp_path / "bad"
+    zone.write_text("$TTL 300\n@ IN BOGUS foo\n")
+    with raises(dns.exception.SyntaxError):
+        list(ZoneReader("example.org", str(zone)))
+
+
+def test_reader_generate():
+    filename = os.path.join(os.path.dirname(__file__), "files", "generate.example.com")
+    reader = ZoneReader("example.com.", filename)
+    records = [(str(r[0]), r[1], str(r[3])) for r in reader]
+    assert records[2:] == [
+        ("host1.example.com.", 86400, "10.0.1.1"),
+        ("host2.example.com.", 86400, "10.0.1.2"),
+        ("host3.example.com.", 86400, "10.0.1.3"),
+        ("mx011.example.com.", 300, "10 mail1.example.com."),
+        ("mx012.example.com.", 300, "10 mail2.example.com."),
+    ]
+    assert reader.generated
@@ -1,6 +1,9 @@
+import threading
+import time
+
 from pytest import fixture, raises
 
-from dnszone.zone_reload import ZoneReload, ZoneReloadError
+from dnszone.zone_reload import ReloadScheduler, ZoneReload, ZoneReloadError
 
 
 @fixture
@@ -17,3 +20,79 @@ def test_zone_reload_invalid(zone, mocker):
     mocker.patch("dnszone.zone_reload.subprocess.call", return_value=1)
     with raises(ZoneReloadError):
         zone.reload("a")
+
+
+def test_zone_reload_all(zone, mocker):
+    call = mocker.patch("dnszone.zone_reload.subprocess.call", return_value=0)
+    assert zone.reload_all() is None
+    assert call.call_args[0][0] == ["rndc", "reload"]
+
+
+def test_scheduler_coalesces(fake_reload):
+    reloader = fake_reload()
+    with ReloadScheduler(reloader, debounce=0.2) as scheduler:
+        for _ in range(50):
+            scheduler.request("a")
+            scheduler.request("b")
+        assert scheduler.pending == {"a", "b"}
+        assert reloader.calls == []
+        assert scheduler.wait(5)
+    assert sorted(reloader.calls) == ["a", "b"]
+
+
+def test_scheduler_flush(fake_reload):
+    reloader = fake_reload(fail=("bad",))
+    scheduler = ReloadScheduler(reloader, debounce=60)
+    scheduler.request("a")
+    scheduler.request("bad")
+    errors = scheduler.flush(5)
+    assert sorted(reloader.calls) == ["a", "bad"]
+    assert [zone for zone, _ in errors] == ["bad"]
+    assert isinstance(errors[0][1], ZoneReloadError)
+    assert scheduler.flush(5) == []
+    scheduler.close()
+    with raises(ZoneReloadError):
+        scheduler.request("a")
+
+
+def test_scheduler_concurrency_cap(fake_reload):
+    reloader = fake_reload(delay=0.05)
+    with ReloadScheduler(reloader, debounce=0, max_concurrent=2) as scheduler:
+        for i in range(8):
+            scheduler.request("zone%d" % i)
+        scheduler.flush(5)
+    assert len(reloader.calls) == 8
+    assert reloader.max_active <= 2
+
+
+def test_scheduler_rerequest_while_running(fake_reload):
+    reloader = fake_reload(delay=0.2)
+    with ReloadScheduler(reloader, debounce=0) as scheduler:
+        scheduler.request("a")
+        time.sleep(0.1)
+        scheduler.request("a")
+        scheduler.flush(5)
+    assert reloader.calls == ["a", "a"]
+
+
+def test_scheduler_global_reload(fake_reload):
+    reloader = fake_reload()
+    with ReloadScheduler(reloader, debounce=60, global_threshold=3) as scheduler:
+        for i in range(5):
+            scheduler.request("zone%d" % i)
+        scheduler.flush(5)
+    assert reloader.calls == [None]
+
+
+def test_scheduler_global_reload_runs_alone(fake_reload):
+    reloader = fake_reload(delay=0.2)
+    with ReloadScheduler(reloader, debounce=0, global_threshold=2) as scheduler:
+        scheduler.request("a")
+        time.sleep(0.05)
+        for i in range(3):
+            scheduler.request("zone%d" % i)
+        time.sleep(0.25)
+        scheduler.request("b")
+        scheduler.flush(5)
+    assert reloader.calls == ["a", None, "b"]
+    assert reloader.max_active == 1
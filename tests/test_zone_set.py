@@ -0,0 +1,120 @@
+import os
+import pickle
+import shutil
+
+from pytest import fixture
+
+from dnszone.dnszone import zone_from_file
+from dnszone.zone_set import (
+    ZoneSet,
+    parse_named_conf,
+    zones_from_directory,
+    zones_from_named_conf,
+)
+
+ZONE_FILE = os.path.join(os.path.dirname(__file__), "files", "example.com")
+
+
+@fixture
+def zone_dir(tmp_path):
+    for domain in ("example.com", "example.net", "example.org"):
+        with open(ZONE_FILE) as src, open(str(tmp_path / domain), "w") as dst:
+            dst.write(src.read().replace("example.com.", domain + "."))
+    with open(str(tmp_path / "broken.com"), "w") as f:
+        f.write("$TTL 300\n@ IN SOA ns1 hostmaster 1 2 3 4 5\nfoo IN BOGUS 1\n")
+    with open(str(tmp_path / ".hidden"), "w") as f:
+        f.write("not a zone\n")
+    return tmp_path
+
+
+def test_zone_pickle_roundtrip(tmp_path):
+    path = str(tmp_path / "example.com")
+    shutil.copy(ZONE_FILE, path)
+    zone = zone_from_file("example.com", path)
+    assert "foo.example.com." in zone.names
+    copy = pickle.loads(pickle.dumps(zone))
+    assert copy._zone == zone._zone
+    assert copy.filename == path
+    assert copy.names["bar.example.com."].records("A").items == [
+        "10.0.0.2",
+        "10.0.0.3",
+    ]
+    # Still able to update the file in place
+    copy.names["foo.example.com."].records("A").add("10.0.0.9")
+    assert copy._can_splice()
+    assert copy.save()
+
+
+def test_zones_from_directory(zone_dir):
+    zones = zones_from_directory(str(zone_dir), workers=2)
+    assert isinstance(zones, ZoneSet)
+    assert sorted(zones) == ["example.com.", "example.net.", "example.org."]
+    assert zones["example.net."].names["bar.example.net."].records("A").items == [
+        "10.0.0.2",
+        "10.0.0.3",
+    ]
+    assert list(zones.errors) == ["broken.com."]
+    assert "BOGUS" in str(zones.errors["broken.com."])
+
+
+def test_zones_from_directory_in_process(zone_dir):
+    zones = zones_from_directory(str(zone_dir), workers=1)
+    assert len(zones) == 3
+    assert list(zones.errors) == ["broken.com."]
+
+
+def test_zones_from_directory_suffix(zone_dir):
+    os.rename(str(zone_dir / "example.org"), str(zone_dir / "example.org.zone"))
+    zones = zones_from_directory(str(zone_dir), suffix=".zone")
+    assert list(zones) == ["example.org."]
+    assert zones.errors == {}
+
+
+def test_reload_clears_error(zone_dir):
+    zones = zones_from_directory(str(zone_dir), workers=1)
+    shutil.copy(str(zone_dir / "example.com"), str(zone_dir / "broken.com"))
+    zones.load({"broken.com": str(zone_dir / "broken.com")})
+    assert "broken.com." not in zones.errors
+    assert len(zones) == 4
+
+
+def test_parse_named_conf(tmp_path):
+    conf = tmp_path / "named.conf"
+    conf.write_text(
+        """
+options {
+    listen-on { any; };
+    directory "/var/named";  // zone files live here
+};
+
+# a comment mentioning zone "commented.com" { file "x"; };
+zone "example.com" IN {
+    type master;
+    file "zones/example.com";
+    allow-update { none; };
+};
+zone "0.10.in-addr.arpa" {
+    type master;
+    key-file "ignored";
+    file "/srv/zones/10.0";
+};
+zone "forward.com" {
+    type forward;
+    forwarders { 10.0.0.1; };
+};
+"""
+    )
+    assert parse_named_conf(str(conf)) == {
+        "example.com": "/var/named/zones/example.com",
+        "0.10.in-addr.arpa": "/srv/zones/10.0",
+    }
+
+
+def test_zones_from_named_conf(zone_dir):
+    conf = zone_dir / "named.conf"
+    conf.write_text(
+        'zone "example.com" { file "example.com"; };\n'
+        'zone "example.org" { file "example.org"; };\n'
+    )
+    zones = zones_from_named_conf(str(conf), workers=2)
+    assert sorted(zones) == ["example.com.", "example.org."]
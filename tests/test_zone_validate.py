@@ -0,0 +1,147 @@
+import os
+
+from pytest import fixture
+
+from dnszone.dnszone import zone_from_file
+from dnszone.zone_check import ZoneCheck
+from dnszone.zone_validate import ERROR, WARNING, validate_file
+
+ZONE_FILE = os.path.join(os.path.dirname(__file__), "files", "example.com")
+
+BAD_ZONE = """$TTL 3600
+@       IN      SOA     ns1 hostmaster 1 3600 7200 1800 172800
+        IN      NS      ns1
+        IN      NS      ns2
+        IN      NS      www
+        IN      MX      10 www
+ns1     IN      A       10.0.0.1
+www     IN      CNAME   ns1
+        IN      TXT     "web"
+sub     IN      NS      ns.sub
+        IN      NS      ns.elsewhere.net.
+ns.sub  IN      A       10.0.1.1
+host.sub IN     A       10.0.1.2
+dup     IN      A       10.0.0.5
+        IN      A       10.0.0.5
+mixed   IN      A       10.0.0.6
+mixed   300 IN  A       10.0.0.7
+"""
+
+
+@fixture
+def bad_zone(tmp_path):
+    path = str(tmp_path / "example.com")
+    with open(path, "w") as f:
+        f.write(BAD_ZONE)
+    return path
+
+
+@fixture
+def good_zone(tmp_path):
+    path = str(tmp_path / "good.com")
+    with open(ZONE_FILE) as src, open(path, "w") as dst:
+        dst.write(src.read())
+        dst.write("ns1     IN      A       10.0.0.53\n")
+        dst.write("ns2     IN      A       10.0.0.54\n")
+    return path
+
+
+def _messages(problems, severity):
+    return sorted(
+        (p.name, p.rectype, p.message) for p in problems if p.severity == severity
+    )
+
+
+def test_valid_zone(good_zone):
+    assert validate_file("example.com", good_zone) == []
+    assert zone_from_file("example.com", good_zone).validate() == []
+
+
+def test_errors(bad_zone):
+    problems = validate_file("example.com", bad_zone)
+    assert _messages(problems, ERROR) == [
+        (
+            "example.com.",
+            "NS",
+            "'ns2.example.com.' has no address records (A or AAAA)",
+        ),
+        ("example.com.", "NS", "'www.example.com.' is a CNAME (illegal)"),
+        ("www.example.com.", "CNAME", "CNAME and other data (TXT)"),
+    ]
+    # Errors are listed first
+    assert [p.severity for p in problems[:3]] == [ERROR] * 3
+
+
+def test_warnings(bad_zone):
+    problems = validate_file("example.com", bad_zone)
+    assert _messages(problems, WARNING) == [
+        ("dup.example.com.", "A", "duplicate record '10.0.0.5'"),
+        ("example.com.", "MX", "'www.example.com.' is a CNAME (illegal)"),
+        ("example.com.", "SOA", "SOA expire is less than refresh + retry"),
+        ("example.com.", "SOA", "SOA minimum (negative TTL) exceeds 1 day"),
+        ("example.com.", "SOA", "SOA retry is not less than refresh"),
+        ("host.sub.example.com.", "A", "record below a delegation is occluded"),
+        (
+            "mixed.example.com.",
+            "A",
+            "TTL 300 differs from the other records' TTL 3600",
+        ),
+    ]
+
+
+def test_zone_validate_max_ttl(good_zone):
+    zone = zone_from_file("example.com", good_zone)
+    problems = zone.validate(max_ttl=3600)
+    assert all(p.severity == ERROR for p in problems)
+    assert "bar.example.com./A: TTL 86400 exceeds 3600" in [
+        str(p).split(": ", 1)[1] for p in problems
+    ]
+
+
+def test_zone_validate_missing_soa_ns():
+    zone = zone_from_file("example.com", ZONE_FILE, types=["A"])
+    assert _messages(zone.validate(), ERROR) == [
+        ("example.com.", "NS", "zone has no NS records"),
+        ("example.com.", "SOA", "zone has no SOA record"),
+    ]
+
+
+def test_syntax_error(tmp_path):
+    path = str(tmp_path / "example.com")
+    with open(path, "w") as f:
+        f.write("$TTL 300\n@ IN BOGUS 1\n")
+    problems = validate_file("example.com", path)
+    assert len(problems) == 1
+    assert problems[0].severity == ERROR
+    assert "BOGUS" in problems[0].message
+
+
+def test_zone_check_native(good_zone, bad_zone, mocker):
+    call = mocker.patch("dnszone.zone_check.subprocess.call")
+    check = ZoneCheck(engine="native")
+    assert check.isValid("example.com", good_zone)
+    assert check.error is None
+    assert not check.isValid("example.com", bad_zone)
+    assert "is a CNAME (illegal)" in check.error
+    result = check.check("example.com", bad_zone)
+    assert not result.valid
+    assert result.error == check.error
+    assert not call.called
+
+
+def test_singleton_and_out_of_zone(good_zone):
+    with open(good_zone, "a") as f:
+        f.write("alias   IN      CNAME   foo\n")
+        f.write("alias   IN      CNAME   bar\n")
+        f.write("same    IN      CNAME   foo\n")
+        f.write("same    IN      CNAME   foo\n")
+        f.write("ns.elsewhere.net.  IN  A   192.0.2.1\n")
+    problems = validate_file("example.com", good_zone)
+    assert _messages(problems, ERROR) == [
+        ("alias.example.com.", "CNAME", "multiple RRs of singleton type")
+    ]
+    assert _messages(problems, WARNING) == [
+        ("ns.elsewhere.net.", None, "ignoring out-of-zone data"),
+        ("same.example.com.", "CNAME", "duplicate record 'foo.example.com.'"),
+    ]
+    assert not ZoneCheck(engine="native").isValid("example.com", good_zone)